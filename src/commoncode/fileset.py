@@ -8,6 +8,7 @@
 
 import fnmatch
 import os
+import re
 
 from commoncode import fileutils
 from commoncode import paths
@@ -67,7 +68,8 @@ def is_included(path, includes=None, excludes=None):
     first. The `excludes` are tested second if provided.
 
     The ordering of the includes and excludes items does not matter and if a map
-    is empty, it is not used for matching.
+    is empty, it is not used for matching. `includes` and `excludes` can also be
+    precompiled PathMatcher objects.
     """
     if not path or not path.strip():
         return False
@@ -76,9 +78,11 @@ def is_included(path, includes=None, excludes=None):
         return True
 
     includes = includes or {}
-    includes = {k: v for k, v in includes.items() if k}
+    if not isinstance(includes, PathMatcher):
+        includes = {k: v for k, v in includes.items() if k}
     excludes = excludes or {}
-    excludes = {k: v for k, v in excludes.items() if k}
+    if not isinstance(excludes, PathMatcher):
+        excludes = {k: v for k, v in excludes.items() if k}
 
     if includes:
         included = get_matches(path, includes, all_matches=False)
@@ -103,10 +107,14 @@ def get_matches(path, patterns, all_matches=False):
     mappint of {pattern: value or message} if `path` is matched by any of the
     pattern from the `patterns` map or an empty list.
     If `all_matches` is False, stop and return on the first matched pattern.
+    `patterns` can also be a precompiled PathMatcher.
     """
     if not path or not patterns:
         return False
 
+    if isinstance(patterns, PathMatcher):
+        return patterns.get_matches(path, all_matches=all_matches)
+
     path = fileutils.as_posixpath(path).lower()
     pathstripped = path.lstrip("/0")
     if not pathstripped:
@@ -150,6 +158,132 @@ def get_matches(path, patterns, all_matches=False):
     return matches
 
 
+class PathMatcher(object):
+    """
+    Match paths against a set of glob-style patterns that are compiled once.
+
+    The matching semantics are the same as for ``get_matches``, but the patterns
+    are cleaned and compiled only once such that matching a path is done with a
+    few dictionary lookups and precompiled regex matches rather than one
+    ``fnmatch`` call per pattern and per path segment.
+
+    For example::
+    >>> matcher = PathMatcher({'*.so': 'lib', '.git': 'vcs', 'src/*': 'src'})
+    >>> matcher.get_matches('/foo/.git/config')
+    'vcs'
+    >>> matcher.get_matches('src/bar.so', all_matches=True)
+    ['lib', 'src']
+    >>> matcher.get_matches('foo/bar')
+    False
+    """
+
+    # glob wildcards characters
+    GLOB_CHARS = re.compile(r"[*?\[]")
+
+    def __init__(self, patterns):
+        """
+        Initialize a new PathMatcher from a `patterns` mapping of {pattern: value
+        or message} or a list or tuple of patterns.
+        """
+        if not isinstance(patterns, dict):
+            assert isinstance(patterns, (list, tuple)), "Invalid patterns: {}".format(patterns)
+            patterns = {p: p for p in patterns}
+
+        # list of values in the patterns order
+        self.values = []
+        # list of (is_plain, compiled regex) in the patterns order
+        self.regexes = []
+
+        # mapping of {literal segment: lowest pattern index} for plain patterns
+        # without wildcards
+        self.literals = {}
+        plain_globs = []
+        path_globs = []
+
+        for pat, value in patterns.items():
+            if not pat or not pat.strip():
+                continue
+
+            index = len(self.values)
+            self.values.append(value or "")
+
+            pat = pat.lstrip("/").lower()
+            is_plain = "/" not in pat
+            translated = fnmatch.translate(pat)
+            self.regexes.append((is_plain, re.compile(translated)))
+
+            if is_plain and not self.GLOB_CHARS.search(pat):
+                self.literals.setdefault(pat, index)
+            elif is_plain:
+                plain_globs.append(f"(?P<p{index}>{translated})")
+            else:
+                path_globs.append(f"(?P<p{index}>{translated})")
+
+        # combined regex for each kind of patterns: the first alternative that
+        # matches is the one with the lowest pattern index, and its index is the
+        # name of the last matched group
+        self.plain_glob = plain_globs and re.compile("|".join(plain_globs)).match or None
+        self.path_glob = path_globs and re.compile("|".join(path_globs)).match or None
+
+    def __len__(self):
+        return len(self.values)
+
+    def get_matches(self, path, all_matches=False):
+        """
+        Return a list of values (which are values from the matched patterns) if
+        `path` is matched by any of the patterns or an empty list.
+        If `all_matches` is False, stop and return on the first matched pattern
+        value or False.
+        """
+        if not path or not self.values:
+            return False
+
+        path = fileutils.as_posixpath(path).lower()
+        pathstripped = path.lstrip("/0")
+        if not pathstripped:
+            return False
+
+        segments = paths.split(pathstripped)
+
+        if all_matches:
+            matches = []
+            for (is_plain, regex), value in zip(self.regexes, self.values):
+                if is_plain:
+                    matched = any(regex.match(s) for s in segments)
+                else:
+                    matched = regex.match(path) or regex.match(pathstripped)
+                if matched:
+                    matches.append(value)
+            return matches
+
+        # find the lowest matched pattern index, e.g. the first matched pattern
+        matched_indexes = []
+        literals = self.literals
+        if literals:
+            matched_indexes.extend(literals[s] for s in segments if s in literals)
+
+        plain_glob = self.plain_glob
+        if plain_glob:
+            for segment in segments:
+                matched = plain_glob(segment)
+                if matched:
+                    matched_indexes.append(int(matched.lastgroup[1:]))
+
+        path_glob = self.path_glob
+        if path_glob:
+            for candidate in (path, pathstripped):
+                matched = path_glob(candidate)
+                if matched:
+                    matched_indexes.append(int(matched.lastgroup[1:]))
+
+        if TRACE:
+            logger.debug("PathMatcher: matched indexes: %(matched_indexes)r" % locals())
+
+        if matched_indexes:
+            return self.values[min(matched_indexes)]
+        return False
+
+
 def load(location):
     """
     Return a sequence of patterns from a file at location.
@@ -6,9 +6,18 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+import atexit
 import binascii
 import hashlib
+import json
+import mmap
+import os
+import sqlite3
 import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from functools import partial
 
 from commoncode import filetype
@@ -22,9 +31,13 @@ Low level hash functions using standard crypto hashes used to construct hashes
 of various lengths. Hashes that are smaller than 128 bits are based on a
 truncated md5. Other length use SHA hashes.
 
-Checksums are operating on files.
+Checksums are operating on files. Files are read and hashed in chunks such
+that the size of a file does not affect memory use.
 """
 
+# size in bytes of the chunks read from a file to compute checksums
+CHUNK_SIZE = 1024 * 1024
+
 
 def _hash_mod(bitsize, hmodule):
     """
@@ -35,19 +48,41 @@ def _hash_mod(bitsize, hmodule):
     class hasher(object):
         def __init__(self, msg=None):
             self.digest_size = bitsize // 8
-            self.h = msg and hmodule(msg).digest()[: self.digest_size] or None
+            # the underlying hash object, created when first updated with some
+            # content: the hash of an empty content is None
+            self.hashed = None
+            if msg:
+                self.update(msg)
+
+        def update(self, msg):
+            """
+            Update this hash with the `msg` bytes. Calling update() repeatedly
+            is the same as a single call with all the bytes concatenated.
+            """
+            if not msg:
+                return
+            if self.hashed is None:
+                self.hashed = hmodule()
+            self.hashed.update(msg)
+
+        @property
+        def h(self):
+            return self.hashed and self.hashed.digest()[: self.digest_size] or None
 
         def digest(self):
             return bytes(self.h)
 
         def hexdigest(self):
-            return self.h and binascii.hexlify(self.h).decode("utf-8")
+            h = self.h
+            return h and binascii.hexlify(h).decode("utf-8")
 
         def b64digest(self):
-            return self.h and urlsafe_b64encode(self.h).decode("utf-8")
+            h = self.h
+            return h and urlsafe_b64encode(h).decode("utf-8")
 
         def intdigest(self):
-            return self.h and int(bin_to_num(self.h))
+            h = self.h
+            return h and int(bin_to_num(h))
 
     return hasher
 
@@ -75,6 +110,13 @@ _hashmodules_by_bitsize = {
 }
 
 
+class ContentLengthError(ValueError):
+    """
+    Raised when the length of the hashed content is not its expected length,
+    such as when a file size changes while it is hashed.
+    """
+
+
 def get_hasher(bitsize):
     """
     Return a hasher for a given size in bits of the resulting hash.
@@ -85,28 +127,238 @@ def get_hasher(bitsize):
 class sha1_git_hasher(object):
     """
     Hash content using the git blob SHA1 convention.
+
+    The git blob header contains the length of the whole content. If this
+    `length` is provided, the content is hashed as it is updated. Otherwise
+    the content is kept until the digest is computed.
     """
 
-    def __init__(self, msg=None):
+    def __init__(self, msg=None, length=None):
         self.digest_size = 160 // 8
-        self.h = msg and self._compute(msg) or None
-
-    def _compute(self, msg):
+        self.length = length
+        # count of hashed bytes
+        self.hashed_length = 0
+        self.hashed = None
+        # list of bytes kept until the length is known
+        self.pending = []
+        if msg:
+            self.update(msg)
+
+    def update(self, msg):
+        """
+        Update this hash with the `msg` bytes. Calling update() repeatedly
+        is the same as a single call with all the bytes concatenated.
+        """
+        if not msg:
+            return
+        self.hashed_length += len(msg)
+        if self.length is None:
+            # copy, as a chunk may be a memoryview released after this update
+            self.pending.append(bytes(msg))
+            return
+        if self.hashed is None:
+            self.hashed = self._start(self.length)
+        self.hashed.update(msg)
+
+    def _start(self, length):
         # note: bytes interpolation is new in Python 3.5
-        git_blob_msg = b"blob %d\0%s" % (len(msg), msg)
-        return hashlib.sha1(git_blob_msg).digest()
+        return hashlib.sha1(b"blob %d\0" % length)
+
+    @property
+    def h(self):
+        if not self.hashed_length:
+            return
+
+        if self.length is None:
+            hashed = self._start(self.hashed_length)
+            for msg in self.pending:
+                hashed.update(msg)
+            return hashed.digest()
+
+        if self.hashed_length != self.length:
+            raise ContentLengthError(
+                f"sha1_git: hashed {self.hashed_length} bytes "
+                f"rather than the expected {self.length} bytes"
+            )
+        return self.hashed.digest()
 
     def digest(self):
         return bytes(self.h)
 
     def hexdigest(self):
-        return self.h and binascii.hexlify(self.h).decode("utf-8")
+        h = self.h
+        return h and binascii.hexlify(h).decode("utf-8")
 
     def b64digest(self):
-        return self.h and urlsafe_b64encode(self.h).decode("utf-8")
+        h = self.h
+        return h and urlsafe_b64encode(h).decode("utf-8")
 
     def intdigest(self):
-        return self.h and int(bin_to_num(self.h))
+        h = self.h
+        return h and int(bin_to_num(h))
+
+
+def get_file_hasher(name, length=None):
+    """
+    Return a new hasher object for a checksum `name` to update with the
+    content of a file of `length` bytes.
+    """
+    if name == "sha1_git":
+        return sha1_git_hasher(length=length)
+    return _hashmodules_by_name[name]()
+
+
+def iter_chunks(location, chunk_size=CHUNK_SIZE, mmap_threshold=None):
+    """
+    Yield chunks of at most `chunk_size` bytes read from the file at `location`.
+
+    If `mmap_threshold` is provided and the file size is at least
+    `mmap_threshold` bytes, the chunks are memoryview slices of a memory map of
+    this file rather than bytes copied from the file. Each such chunk is
+    released when the next chunk is requested and must not be used afterwards.
+
+    Memory maps are not used by default: if a memory-mapped file is truncated
+    while its chunks are used, the process is killed with a SIGBUS signal
+    rather than getting an exception. Use these only for files that cannot
+    change, such as files of an extracted archive.
+    """
+    with open(location, "rb") as f:
+        mapped = None
+        if mmap_threshold and os.fstat(f.fileno()).st_size >= mmap_threshold:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # such as for a special file that cannot be mapped
+                pass
+
+        if not mapped:
+            yield from iter(partial(f.read, chunk_size), b"")
+            return
+
+        with mapped, memoryview(mapped) as view:
+            for start in range(0, len(view), chunk_size):
+                with view[start : start + chunk_size] as chunk:
+                    yield chunk
+
+
+class ChecksumCache(object):
+    """
+    A persistent cache of file checksums stored in an SQLite database at
+    `location`. The checksums of a file are keyed by its identity as the
+    (st_dev, st_ino) of its stat and are valid only as long as its st_size and
+    st_mtime_ns are unchanged, such that a cache hit does not read the file
+    content. Entries are invalidated and replaced when this metadata changes.
+
+    Writes are batched in transactions and the pending writes are only saved
+    on flush() or close(). Use a cache as a context manager to close it on
+    exit. A cache can be shared by multiple threads.
+    """
+
+    # number of pending writes batched together in a single transaction
+    batch_size = 1000
+
+    def __init__(self, location):
+        self.location = location
+        self.lock = threading.Lock()
+        self.connection = connection = sqlite3.connect(location, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS checksums "
+            "(file_id TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, checksums TEXT NOT NULL)"
+        )
+        connection.commit()
+        # mapping of {file_id: (size, mtime_ns, checksums)} of writes not yet
+        # flushed to the database
+        self.pending = {}
+
+    @staticmethod
+    def get_key(location):
+        """
+        Return a (file_id, size, mtime_ns) cache key tuple for the file at
+        `location`.
+        """
+        stat = os.stat(location)
+        return f"{stat.st_dev}:{stat.st_ino}", stat.st_size, stat.st_mtime_ns
+
+    def _get_entry(self, file_id):
+        entry = self.pending.get(file_id)
+        if entry:
+            return entry
+        query = "SELECT size, mtime_ns, checksums FROM checksums WHERE file_id = ?"
+        row = self.connection.execute(query, (file_id,)).fetchone()
+        if row:
+            size, mtime_ns, checksums = row
+            return size, mtime_ns, json.loads(checksums)
+
+    def get(self, key, names):
+        """
+        Return a mapping of {name: hexdigest} for the cached checksum `names`
+        of a file with a `key` as returned by get_key(). Missing or stale
+        checksums are not returned.
+        """
+        file_id, size, mtime_ns = key
+        with self.lock:
+            entry = self._get_entry(file_id)
+        if not entry or entry[:2] != (size, mtime_ns):
+            return {}
+        checksums = entry[2]
+        return {name: checksums[name] for name in names if name in checksums}
+
+    def put(self, location, key, checksums):
+        """
+        Cache a mapping of {name: hexdigest} `checksums` computed from the
+        content of the file at `location` with a `key` obtained before reading
+        this content. Nothing is cached if the file was modified meanwhile.
+        """
+        if self.get_key(location) != key:
+            return
+        file_id, size, mtime_ns = key
+        with self.lock:
+            entry = self._get_entry(file_id)
+            if entry and entry[:2] == (size, mtime_ns):
+                checksums = dict(entry[2], **checksums)
+            self.pending[file_id] = size, mtime_ns, checksums
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO checksums (file_id, size, mtime_ns, checksums) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (file_id) DO UPDATE SET size = excluded.size, "
+                "mtime_ns = excluded.mtime_ns, checksums = excluded.checksums",
+                [
+                    (file_id, size, mtime_ns, json.dumps(checksums))
+                    for file_id, (size, mtime_ns, checksums) in self.pending.items()
+                ],
+            )
+        self.pending = {}
+
+    def flush(self):
+        """
+        Write all pending checksums to the database in a single transaction.
+        """
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        """
+        Write all pending checksums and close the database.
+        """
+        with self.lock:
+            if self.connection:
+                self._flush()
+                self.connection.close()
+                self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
 
 
 _hashmodules_by_name = {
@@ -119,25 +371,27 @@ _hashmodules_by_name = {
 }
 
 
-def checksum(location, name, base64=False):
+def checksum(location, name, base64=False, mmap_threshold=None, cache=None):
     """
     Return a checksum of `bitsize` length from the content of the file at
     `location`. The checksum is a hexdigest or base64-encoded is `base64` is
-    True.
+    True. A file of `mmap_threshold` bytes or more is hashed from a memory map
+    if `mmap_threshold` is provided. See iter_chunks() for the hazard.
+    Use and update the checksums of an optional ChecksumCache `cache`.
+    See multi_checksums() for the handling of a file that changes.
     """
     if not filetype.is_file(location):
         return
-    hasher = _hashmodules_by_name[name]
-
-    # fixme: we should read in chunks?
-    with open(location, "rb") as f:
-        hashable = f.read()
 
-    hashed = hasher(hashable)
+    hexdigest = multi_checksums(
+        location,
+        checksum_names=(name,),
+        mmap_threshold=mmap_threshold,
+        cache=cache,
+    )[name]
     if base64:
-        return hashed.b64digest()
-
-    return hashed.hexdigest()
+        return hexdigest and urlsafe_b64encode(binascii.unhexlify(hexdigest)).decode("utf-8")
+    return hexdigest
 
 
 def md5(location):
@@ -164,21 +418,230 @@ def sha1_git(location):
     return checksum(location, name="sha1_git", base64=False)
 
 
-def multi_checksums(location, checksum_names=("md5", "sha1", "sha256", "sha512", "sha1_git")):
+# mapping of {threads count: ThreadPoolExecutor} shared by all MultiHasher
+_thread_pools = {}
+
+
+def get_thread_pool(threads):
+    """
+    Return a shared thread pool executor with `threads` worker threads.
+    """
+    pool = _thread_pools.get(threads)
+    if pool is None:
+        pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="commoncode-hash")
+        pool = _thread_pools.setdefault(threads, pool)
+    return pool
+
+
+def shutdown_thread_pools():
+    """
+    Shut down all the shared thread pools. New pools are created when needed
+    afterwards. This is called at exit.
+    """
+    while _thread_pools:
+        _threads, pool = _thread_pools.popitem()
+        pool.shutdown(wait=True)
+
+
+atexit.register(shutdown_thread_pools)
+
+
+class MultiHasher(object):
+    """
+    Compute multiple checksums of the same content at once. Each chunk of
+    content is fed to the hashers of all the checksum `names`. The content has
+    `length` bytes, if known.
+
+    If `threads` is more than one, the hashers are updated in parallel in a
+    shared pool of `threads` threads: hashlib releases the GIL when hashing
+    large chunks such that the cost of computing multiple checksums is close
+    to the cost of the slowest one.
+    """
+
+    def __init__(self, names, length=None, threads=0):
+        self.hashers = [(name, get_file_hasher(name, length=length)) for name in names]
+        self.pool = None
+        if threads > 1 and len(self.hashers) > 1:
+            self.pool = get_thread_pool(threads)
+        # futures of the pending updates running in the pool
+        self.pending = []
+
+    def update(self, chunk):
+        """
+        Update all the hashers with the `chunk` bytes. With threads, return
+        before these updates are completed, such that the next chunk can be
+        read meanwhile, unless `chunk` is a memoryview that may be released
+        once this returns.
+        """
+        if not self.pool:
+            for _name, hashed in self.hashers:
+                hashed.update(chunk)
+            return
+
+        # each hasher is updated with one chunk at a time, in sequence
+        self.wait()
+        submit = self.pool.submit
+        self.pending = [submit(hashed.update, chunk) for _name, hashed in self.hashers]
+        if isinstance(chunk, memoryview):
+            self.wait()
+
+    def wait(self):
+        """
+        Wait for the pending updates to complete.
+        """
+        pending = self.pending
+        if pending:
+            self.pending = []
+            wait(pending)
+            for future in pending:
+                # raise any exception
+                future.result()
+
+    def hexdigests(self):
+        """
+        Return a mapping of {name: hexdigest} for all the hashers.
+        """
+        self.wait()
+        return {name: hashed.hexdigest() for name, hashed in self.hashers}
+
+
+def multi_checksums(
+    location,
+    checksum_names=("md5", "sha1", "sha256", "sha512", "sha1_git"),
+    threads=0,
+    chunk_size=CHUNK_SIZE,
+    mmap_threshold=None,
+    cache=None,
+):
     """
     Return a mapping of hexdigest checksums keyed by checksum name from the content
     of the file at `location`. Use the `checksum_names` list of checksum names.
     The mapping is guaranted to contains all the requested names as keys.
     If the location is not a file, the values are None.
+
+    The file is read once in chunks of `chunk_size` bytes and each chunk is
+    hashed for all the checksums, possibly in parallel using a pool of
+    `threads` threads. See MultiHasher. If `mmap_threshold` is provided, a file
+    of `mmap_threshold` bytes or more is hashed from a memory map instead. See
+    iter_chunks() for the hazard of a file truncated while memory-mapped.
+
+    If a ChecksumCache `cache` is provided, the file is read only for the
+    checksums not found in this cache and these are then added to the cache.
+
+    If the file size changes while it is hashed, the file is hashed once again
+    with its new size. Raise a ContentLengthError if it changes again.
     """
     results = dict([(name, None) for name in checksum_names])
     if not filetype.is_file(location):
         return results
 
-    # fixme: we should read in chunks?
-    with open(location, "rb") as f:
-        hashable = f.read()
-
-    for name in checksum_names:
-        results[name] = _hashmodules_by_name[name](hashable).hexdigest()
+    if cache:
+        key = cache.get_key(location)
+        cached = cache.get(key, checksum_names)
+        results.update(cached)
+        checksum_names = [name for name in checksum_names if name not in cached]
+        if not checksum_names:
+            return results
+        length = key[1]
+    else:
+        length = os.path.getsize(location)
+
+    def hash_content(length):
+        hasher = MultiHasher(
+            names=checksum_names,
+            length=length,
+            threads=threads,
+        )
+        for chunk in iter_chunks(location, chunk_size=chunk_size, mmap_threshold=mmap_threshold):
+            hasher.update(chunk)
+        return hasher.hexdigests()
+
+    try:
+        computed = hash_content(length)
+    except ContentLengthError:
+        # the file size changed since we got its stat: hash it again
+        if cache:
+            key = cache.get_key(location)
+            length = key[1]
+        else:
+            length = os.path.getsize(location)
+        try:
+            computed = hash_content(length)
+        except ContentLengthError as e:
+            raise ContentLengthError(
+                f"The size of {location!r} changed while computing its checksums"
+            ) from e
+
+    if cache:
+        cache.put(location, key, computed)
+    results.update(computed)
     return results
+
+
+def checksums_many(
+    locations,
+    names=("md5", "sha1", "sha256", "sha512", "sha1_git"),
+    workers=4,
+    buffer_size=64 * 1024 * 1024,
+    mmap_threshold=None,
+    cache=None,
+):
+    """
+    Yield a (location, checksums) tuple for each file of a `locations`
+    iterable, in the same order, where checksums is a mapping of {name:
+    hexdigest} for the checksum `names` as returned by multi_checksums().
+
+    If the checksums of a file cannot be computed, checksums is instead the
+    exception raised for this file. The other files are still processed.
+
+    Files are read and hashed in parallel in a pool of `workers` threads such
+    that reading a file overlaps with hashing other files. Each thread reads
+    its file in chunks such that at most `buffer_size` bytes are read at once
+    by all the threads. Only a few more files than `workers` are submitted
+    ahead of the yielded files. If `mmap_threshold` is provided, files of
+    `mmap_threshold` bytes or more are hashed from a memory map and are not
+    read in buffers: see iter_chunks() for the hazard. Files with cached
+    checksums in an optional ChecksumCache `cache` are not read.
+
+    If this generator is closed early, the files not yet started are skipped
+    and only the files being hashed are waited for.
+    """
+    workers = max(workers, 1)
+    chunk_size = max(buffer_size // workers, 64 * 1024)
+    compute = partial(
+        multi_checksums,
+        checksum_names=names,
+        chunk_size=chunk_size,
+        mmap_threshold=mmap_threshold,
+        cache=cache,
+    )
+
+    if workers == 1:
+        for location in locations:
+            try:
+                yield location, compute(location)
+            except Exception as e:
+                yield location, e
+        return
+
+    def get_result(location, future):
+        try:
+            return location, future.result()
+        except Exception as e:
+            return location, e
+
+    max_pending = workers * 2
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="commoncode-hash") as pool:
+        try:
+            for location in locations:
+                pending.append((location, pool.submit(compute, location)))
+                if len(pending) >= max_pending:
+                    yield get_result(*pending.popleft())
+
+            while pending:
+                yield get_result(*pending.popleft())
+        finally:
+            # if closed early, do not wait for the files not yet started
+            for _location, future in pending:
+                future.cancel()
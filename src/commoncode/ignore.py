@@ -23,7 +23,8 @@ def is_ignored(location, ignores, unignores=None, skip_special=True):
     """
     Return a tuple of (pattern , message) if a file at location is ignored
     or False otherwise.
-    `ignores` and `unignores` are mappings of patterns to a reason.
+    `ignores` and `unignores` are mappings of patterns to a reason or
+    precompiled fileset.PathMatcher.
 
     If `skip_special` is True, location is checked and ignored if is considered a special file,
     e.g. symlink, FIFO, device file, etc. and location is required to be an actual location to a
@@ -289,3 +290,7 @@ default_ignores.update(
         ]
     )
 )
+
+# Precompiled matchers for the common ignores to use when walking large trees
+ignores_VCS_matcher = fileset.PathMatcher(ignores_VCS)
+default_ignores_matcher = fileset.PathMatcher(default_ignores)
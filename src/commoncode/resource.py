@@ -6,11 +6,19 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+import heapq
 import json
+import mmap
 import os
+import re
+import sqlite3
 import sys
 import traceback
+from array import array
+from collections import OrderedDict
 from collections import deque
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 from hashlib import md5
 from operator import itemgetter
@@ -24,6 +32,7 @@ from os.path import normpath
 from posixpath import dirname as posixpath_parent
 from posixpath import join as posixpath_join
 from posixpath import normpath as posixpath_normpath
+from weakref import WeakKeyDictionary
 
 import attr
 
@@ -93,7 +102,7 @@ def skip_ignored(location):
     Return True if ``location`` should be skipped.
     Always ignore VCS and some special filetypes.
     """
-    ignored = partial(ignore.is_ignored, ignores=ignore.ignores_VCS)
+    ignored = partial(ignore.is_ignored, ignores=ignore.ignores_VCS_matcher)
 
     if TRACE_DEEP:
         logger_debug()
@@ -150,6 +159,86 @@ def depth_walk(
         yield top, dirs, files
 
 
+def is_ignored_path(location):
+    """
+    Return True if ``location`` should be skipped based only on its path, e.g.
+    without checking the file system. Always ignore VCS files.
+    """
+    return ignore.is_ignored(location, ignores=ignore.ignores_VCS_matcher, skip_special=False)
+
+
+def scandir_walk(
+    root_location,
+    max_depth=0,
+    is_ignored_path=is_ignored_path,
+    error_handler=lambda _error: None,
+):
+    """
+    Yield a (top, dirs, files) tuple at each step of walking the ``root_location``
+    directory recursively up to ``max_depth`` path segments extending from the
+    ``root_location``. This is similar to ``depth_walk`` but is built on
+    ``os.scandir`` and ``dirs`` and ``files`` are lists of ``os.DirEntry``.
+
+    Special files (such as links, FIFOs or devices) and ignored entries are
+    classified using the type data cached in each ``os.DirEntry`` and are not
+    returned. Both ``dirs`` and ``files`` are sorted by lowercase name, then name.
+    Directories are walked top-down, depth-first in this sorted order.
+
+    Arguments:
+
+    - root_location: Absolute, normalized path for the directory to be walked
+    - max_depth: positive integer for fixed depth limit. 0 for no limit.
+    - is_ignored_path: Callback function that takes a location as argument and
+      returns a boolean indicating whether to ignore this location. It should
+      only use the path and not the file system.
+    - error_handler: Error handler callback called with an OSError. No action
+      taken by default.
+    """
+    if max_depth < 0:
+        raise Exception("ERROR: `max_depth` must be a positive integer or 0.")
+
+    if is_special(root_location) or is_ignored_path(root_location):
+        return
+
+    def _sorter(entry):
+        return entry.name.lower(), entry.name
+
+    # stack of (location, depth) of directories to walk
+    stack = [(root_location, 0)]
+    while stack:
+        top, depth = stack.pop()
+        if max_depth and depth >= max_depth:
+            continue
+
+        dirs = []
+        files = []
+        try:
+            with os.scandir(top) as entries:
+                for entry in entries:
+                    # note: these use the cached DirEntry data and do not follow
+                    # links: links and special files are neither dirs nor files
+                    if entry.is_dir(follow_symlinks=False):
+                        kind = dirs
+                    elif entry.is_file(follow_symlinks=False):
+                        kind = files
+                    else:
+                        continue
+
+                    if is_ignored_path(entry.path):
+                        continue
+                    kind.append(entry)
+        except OSError as e:
+            error_handler(e)
+            continue
+
+        dirs.sort(key=_sorter)
+        files.sort(key=_sorter)
+
+        yield top, dirs, files
+
+        stack.extend((d.path, depth + 1) for d in reversed(dirs))
+
+
 @attr.s(slots=True)
 class Header(object):
     """
@@ -203,6 +292,7 @@ class Codebase:
     # control on object attributes
     __slots__ = (
         "max_depth",
+        "with_size",
         "location",
         "has_single_resource",
         "resource_attributes",
@@ -212,11 +302,16 @@ class Codebase:
         "temp_dir",
         "resources_by_path",
         "resources_count",
+        "children_orders",
+        "dirty_parents",
         "paths",
         "max_in_memory",
         "all_in_memory",
         "all_on_disk",
         "cache_dir",
+        "cache_format",
+        "disk_cache",
+        "lru_cache",
         "headers",
         "current_header",
         "codebase_attributes",
@@ -238,6 +333,9 @@ class Codebase:
         max_in_memory=10000,
         max_depth=0,
         paths=tuple(),
+        with_size=False,
+        cache_format="json",
+        lru_cache_size=1000,
         *args,
         **kwargs,
     ):
@@ -271,8 +369,25 @@ class Codebase:
         ``paths`` is an optional list of of path strings that extend from the
         root ``location``. If provided, the codebase will contain only these
         paths.
+
+        ``with_size`` is a flag. If True, the ``size`` of file Resources is
+        collected when walking the ``location`` from the stat data already
+        fetched by the walk. This is off by default as the Resource sizes and
+        the size counts of a codebase are otherwise only set by file info
+        scans.
+
+        ``cache_format`` is the layout of the on-disk cache for Resources that
+        are not kept in memory: either "json" to use one JSON file per Resource,
+        "packed" to use a few append-only segment files or "sqlite" to use a
+        single SQLite database that also stores the paths of the cached
+        Resources. This can also be a ResourceDiskCache sub-class.
+
+        ``lru_cache_size`` is the maximum number of recently used Resources
+        loaded from the on-disk cache to also keep in memory. 0 means that no
+        such cache is used.
         """
         self.max_depth = max_depth
+        self.with_size = with_size
 
         # Resource sub-class to use: Configured with attributes in _populate
         self.resource_class = Resource
@@ -296,7 +411,7 @@ class Codebase:
 
         ########################################################################
         # Set up caching, summary, timing, and error info
-        self._setup_essentials(temp_dir, max_in_memory)
+        self._setup_essentials(temp_dir, max_in_memory, cache_format, lru_cache_size=lru_cache_size)
 
         # finally populate
         self.paths = self._prepare_clean_paths(paths)
@@ -315,7 +430,14 @@ class Codebase:
 
         return sorted(paths, key=_sorter)
 
-    def _setup_essentials(self, temp_dir=temp_dir, max_in_memory=10000):
+    def _setup_essentials(
+        self,
+        temp_dir=temp_dir,
+        max_in_memory=10000,
+        cache_format="json",
+        cache_location=None,
+        lru_cache_size=1000,
+    ):
         """
         Set the remaining Codebase attributes
 
@@ -325,6 +447,15 @@ class Codebase:
         `max_in_memory` is the maximum number of Resource instances to keep in
         memory. Beyond this number, Resource are saved on disk instead. -1 means
         no memory is used and 0 means unlimited memory is used.
+
+        `cache_format` is the on-disk cache layout name, one of the keys of the
+        `resource_disk_caches` mapping, or a ResourceDiskCache sub-class.
+
+        `cache_location` is the optional location of an existing SQLite disk
+        cache database to use.
+
+        `lru_cache_size` is the maximum number of Resources loaded from the
+        disk cache to keep in an LRU cache. 0 means no LRU cache is used.
         """
 
         # setup Resources
@@ -336,6 +467,9 @@ class Codebase:
         # All resources MUST exist there. When cached to disk the value is CACHED_RESOURCE
         self.resources_by_path = {}
         self.resources_count = 0
+        # mapping of {path: Resource} of parent Resources with new children
+        # that are not yet saved. None unless deferring parent writes.
+        self.dirty_parents = None
 
         # setup caching
         ########################################################################
@@ -352,11 +486,43 @@ class Codebase:
         # use only disk
         self.all_on_disk = max_in_memory == -1
 
+        if isinstance(cache_format, type) and issubclass(cache_format, ResourceDiskCache):
+            cache_class = cache_format
+        elif cache_format in resource_disk_caches:
+            cache_class = resource_disk_caches[cache_format]
+        else:
+            raise ValueError(f"Unknown Codebase cache format: {cache_format!r}")
+        self.cache_format = cache_format
+
         # dir where the on-disk cache is stored
         self.cache_dir = None
-        if not self.all_in_memory:
+        self.disk_cache = None
+        if not self.all_in_memory or cache_location:
             # this is unique to this codebase instance
             self.cache_dir = get_codebase_cache_dir(temp_dir=temp_dir)
+            if cache_location:
+                self.disk_cache = SqliteResourceCache(
+                    cache_dir=self.cache_dir,
+                    location=cache_location,
+                )
+            else:
+                self.disk_cache = cache_class(cache_dir=self.cache_dir)
+
+            if self.disk_cache.stores_paths:
+                self.resources_by_path = DiskCacheResourcesByPath(self.disk_cache)
+
+        # LRU cache of Resources loaded from the disk cache
+        self.lru_cache = None
+        if self.disk_cache and lru_cache_size:
+            self.lru_cache = ResourceLRUCache(max_size=lru_cache_size)
+
+        # cache of the sorted children names of Resources, cleared when these
+        # Resources are saved. This is bounded like the number of Resources
+        # kept in memory unless all Resources are in memory.
+        orders_max_size = None
+        if not self.all_in_memory:
+            orders_max_size = max(max_in_memory, 0) + (self.lru_cache and lru_cache_size or 0)
+        self.children_orders = ChildrenOrderCache(max_size=orders_max_size)
 
         # setup extra and misc attributes
         ########################################################################
@@ -382,23 +548,14 @@ class Codebase:
         Return the location where to get/put a Resource in the cache given a
         Resource `path`. Create the directories if requested.
         """
-        if not self.cache_dir:
+        if not self.disk_cache:
             return
 
         if isinstance(path, Resource):
             path = path.path
 
         path = clean_path(path)
-
-        # for the cached file name, we use an md5 of the path to avoid things being too long
-        resid = str(md5(path.encode("utf-8")).hexdigest())
-        cache_sub_dir, cache_file_name = resid[-2:], resid
-
-        parent = join(self.cache_dir, cache_sub_dir)
-        if create_dirs and not exists(parent):
-            create_dir(parent)
-
-        return join(parent, cache_file_name)
+        return self.disk_cache.get_cache_location(path, create_dirs=create_dirs)
 
     def _collect_codebase_attributes(self, *args, **kwargs):
         """
@@ -411,11 +568,10 @@ class Codebase:
         Return a Resource class to use with this Codebase
         """
         # Resource sub-class to use. Configured with plugin attributes if present
-        return attr.make_class(
+        return get_attrs_class(
             name="ScannedResource",
-            attrs=self.resource_attributes or {},
-            slots=True,
-            bases=(Resource,),
+            attributes=self.resource_attributes,
+            base_class=Resource,
         )
 
     # TODO: add populate progress manager!!!
@@ -462,10 +618,16 @@ class Codebase:
             # childless directory
             return
 
-        if self.paths:
-            return self._create_resources_from_paths(root=root, paths=self.paths)
-        else:
-            return self._create_resources_from_root(root=root)
+        # each parent is saved once after all its children are created
+        self.dirty_parents = {}
+        try:
+            if self.paths:
+                self._create_resources_from_paths(root=root, paths=self.paths)
+            else:
+                self._create_resources_from_root(root=root)
+        finally:
+            self._flush_dirty_parents()
+            self.dirty_parents = None
 
     def _create_resources_from_paths(self, root, paths):
         # without paths we iterate the provided paths. We report an error
@@ -541,49 +703,52 @@ class Codebase:
         parents_by_loc = {root.location: root}
 
         def err(_error):
-            """os.walk error handler"""
+            """scandir_walk error handler"""
             self.errors.append(
                 f"ERROR: cannot populate codebase: {_error}\n{traceback.format_exc()}"
             )
 
+        with_size = self.with_size
+
         # Walk over the directory and build the resource tree
-        for top, dirs, files in depth_walk(
+        for top, dirs, files in scandir_walk(
             root_location=root.location,
             max_depth=self.max_depth,
             error_handler=err,
         ):
             parent = parents_by_loc.pop(top)
-            for created in self._create_resources(
-                parent=parent,
-                top=top,
-                dirs=dirs,
-                files=files,
-            ):
-                # on the plain, bare FS, files cannot be parents
-                if not created.is_file:
-                    parents_by_loc[created.location] = created
-
-    def _create_resources(self, parent, top, dirs, files, skip_ignored=skip_ignored):
-        """
-        Create and yield ``files`` and ``dirs`` children Resources of a
-        ``parent`` Resource. These are sorted as: directories then files and by
-        lowercase name, then name.
-        """
-        for names, is_file in [(dirs, False), (files, True)]:
-            names.sort(key=lambda p: (p.lower(), p))
 
-            for name in names:
-                location = join(top, name)
-                if skip_ignored(location):
-                    continue
-                res = self._get_or_create_resource(
-                    name=name,
+            for entry in dirs:
+                created = self._get_or_create_resource(
+                    name=entry.name,
+                    parent=parent,
+                    is_file=False,
+                )
+                if TRACE:
+                    logger_debug("Codebase._create_resources_from_root:", created)
+                # on the plain, bare FS, files cannot be parents
+                parents_by_loc[created.location] = created
+
+            for entry in files:
+                size = 0
+                if with_size:
+                    try:
+                        # this is cached in the DirEntry after the first call
+                        size = entry.stat(follow_symlinks=False).st_size
+                    except OSError as e:
+                        err(e)
+
+                created = self._get_or_create_resource(
+                    name=entry.name,
                     parent=parent,
-                    is_file=is_file,
+                    is_file=True,
+                    size=size,
                 )
                 if TRACE:
-                    logger_debug("Codebase.create_resources:", res)
-                yield res
+                    logger_debug("Codebase._create_resources_from_root:", created)
+
+            # this directory is fully walked: save its parent once
+            self._flush_dirty_parent(parent.path)
 
     def _create_root_resource(self):
         """
@@ -624,9 +789,11 @@ class Codebase:
         parent,
         is_file=False,
         path=None,
+        size=0,
     ):
         """
         Create and return a new codebase Resource with ``path`` and ``location``.
+        Use ``size`` as the new Resource size.
         """
         if not parent:
             raise TypeError(
@@ -668,11 +835,16 @@ class Codebase:
             path=path,
             cache_location=cache_location,
             is_file=is_file,
+            size=size,
         )
         self.resources_count += 1
 
         parent.children_names.append(name)
-        self.save_resource(parent)
+        self._clear_children_order(parent.path)
+        if self.dirty_parents is None:
+            self.save_resource(parent)
+        else:
+            self.dirty_parents[parent.path] = parent
         self.save_resource(child)
         return child
 
@@ -754,17 +926,28 @@ class Codebase:
         Return True if Resource `path` exists in the codebase disk cache.
         """
         path = clean_path(path)
-        if not self._exists_in_memory(path):
-            cache_location = self._get_resource_cache_location(path, create_dirs=False)
-            if cache_location:
-                return exists(cache_location)
+        if not self._exists_in_memory(path) and self.disk_cache:
+            return self.disk_cache.exists(path)
 
     # FIXME: the PATH SHOULD NOT INCLUDE THE ROOT NAME
-    def get_resource(self, path):
+    def get_resource(self, path, copy=True):
         """
         Return the Resource with `path` or None if it does not exists.
         The ``path`` must be relative to the root (and including the root
         name as its first segment).
+
+        If ``copy`` is False, return a ReadOnlyResource view of the Resource
+        instance shared with this codebase rather than a copy.
+        """
+        res = self._get_resource(path, copy=copy)
+        if not copy and res is not None:
+            return ReadOnlyResource(res)
+        return res
+
+    def _get_resource(self, path, copy=True):
+        """
+        Return the Resource with `path` or None as with ``get_resource`` but
+        return the shared Resource instance if ``copy`` is False.
         """
         assert isinstance(path, str), f"Invalid path: {path!r} is not a string."
         path = clean_path(path)
@@ -780,12 +963,18 @@ class Codebase:
         # we use Codebase.CACHED_RESOURCE as a semaphore for existing but only
         # on-disk, non-in-memory resource that we need to load from the disk
         # cache to differentiate from None which means missing
-        res = self.resources_by_path.get(path)
+        dirty_parents = self.dirty_parents
+        if dirty_parents and path in dirty_parents:
+            res = dirty_parents[path]
+        else:
+            res = self.resources_by_path.get(path)
+
         if res is Codebase.CACHED_RESOURCE:
-            res = self._load_resource(path)
+            res = self._load_resource(path, copy=copy)
 
         elif isinstance(res, Resource):
-            res = attr.evolve(res)
+            if copy:
+                res = copy_resource(res)
 
         elif res is None:
             pass
@@ -797,6 +986,58 @@ class Codebase:
             logger_debug("    Resource:", res)
         return res
 
+    def get_resources(self, paths, copy=True):
+        """
+        Return a list of Resources for a sequence of ``paths``, in the same
+        order, with None for a path that does not exists. Resources cached on
+        disk are loaded in bulk.
+
+        If ``copy`` is False, return ReadOnlyResource views of the shared
+        Resource instances as with ``get_resource``.
+        """
+        resources = self._get_resources(paths, copy=copy)
+        if not copy:
+            resources = [res if res is None else ReadOnlyResource(res) for res in resources]
+        return resources
+
+    def _get_resources(self, paths, copy=True):
+        """
+        Return a list of Resources as with ``get_resources`` but return the
+        shared Resource instances if ``copy`` is False.
+        """
+        paths = [clean_path(p) for p in paths]
+        resources_by_path = self.resources_by_path
+        # with a disk cache that stores paths, paths not found in memory may
+        # exist on disk: we avoid checking these one by one
+        in_memory = getattr(resources_by_path, "in_memory", resources_by_path)
+        may_be_on_disk = in_memory is not resources_by_path
+
+        lru_cache = self.lru_cache
+        dirty_parents = self.dirty_parents or {}
+        resources = {}
+        to_load = []
+        for path in paths:
+            res = dirty_parents.get(path) or in_memory.get(path)
+            if isinstance(res, Resource):
+                resources[path] = copy_resource(res) if copy else res
+            elif res is Codebase.CACHED_RESOURCE or (res is None and may_be_on_disk):
+                cached = lru_cache and lru_cache.get(path)
+                if cached:
+                    resources[path] = copy_resource(cached) if copy else cached
+                else:
+                    to_load.append(path)
+
+        if to_load:
+            for path, data in self.disk_cache.load_many(to_load).items():
+                res = self._build_cached_resource(path, data)
+                if lru_cache:
+                    lru_cache.put(path, res)
+                    if copy:
+                        res = copy_resource(res)
+                resources[path] = res
+
+        return [resources.get(path) for path in paths]
+
     def save_resource(self, resource):
         """
         Save the `resource` Resource to cache (in memory or disk).
@@ -804,11 +1045,23 @@ class Codebase:
         if not resource:
             return
 
+        if type(resource) is ReadOnlyResource:
+            resource = resource._resource
+
         path = clean_path(resource.path)
 
         if TRACE:
             logger_debug("  Codebase.save_resource:", resource)
 
+        dirty_parents = self.dirty_parents
+        if dirty_parents and path in dirty_parents:
+            # saved later, once all its children are created
+            dirty_parents[path] = resource
+            return
+
+        # its children names may have been edited
+        self._clear_stale_children_order(resource)
+
         if resource.is_root:
             self.root = resource
             self.resources_by_path[path] = resource
@@ -816,10 +1069,38 @@ class Codebase:
         elif resource.cache_location:
             self._dump_resource(resource)
             self.resources_by_path[path] = Codebase.CACHED_RESOURCE
+            if self.lru_cache:
+                # write-through
+                self.lru_cache.put(path, resource)
 
         else:
             self.resources_by_path[path] = resource
 
+    def _flush_dirty_parent(self, path):
+        """
+        Save the dirty parent Resource with ``path`` if any.
+        """
+        dirty_parents = self.dirty_parents
+        if dirty_parents:
+            parent = dirty_parents.pop(path, None)
+            if parent:
+                self.save_resource(parent)
+
+    def _flush_dirty_parents(self, ancestors_of=None):
+        """
+        Save all the dirty parent Resources, except for the ancestors of
+        ``ancestors_of`` path and this path itself, if provided.
+        """
+        dirty_parents = self.dirty_parents
+        if not dirty_parents:
+            return
+        keep = ()
+        if ancestors_of is not None:
+            keep = set(get_ancestor_paths(ancestors_of, include_self=True))
+        for path in list(dirty_parents):
+            if path not in keep:
+                self.save_resource(dirty_parents.pop(path))
+
     def _dump_resource(self, resource):
         """
         Dump a Resource to the disk cache.
@@ -831,45 +1112,76 @@ class Codebase:
                 "Resource cannot be dumped to disk and is used only" f"in memory: {resource}"
             )
 
-        # TODO: consider messagepack or protobuf for compact/faster processing?
-        with open(cache_location, "w") as cached:
-            cached.write(json.dumps(resource.serialize(), check_circular=False))
+        self.disk_cache.dump(clean_path(resource.path), resource.serialize())
 
-    # TODO: consider adding a small LRU cache in front of this for perf?
-    def _load_resource(self, path):
+    def _load_resource(self, path, copy=True):
         """
-        Return a Resource with ``path`` loaded from the disk cache.
+        Return a Resource with ``path`` loaded from the disk cache, or from the
+        LRU cache of recently used Resources in front of the disk cache.
+        Return the shared LRU-cached Resource if ``copy`` is False.
         """
         path = clean_path(path)
-        cache_location = self._get_resource_cache_location(path, create_dirs=False)
-
-        if TRACE:
-            logger_debug(
-                "    Codebase._load_resource: exists:",
-                exists(cache_location),
-                "cache_location:",
-                cache_location,
-            )
+        lru_cache = self.lru_cache
+        if lru_cache:
+            resource = lru_cache.get(path)
+            if resource is not None:
+                return copy_resource(resource) if copy else resource
 
-        if not exists(cache_location):
-            raise ResourceNotInCache(f"Failed to load Resource: {path} from {cache_location!r}")
+        resource = self._build_cached_resource(path, self.disk_cache.load(path))
+        if lru_cache:
+            lru_cache.put(path, resource)
+            if copy:
+                resource = copy_resource(resource)
+        return resource
 
-        # TODO: consider messagepack or protobuf for compact/faster processing
+    def _build_cached_resource(self, path, data):
+        """
+        Return a Resource with ``path`` built from a ``data`` mapping loaded
+        from the disk cache.
+        """
         try:
-            with open(cache_location, "rb") as cached:
-                # TODO: Use custom json encoder to encode JSON list as a tuple
-                # TODO: Consider using simplejson
-                data = json.load(cached)
-                return self.resource_class(**data)
+            resource_class = self.resource_class
+            if issubclass(resource_class, LazyResource):
+                return resource_class.from_data(**data)
+            return resource_class(**data)
         except Exception as e:
-            with open(cache_location, "rb") as cached:
-                cached_data = cached.read()
             msg = (
-                f"ERROR: failed to load resource from cached location: {cache_location} "
-                "with content:\n\n" + repr(cached_data) + "\n\n" + traceback.format_exc()
+                f"ERROR: failed to load resource: {path} from cache with data:\n\n"
+                + repr(data)
+                + "\n\n"
+                + traceback.format_exc()
             )
             raise Exception(msg) from e
 
+    def _clear_children_order(self, path):
+        """
+        Clear the cached sorted children names of the Resource with ``path``
+        and of its parent, as adding or removing a child may change whether
+        this Resource has children and therefore its sort order.
+        """
+        children_orders = self.children_orders
+        if not children_orders:
+            return
+        children_orders.pop(path)
+        children_orders.pop(posixpath_parent(path))
+
+    def _clear_stale_children_order(self, resource):
+        """
+        Clear the cached sorted children names of a saved ``resource`` and of
+        its parent only if its children names are not those of the cached
+        order, such as when these were edited directly. Adding or removing a
+        child with the codebase clears these already.
+        """
+        children_orders = self.children_orders
+        if not children_orders:
+            return
+        order = children_orders.get(resource.path)
+        if order is None:
+            return
+        children_names = resource.children_names or []
+        if len(order) != len(children_names) or set(order) != set(children_names):
+            self._clear_children_order(resource.path)
+
     def _remove_resource(self, resource):
         """
         Remove the ``resource`` Resource object from this codebase.
@@ -880,6 +1192,9 @@ class Codebase:
 
         # remove from in-memory cache. The disk cache is cleared on exit.
         self.resources_by_path.pop(resource.path, None)
+        self.children_orders.pop(resource.path)
+        if self.lru_cache:
+            self.lru_cache.pop(resource.path)
         if TRACE:
             logger_debug("Codebase._remove_resource:", resource)
 
@@ -908,6 +1223,7 @@ class Codebase:
         if TRACE:
             logger_debug("    parent", parent)
         parent.children_names.remove(resource.name)
+        self._clear_children_order(parent.path)
         parent.save(self)
 
         # remove resource proper
@@ -916,7 +1232,7 @@ class Codebase:
 
         return removed_paths
 
-    def walk(self, topdown=True, skip_root=False, ignored=ignore_nothing):
+    def walk(self, topdown=True, skip_root=False, ignored=ignore_nothing, readonly=False):
         """
         Yield all resources for this Codebase walking its resource tree. Walk
         the tree top-down, depth-first if ``topdown`` is True, otherwise walk
@@ -931,25 +1247,39 @@ class Codebase:
 
         ``ignored`` is a callable that accepts two arguments, ``resource`` and
         ``codebase``, and returns True if ``resource`` should be ignored.
+
+        If ``readonly`` is True, yield ReadOnlyResource views of the Resource
+        instances shared with this codebase rather than copies. This avoids
+        copying each Resource, but a view is still created for each Resource.
+        See ReadOnlyResource.
         """
+        walked = self._walk(
+            topdown=topdown,
+            skip_root=skip_root,
+            ignored=ignored,
+            copy=not readonly,
+        )
+        if readonly:
+            walked = map(ReadOnlyResource, walked)
+        return walked
+
+    def _walk(self, topdown=True, skip_root=False, ignored=ignore_nothing, copy=True):
         root = self.root
 
         if ignored(resource=root, codebase=self):
             return
 
-        # make a copy
-        root = attr.evolve(root)
-
         # include root if no children (e.g. codebase with a single resource)
         if self.has_single_resource or (skip_root and not root.has_children()):
             skip_root = False
 
-        root = attr.evolve(root)
+        if copy:
+            root = copy_resource(root)
+
         if topdown and not skip_root:
             yield root
 
-        for res in root.walk(self, topdown=topdown, ignored=ignored):
-            yield res
+        yield from root._walk(self, topdown=topdown, ignored=ignored, copy=copy)
 
         if not topdown and not skip_root:
             yield root
@@ -1003,21 +1333,192 @@ class Codebase:
         If ``skip_filtered`` is True, resources with ``is_filtered`` set to True are
         not included in counts.
         """
-        # note: we walk bottom up to update things in the proper order
-        # and the walk MUST NOT skip filtered, only the compute
-        for resource in self.walk(topdown=False):
-            try:
-                resource._compute_children_counts(self, skip_filtered)
-            except Exception as e:
-                msg = f"ERROR: cannot compute children counts for: {resource.path}"
-                raise Exception(msg) from e
+        # note: the table MUST NOT skip filtered, only the compute
+        table = self.get_resource_table()
+        table.compute_counts(skip_filtered=skip_filtered)
+        table.save_counts(self)
+
+    def get_resource_table(self):
+        """
+        Return a new ResourceTable columnar representation of the Resources of
+        this codebase.
+        """
+        return ResourceTable.from_codebase(self)
 
     def clear(self):
         """
         Purge the codebase cache(s).
         """
+        if self.disk_cache:
+            self.disk_cache.close()
         delete(self.cache_dir)
 
+    def persist(self, location):
+        """
+        Persist this codebase to a new SQLite database file at ``location``.
+        This database can be reopened later as a Codebase with ``reopen()``.
+        This requires a codebase using the "sqlite" cache format or keeping all
+        its Resources in memory.
+        """
+        disk_cache = self.disk_cache
+        if disk_cache:
+            if not isinstance(disk_cache, SqliteResourceCache):
+                raise TypeError(f"Cannot persist a codebase without an sqlite cache: {self!r}")
+            # the cached Resources are copied as-is, then we add the in-memory
+            # Resources and the codebase data
+            disk_cache.backup(location)
+            in_memory = self.resources_by_path.in_memory
+        else:
+            # all the Resources are in memory
+            if exists(location):
+                delete(location)
+            in_memory = self.resources_by_path
+
+        store = SqliteResourceCache(cache_dir=None, location=location)
+        try:
+            for path, res in in_memory.items():
+                if res is Codebase.CACHED_RESOURCE or res.is_root:
+                    continue
+                data = res.serialize()
+                data["cache_location"] = location
+                store.dump(path, data)
+
+            attributes = self.attributes
+            codebase_data = dict(
+                location=self.location if isinstance(self.location, str) else None,
+                root=self.root.serialize(),
+                resources_count=self.resources_count,
+                resource_schema=get_attributes_schema(self.resource_class, Resource),
+                codebase_schema=get_attributes_schema(type(attributes), _CodebaseAttributes),
+                attributes=attributes.to_dict(),
+                headers=self.get_headers(),
+                counters=self.counters,
+                timings=self.timings,
+                errors=self.errors,
+            )
+            for name in ("has_single_resource", "is_file", "max_depth", "paths", "with_info"):
+                codebase_data[name] = getattr(self, name, None)
+
+            store.set_metadata("codebase", codebase_data)
+        finally:
+            store.close()
+
+        return location
+
+    @classmethod
+    def reopen(cls, location, temp_dir=temp_dir, max_in_memory=10000, lru_cache_size=1000):
+        """
+        Return a new codebase reopened from a SQLite database file at
+        ``location`` created with ``persist()``. Existing Resources are loaded
+        from this database only when used. See the class for other arguments.
+        """
+        codebase = cls.__new__(cls)
+        codebase._setup_essentials(
+            temp_dir=temp_dir,
+            max_in_memory=max_in_memory,
+            cache_format="sqlite",
+            cache_location=location,
+            lru_cache_size=lru_cache_size,
+        )
+        codebase_data = codebase.disk_cache.get_metadata("codebase")
+        if not codebase_data:
+            raise Exception(f"Not a persisted codebase: {location!r}")
+
+        codebase.location = codebase_data["location"]
+        for name in ("has_single_resource", "is_file", "max_depth", "paths", "with_info"):
+            value = codebase_data.get(name)
+            # skip the attributes of another codebase class, such as the
+            # "with_info" of a VirtualCodebase reopened as a Codebase
+            if value is not None and hasattr(cls, name):
+                setattr(codebase, name, value)
+
+        codebase.resource_attributes = build_attributes_from_schema(
+            codebase_data["resource_schema"]
+        )
+        codebase.resource_class = Codebase._build_resource_class(codebase)
+
+        codebase.codebase_attributes = build_attributes_from_schema(
+            codebase_data["codebase_schema"]
+        )
+        cbac = _CodebaseAttributes.from_attributes(attributes=codebase.codebase_attributes)
+        codebase.attributes = cbac(**codebase_data["attributes"])
+
+        codebase.headers = [Header.from_dict(**hle) for hle in codebase_data["headers"]]
+        codebase.counters = codebase_data["counters"]
+        codebase.timings = codebase_data["timings"]
+        codebase.errors = codebase_data["errors"]
+
+        root = codebase.resource_class(**codebase_data["root"])
+        codebase.resources_by_path[root.path] = root
+        codebase.root = root
+        codebase.resources_count = codebase_data["resources_count"]
+        return codebase
+
+    def write_jsonl(
+        self,
+        output,
+        with_timing=False,
+        with_info=False,
+        skinny=False,
+        full_root=False,
+        strip_root=False,
+        skip_root=False,
+    ):
+        """
+        Write this codebase as a JSON Lines scan to ``output``, either a file
+        location or a file-like object open for writing text. The first line
+        is a mapping of the headers and codebase attributes. Each other line is
+        the mapping of a Resource as returned by ``Resource.to_dict()`` called
+        with the ``with_timing``, ``with_info``, ``skinny``, ``full_root`` and
+        ``strip_root`` flags. Resources are written in walk order, skipping the
+        root if ``skip_root`` is True.
+
+        The first line also has a "resource_schema" mapping of {name: kind} of
+        the Resource mappings attributes such that a VirtualCodebase can load
+        this scan without inferring this schema from all the Resources.
+
+        The Resources are written one at a time: a scan can be appended to
+        with more Resources and can be loaded back in a VirtualCodebase.
+        """
+        if isinstance(output, str):
+            with open(output, "w") as out:
+                return self.write_jsonl(
+                    out,
+                    with_timing=with_timing,
+                    with_info=with_info,
+                    skinny=skinny,
+                    full_root=full_root,
+                    strip_root=strip_root,
+                    skip_root=skip_root,
+                )
+
+        to_dict = partial(
+            self.resource_class.to_dict,
+            with_timing=with_timing,
+            with_info=with_info,
+            skinny=skinny,
+            full_root=full_root,
+            strip_root=strip_root,
+        )
+
+        header = dict(headers=[header.to_dict() for header in self.headers])
+        if self.attributes:
+            header.update(self.attributes.to_dict())
+        # use the kinds of the attributes defaults rather than of the root values
+        kinds = get_attributes_schema(self.resource_class, Resource)
+        schema = {
+            name: kinds.get(name) or get_value_kind(value)
+            for name, value in to_dict(self.root).items()
+        }
+        header["resource_schema"] = schema
+        output.write(json.dumps(header))
+        output.write("\n")
+
+        for resource in self._walk(skip_root=skip_root, copy=False):
+            data = to_dict(resource)
+            output.write(json.dumps(data))
+            output.write("\n")
+
     def lowest_common_parent(self):
         """
         Return a Resource that is the lowest common parent (aka. lowest common
@@ -1333,7 +1834,7 @@ class Resource(object):
 
         return files_count, dirs_count, size_count
 
-    def walk(self, codebase, topdown=True, ignored=ignore_nothing):
+    def walk(self, codebase, topdown=True, ignored=ignore_nothing, readonly=False):
         """
         Yield all descendant Resources of this Resource. Does not include self.
 
@@ -1345,24 +1846,40 @@ class Resource(object):
 
         `ignored` is a callable that accepts two arguments, `resource` and `codebase`,
         and returns True if `resource` should be ignored.
-        """
 
-        for child in self.children(codebase):
-            if not ignored(child, codebase):
-                child = attr.evolve(child)
+        If `readonly` is True, yield ReadOnlyResource views of the shared
+        Resources as with Codebase.walk().
+        """
+        walked = self._walk(codebase, topdown=topdown, ignored=ignored, copy=not readonly)
+        if readonly:
+            walked = map(ReadOnlyResource, walked)
+        return walked
+
+    def _walk(self, codebase, topdown=True, ignored=ignore_nothing, copy=True):
+        # Iterative depth-first walk using an explicit stack of (resource,
+        # iterator of its sorted children) such that `ignored` is called once
+        # for each resource and ignored subtrees are never visited.
+        stack = [(self, iter(self._children(codebase, copy=copy)))]
+        while stack:
+            parent, children = stack[-1]
+            for child in children:
+                if ignored(child, codebase):
+                    continue
+
                 if topdown:
                     yield child
 
-                for subchild in child.walk(
-                    codebase=codebase,
-                    topdown=topdown,
-                    ignored=ignored,
-                ):
-                    if not ignored(subchild, codebase):
-                        yield subchild
+                if child.children_names:
+                    # walk this child's children before the next sibling
+                    stack.append((child, iter(child._children(codebase, copy=copy))))
+                    break
 
                 if not topdown:
                     yield child
+            else:
+                stack.pop()
+                if not topdown and stack:
+                    yield parent
 
     def has_children(self):
         """
@@ -1370,32 +1887,60 @@ class Resource(object):
         """
         return bool(self.children_names)
 
-    def children(self, codebase, names=()):
+    def children(self, codebase, names=(), copy=True):
         """
         Return a sorted sequence of direct children Resource objects for this
         Resource or an empty sequence.
 
         Sorting is by resources without children, then resource with children
         (e.g. directories or files with children), then case-insentive name.
+
+        If `copy` is False, return ReadOnlyResource views of the shared
+        Resources as with Codebase.get_resource().
+        """
+        children = self._children(codebase, names=names, copy=copy)
+        if not copy:
+            children = [ReadOnlyResource(child) for child in children]
+        return children
+
+    def _children(self, codebase, names=(), copy=True):
+        """
+        Return a sorted sequence of direct children Resources as with
+        ``children`` but return the shared Resources if `copy` is False.
         """
         children_names = self.children_names or []
         if not children_names:
             return []
 
-        if names:
-            kids = set(children_names)
-            children_names = [n for n in names if n in kids]
-            if not children_names:
-                return []
-
         child_path = partial(posixpath_join, self.path)
-        get_child = codebase.get_resource
-        children = [get_child(path=child_path(name)) for name in children_names]
+
+        # use the cached order of children names if available
+        children_order = codebase.children_orders.get(self.path)
+        if children_order is not None:
+            if names:
+                kids = set(names)
+                children_order = [n for n in children_order if n in kids]
+            children = codebase._get_resources(
+                (child_path(name) for name in children_order),
+                copy=copy,
+            )
+            return [c for c in children if c]
+
+        children = codebase._get_resources(
+            (child_path(name) for name in children_names),
+            copy=copy,
+        )
 
         def _sorter(r):
             return (r.has_children(), r.name.lower(), r.name)
 
-        return sorted((c for c in children if c), key=_sorter)
+        children = sorted((c for c in children if c), key=_sorter)
+        codebase.children_orders.put(self.path, [c.name for c in children])
+
+        if names:
+            kids = set(names)
+            children = [c for c in children if c.name in kids]
+        return children
 
     def has_parent(self):
         """
@@ -1545,55 +2090,1410 @@ class Resource(object):
         return serializable
 
 
-def clean_path(path):
-    """
-    Return a cleaned and normalized POSIX ``path``.
-    """
-    path = path or ""
-    # convert to posix and ensure we have no slash at both ends
-    path = posixpath_normpath(path.replace("\\", "/").strip("/"))
-    if path == ".":
-        path = ""
-    return path
-
-
-def strip_first_path_segment(path):
+class LazyResource(Resource):
     """
-    Return a POSIX ``path`` stripped from its first path segment unless there is
-    only one segment in which case we return this segment. The returned path has
-    no leading and trailing slashes.
+    A Resource whose scanned attributes are decoded from the ``raw_data`` JSON
+    text of its file data in a scan file only when one of these is first
+    accessed. The scanned attributes are built with ``build_lazy_attribute()``
+    in a subclass.
 
-    For example::
-        >>> strip_first_path_segment('')
-        ''
-        >>> strip_first_path_segment('foo')
-        ''
-        >>> strip_first_path_segment('foo/bar/baz')
-        'bar/baz'
-        >>> strip_first_path_segment('/foo/bar/baz/')
-        'bar/baz'
-        >>> strip_first_path_segment('foo/')
-        ''
+    Create a LazyResource from a data mapping with ``from_data()`` and copy it
+    with ``copy_resource()``: the copy shares the raw data not yet decoded.
     """
-    path = clean_path(path)
-    if "/" in path:
-        _root, _, path = path.partition("/")
-        return path
-    else:
-        return ""
 
+    __slots__ = ("raw_data",)
 
-def get_codebase_cache_dir(temp_dir):
-    """
-    Return a new, created and unique per-run cache storage directory path rooted
-    at the `temp_dir` base temp directory in the OS-preferred representation
-    (either bytes on Linux and Unicode elsewhere).
-    """
-    from commoncode.fileutils import get_temp_dir
-    from commoncode.timeutils import time2tstamp
+    def __getattr__(self, name):
+        # only called for an unset slot or a missing attribute
+        lazy_attribute = get_lazy_attributes(type(self)).get(name)
+        if not lazy_attribute:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
 
-    prefix = "scancode-codebase-" + time2tstamp() + "-"
-    return get_temp_dir(base_dir=temp_dir, prefix=prefix)
+        self.decode_raw_data()
+        kind, slot = lazy_attribute
+        try:
+            return slot.__get__(self)
+        except AttributeError:
+            value = get_kind_default(kind)
+        # set the slot directly, such as for a read-only Resource
+        slot.__set__(self, value)
+        return value
+
+    def get_raw_data(self):
+        """
+        Return the JSON text of the file data of this Resource not yet decoded
+        or None.
+        """
+        try:
+            return LazyResource.raw_data.__get__(self)
+        except AttributeError:
+            return None
+
+    def decode_raw_data(self):
+        """
+        Decode the raw data of this Resource once and set the scanned
+        attributes that are not yet set.
+        """
+        raw_data = self.get_raw_data()
+        if not raw_data:
+            return
+        LazyResource.raw_data.__set__(self, None)
+        data = json.loads(raw_data)
+        for name, (_kind, slot) in get_lazy_attributes(type(self)).items():
+            if name not in data:
+                continue
+            try:
+                slot.__get__(self)
+            except AttributeError:
+                slot.__set__(self, data[name])
+
+    def get_set_attributes(self):
+        """
+        Return a mapping of {name: value} of the scanned attributes already
+        set.
+        """
+        values = {}
+        for name, (_kind, slot) in get_lazy_attributes(type(self)).items():
+            try:
+                values[name] = slot.__get__(self)
+            except AttributeError:
+                pass
+        return values
+
+    @classmethod
+    def from_data(cls, raw_data=None, **data):
+        """
+        Return a new Resource built from a ``data`` mapping of attributes and
+        an optional ``raw_data`` JSON text of file data decoded when used.
+        """
+        lazy_attributes = get_lazy_attributes(cls)
+        values = {}
+        for name in list(data):
+            if name in lazy_attributes:
+                values[name] = data.pop(name)
+        resource = cls(**data)
+        resource.set_lazy_data(values, raw_data)
+        return resource
+
+    def set_lazy_data(self, values, raw_data=None):
+        """
+        Set the scanned attributes of this Resource from a ``values`` mapping
+        of {name: value} and an optional ``raw_data`` JSON text.
+        """
+        lazy_attributes = get_lazy_attributes(type(self))
+        for name, value in values.items():
+            lazy_attributes[name][1].__set__(self, value)
+        if raw_data:
+            LazyResource.raw_data.__set__(self, raw_data)
+
+    def copy(self):
+        """
+        Return a new copy of this Resource that shares its attribute values and
+        its raw data not yet decoded.
+        """
+        copied = attr.evolve(self)
+        copied.set_lazy_data(self.get_set_attributes(), self.get_raw_data())
+        return copied
+
+    def serialize(self):
+        """
+        Return a mapping of representing this Resource and its data in a form
+        that is fully serializable and can be used to reconstruct a Resource
+        with ``from_data()``. The raw data is not decoded.
+        """
+        lazy_attributes = get_lazy_attributes(type(self))
+        serializable = {}
+        for field in attr.fields(type(self)):
+            name = field.name
+            if name not in lazy_attributes:
+                serializable[name] = getattr(self, name)
+        serializable.update(self.get_set_attributes())
+        raw_data = self.get_raw_data()
+        if raw_data:
+            serializable["raw_data"] = raw_data
+        if self.location:
+            serializable["location"] = self.location
+        if self.cache_location:
+            serializable["cache_location"] = self.cache_location
+        return serializable
+
+
+def copy_resource(resource):
+    """
+    Return a new copy of a ``resource`` Resource. The copy shares the
+    attribute values of the ``resource``.
+    """
+    if isinstance(resource, LazyResource):
+        return resource.copy()
+    return attr.evolve(resource)
+
+
+class ResourceTable(object):
+    """
+    A columnar table of the Resources of a Codebase. Each Resource has an
+    integer id which is an index in parallel arrays of the Resource parent id,
+    is_file, is_filtered, size, files_count, dirs_count and size_count. The
+    ids are assigned in top-down walk order, such that the id of a parent is
+    always smaller than the ids of its children.
+
+    Resource objects are not kept in the table: these are fetched from the
+    Codebase by path on demand.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.parents = array("q")
+        self.is_files = array("b")
+        self.is_filtereds = array("b")
+        self.sizes = array("q")
+        self.files_counts = array("q")
+        self.dirs_counts = array("q")
+        self.size_counts = array("q")
+        # ids of Resources with counts changed by compute_counts()
+        self.changed_counts = []
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def from_codebase(cls, codebase):
+        """
+        Return a new ResourceTable built from a ``codebase`` Codebase.
+        """
+        table = cls()
+        paths = table.paths
+        add_path = paths.append
+        add_parent = table.parents.append
+        add_is_file = table.is_files.append
+        add_is_filtered = table.is_filtereds.append
+        add_size = table.sizes.append
+        add_files_count = table.files_counts.append
+        add_dirs_count = table.dirs_counts.append
+        add_size_count = table.size_counts.append
+
+        ids_by_path = {}
+        for resource in codebase._walk(topdown=True, copy=False):
+            path = resource.path
+            ids_by_path[path] = len(paths)
+            add_path(path)
+            add_parent(-1 if resource.is_root else ids_by_path[posixpath_parent(path)])
+            add_is_file(resource.is_file)
+            add_is_filtered(resource.is_filtered)
+            add_size(resource.size or 0)
+            # use -1 for unset counts such that these are always updated
+            files_count = resource.files_count
+            dirs_count = resource.dirs_count
+            size_count = resource.size_count
+            add_files_count(-1 if files_count is None else files_count)
+            add_dirs_count(-1 if dirs_count is None else dirs_count)
+            add_size_count(-1 if size_count is None else size_count)
+        return table
+
+    def get_resource(self, codebase, rid):
+        """
+        Return the Resource with ``rid`` id from ``codebase``.
+        """
+        return codebase.get_resource(self.paths[rid])
+
+    def compute_counts(self, skip_filtered=False):
+        """
+        Compute the files_count, dirs_count and size_count of every Resource in
+        this table from its descendants in a single bottom-up pass over the
+        arrays. Return a list of the ids whose counts changed.
+
+        If `skip_filtered` is True, resources with the `is_filtered` flag set to
+        True are not included in counts.
+        """
+        count = len(self.paths)
+        parents = self.parents
+        is_files = self.is_files
+        is_filtereds = self.is_filtereds
+        sizes = self.sizes
+        files_counts = array("q", bytes(8 * count))
+        dirs_counts = array("q", bytes(8 * count))
+        size_counts = array("q", bytes(8 * count))
+
+        # children always have a larger id than their parent: iterating ids
+        # in reverse accumulates all descendants before their ancestors
+        for rid in range(count - 1, 0, -1):
+            pid = parents[rid]
+            files_counts[pid] += files_counts[rid]
+            dirs_counts[pid] += dirs_counts[rid]
+            size_counts[pid] += size_counts[rid]
+
+            if skip_filtered and is_filtereds[rid]:
+                continue
+
+            if is_files[rid]:
+                files_counts[pid] += 1
+            else:
+                dirs_counts[pid] += 1
+            size_counts[pid] += sizes[rid]
+
+        changed = [
+            rid
+            for rid in range(count)
+            if files_counts[rid] != self.files_counts[rid]
+            or dirs_counts[rid] != self.dirs_counts[rid]
+            or size_counts[rid] != self.size_counts[rid]
+        ]
+        self.files_counts = files_counts
+        self.dirs_counts = dirs_counts
+        self.size_counts = size_counts
+        self.changed_counts = changed
+        return changed
+
+    def save_counts(self, codebase):
+        """
+        Update and save the Resources of ``codebase`` whose counts were changed
+        by the last compute_counts().
+        """
+        for rid in self.changed_counts:
+            resource = self.get_resource(codebase, rid)
+            try:
+                resource.files_count = self.files_counts[rid]
+                resource.dirs_count = self.dirs_counts[rid]
+                resource.size_count = self.size_counts[rid]
+                resource.save(codebase)
+            except Exception as e:
+                msg = f"ERROR: cannot compute children counts for: {resource.path}"
+                raise Exception(msg) from e
+
+
+def clean_path(path):
+    """
+    Return a cleaned and normalized POSIX ``path``.
+    """
+    path = path or ""
+    # convert to posix and ensure we have no slash at both ends
+    path = posixpath_normpath(path.replace("\\", "/").strip("/"))
+    if path == ".":
+        path = ""
+    return path
+
+
+def strip_first_path_segment(path):
+    """
+    Return a POSIX ``path`` stripped from its first path segment unless there is
+    only one segment in which case we return this segment. The returned path has
+    no leading and trailing slashes.
+
+    For example::
+        >>> strip_first_path_segment('')
+        ''
+        >>> strip_first_path_segment('foo')
+        ''
+        >>> strip_first_path_segment('foo/bar/baz')
+        'bar/baz'
+        >>> strip_first_path_segment('/foo/bar/baz/')
+        'bar/baz'
+        >>> strip_first_path_segment('foo/')
+        ''
+    """
+    path = clean_path(path)
+    if "/" in path:
+        _root, _, path = path.partition("/")
+        return path
+    else:
+        return ""
+
+
+class ReadOnlyResource(object):
+    """
+    A read-only view of a Resource shared with a codebase, such as returned by
+    ``Codebase.get_resource(path, copy=False)``. The attributes and methods
+    are those of the viewed Resource, but setting or deleting an attribute
+    raises an attr.exceptions.FrozenInstanceError. This view stays read-only as
+    long as it is kept.
+
+    Note that attribute values are not copied: mutable values such as lists
+    and mappings must not be modified in place. Use a copy of the Resource to
+    modify it.
+
+    Note also that a small view object is still created for each Resource and
+    that each attribute access is forwarded to the viewed Resource. A view
+    avoids copying the attribute values of a Resource, but reading many
+    attributes of a view is slower than reading them from a Resource.
+    """
+
+    __slots__ = ("_resource",)
+
+    def __init__(self, resource):
+        object.__setattr__(self, "_resource", resource)
+
+    @property
+    def __class__(self):
+        # this view is an instance of the viewed Resource class, such that
+        # isinstance() and the attr functions work the same on both
+        return self._resource.__class__
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+    def __setattr__(self, name, value):
+        raise attr.exceptions.FrozenInstanceError()
+
+    def __delattr__(self, name):
+        raise attr.exceptions.FrozenInstanceError()
+
+    def __eq__(self, other):
+        return self._resource == other
+
+    def __ne__(self, other):
+        return self._resource != other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self._resource)
+
+
+def get_codebase_cache_dir(temp_dir):
+    """
+    Return a new, created and unique per-run cache storage directory path rooted
+    at the `temp_dir` base temp directory in the OS-preferred representation
+    (either bytes on Linux and Unicode elsewhere).
+    """
+    from commoncode.fileutils import get_temp_dir
+    from commoncode.timeutils import time2tstamp
+
+    prefix = "scancode-codebase-" + time2tstamp() + "-"
+    return get_temp_dir(base_dir=temp_dir, prefix=prefix)
+
+
+class ResourceLRUCache(object):
+    """
+    A size-bounded LRU cache of Resource objects keyed by path, with counters
+    of cache hits and misses.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.resources = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.resources)
+
+    def __bool__(self):
+        # an empty cache is still a cache
+        return True
+
+    def get(self, path):
+        """
+        Return the Resource with ``path`` or None.
+        """
+        resource = self.resources.get(path)
+        if resource is None:
+            self.misses += 1
+        else:
+            self.resources.move_to_end(path)
+            self.hits += 1
+        return resource
+
+    def put(self, path, resource):
+        """
+        Add or replace the ``resource`` Resource with ``path`` and evict the
+        least recently used Resource if the cache is full.
+        """
+        resources = self.resources
+        resources[path] = resource
+        resources.move_to_end(path)
+        if len(resources) > self.max_size:
+            resources.popitem(last=False)
+
+    def pop(self, path):
+        """
+        Remove the Resource with ``path`` from this cache if present.
+        """
+        self.resources.pop(path, None)
+
+
+class ChildrenOrderCache(object):
+    """
+    A cache of the sorted children names of Resources keyed by path, bounded
+    to the ``max_size`` most recently used entries unless ``max_size`` is
+    None. Nothing is cached if ``max_size`` is 0.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.orders = OrderedDict()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def get(self, path):
+        """
+        Return the list of sorted children names of the Resource with
+        ``path`` or None.
+        """
+        order = self.orders.get(path)
+        if order is not None and self.max_size is not None:
+            self.orders.move_to_end(path)
+        return order
+
+    def put(self, path, order):
+        """
+        Add or replace the ``order`` list of sorted children names of the
+        Resource with ``path`` and evict the least recently used entry if the
+        cache is full.
+        """
+        max_size = self.max_size
+        if max_size == 0:
+            return
+        orders = self.orders
+        orders[path] = order
+        if max_size is not None:
+            orders.move_to_end(path)
+            if len(orders) > max_size:
+                orders.popitem(last=False)
+
+    def pop(self, path):
+        """
+        Remove the sorted children names of the Resource with ``path`` if
+        present.
+        """
+        self.orders.pop(path, None)
+
+
+class ResourceDiskCache(object):
+    """
+    Base class for an on-disk cache of the serialized data of Resources that are
+    not kept in memory. Resource data are mappings keyed by Resource path.
+    Subclasses implement a storage layout in the ``cache_dir`` directory.
+    """
+
+    # True if this cache can also store the paths of the Resources it contains
+    # such that they do not need to be kept in memory.
+    stores_paths = False
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def get_cache_location(self, path, create_dirs=False):
+        """
+        Return the location where the Resource with ``path`` is cached. Create
+        the directories if requested.
+        """
+        return self.cache_dir
+
+    def exists(self, path):
+        """
+        Return True if a Resource with ``path`` exists in this cache.
+        """
+        raise NotImplementedError
+
+    def dump(self, path, data):
+        """
+        Save a Resource ``data`` mapping with ``path`` in this cache.
+        """
+        raise NotImplementedError
+
+    def load(self, path):
+        """
+        Return a Resource data mapping for ``path`` loaded from this cache.
+        Raise a ResourceNotInCache exception if it does not exist.
+        """
+        raise NotImplementedError
+
+    def load_many(self, paths):
+        """
+        Return a mapping of {path: Resource data} for the Resources of a
+        sequence of ``paths`` that exist in this cache.
+        """
+        return {path: self.load(path) for path in paths if self.exists(path)}
+
+    def close(self):
+        """
+        Close and release any resource used by this cache.
+        """
+        pass
+
+
+class JsonResourceCache(ResourceDiskCache):
+    """
+    Cache each Resource in its own JSON file in a sharded directory tree.
+    """
+
+    def get_cache_location(self, path, create_dirs=False):
+        # for the cached file name, we use an md5 of the path to avoid things being too long
+        resid = str(md5(path.encode("utf-8")).hexdigest())
+        cache_sub_dir, cache_file_name = resid[-2:], resid
+
+        parent = join(self.cache_dir, cache_sub_dir)
+        if create_dirs and not exists(parent):
+            create_dir(parent)
+
+        return join(parent, cache_file_name)
+
+    def exists(self, path):
+        return exists(self.get_cache_location(path))
+
+    def dump(self, path, data):
+        cache_location = self.get_cache_location(path, create_dirs=True)
+        # TODO: consider messagepack or protobuf for compact/faster processing?
+        with open(cache_location, "w") as cached:
+            cached.write(json.dumps(data, check_circular=False))
+
+    def load(self, path):
+        cache_location = self.get_cache_location(path)
+
+        if TRACE:
+            logger_debug(
+                "    JsonResourceCache.load: exists:",
+                exists(cache_location),
+                "cache_location:",
+                cache_location,
+            )
+
+        if not exists(cache_location):
+            raise ResourceNotInCache(f"Failed to load Resource: {path} from {cache_location!r}")
+
+        # TODO: consider messagepack or protobuf for compact/faster processing
+        try:
+            with open(cache_location, "rb") as cached:
+                # TODO: Use custom json encoder to encode JSON list as a tuple
+                # TODO: Consider using simplejson
+                return json.load(cached)
+        except Exception as e:
+            with open(cache_location, "rb") as cached:
+                cached_data = cached.read()
+            msg = (
+                f"ERROR: failed to load resource from cached location: {cache_location} "
+                "with content:\n\n" + repr(cached_data) + "\n\n" + traceback.format_exc()
+            )
+            raise Exception(msg) from e
+
+
+class PackedResourceCache(ResourceDiskCache):
+    """
+    Cache Resources as JSON records appended to a few large segment files
+    with an in-memory index of {path: (segment id, offset, length)}. Records
+    are read back through a read-only mmap of their segment file.
+
+    Saving again an existing Resource appends a new record and the previous
+    record becomes stale. The segments are compacted when the stale records use
+    more space than the live records.
+    """
+
+    # start a new segment file beyond this size in bytes
+    max_segment_size = 256 * 1024 * 1024
+
+    # compact the segments if the stale records are bigger than this size in bytes
+    # and bigger than the live records.
+    min_compact_size = 16 * 1024 * 1024
+
+    def __init__(self, cache_dir):
+        super().__init__(cache_dir)
+        # mapping of {path: (segment id, offset, length)}
+        self.index = {}
+        # mapping of {segment id: mmap} for the segments being read
+        self.mmaps = {}
+        # the last segment id, and its file object and size, used for writes
+        self.segment_id = -1
+        self.writer = None
+        self.writer_size = 0
+        # total size of current and stale records
+        self.live_size = 0
+        self.stale_size = 0
+
+    def get_segment_location(self, segment_id):
+        return join(self.cache_dir, f"segment-{segment_id:06d}.pack")
+
+    def _new_segment(self):
+        """
+        Close the current writable segment and start a new one.
+        """
+        if self.writer:
+            self.writer.close()
+        self.segment_id += 1
+        self.writer = open(self.get_segment_location(self.segment_id), "wb")
+        self.writer_size = 0
+
+    def _append(self, path, record):
+        """
+        Append a ``record`` bytes for ``path`` to the current segment and index it.
+        """
+        if not self.writer or self.writer_size >= self.max_segment_size:
+            self._new_segment()
+
+        length = len(record)
+        self.writer.write(record)
+        self.index[path] = self.segment_id, self.writer_size, length
+        self.writer_size += length
+        self.live_size += length
+
+    def _read(self, segment_id, offset, length):
+        """
+        Return a record bytes read from a segment.
+        """
+        end = offset + length
+        if segment_id == self.segment_id:
+            self.writer.flush()
+
+        segment = self.mmaps.get(segment_id)
+        if segment is None or len(segment) < end:
+            # (re)map: the current segment may have grown since last mapped
+            if segment is not None:
+                segment.close()
+            with open(self.get_segment_location(segment_id), "rb") as seg:
+                segment = mmap.mmap(seg.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mmaps[segment_id] = segment
+
+        return segment[offset:end]
+
+    def exists(self, path):
+        return path in self.index
+
+    def dump(self, path, data):
+        record = json.dumps(data, check_circular=False).encode("utf-8")
+        existing = self.index.get(path)
+        if existing:
+            stale = existing[2]
+            self.live_size -= stale
+            self.stale_size += stale
+
+        self._append(path, record)
+
+        if self.stale_size > self.min_compact_size and self.stale_size > self.live_size:
+            self.compact()
+
+    def load(self, path):
+        entry = self.index.get(path)
+        if not entry:
+            raise ResourceNotInCache(f"Failed to load Resource: {path} from {self.cache_dir!r}")
+
+        record = self._read(*entry)
+        try:
+            return json.loads(record)
+        except Exception as e:
+            msg = (
+                f"ERROR: failed to load resource: {path} from cache segment: {entry!r} "
+                "with content:\n\n" + repr(record) + "\n\n" + traceback.format_exc()
+            )
+            raise Exception(msg) from e
+
+    def compact(self):
+        """
+        Rewrite all the live records in new segments and delete the old segments.
+        """
+        if TRACE:
+            logger_debug(
+                "PackedResourceCache.compact: live:", self.live_size, "stale:", self.stale_size
+            )
+        old_index = self.index
+        old_segment_ids = range(self.segment_id + 1)
+        read = self._read
+
+        self.index = {}
+        self.live_size = self.stale_size = 0
+        self._new_segment()
+        for path, entry in old_index.items():
+            self._append(path, read(*entry))
+
+        for segment_id in old_segment_ids:
+            segment = self.mmaps.pop(segment_id, None)
+            if segment is not None:
+                segment.close()
+            location = self.get_segment_location(segment_id)
+            if exists(location):
+                delete(location)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        for segment in self.mmaps.values():
+            segment.close()
+        self.mmaps = {}
+
+
+class SqliteResourceCache(ResourceDiskCache):
+    """
+    Cache Resources as JSON records in a single SQLite database file using WAL
+    mode. Writes are batched in transactions. The paths of the cached Resources
+    are only stored in the database, such that the memory used does not grow
+    with the number of Resources. This database can also be used to persist and
+    reopen a whole codebase.
+    """
+
+    stores_paths = True
+
+    # number of pending writes batched together in a single transaction
+    batch_size = 1000
+
+    # max number of variables in a query: SQLITE_MAX_VARIABLE_NUMBER is 999 in
+    # older SQLite versions
+    max_variables = 900
+
+    def __init__(self, cache_dir, location=None):
+        super().__init__(cache_dir)
+        self.location = location or join(cache_dir, "resources.sqlite")
+        self.connection = connection = sqlite3.connect(self.location)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS resources (path TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        connection.commit()
+        # mapping of {path: JSON data} of writes not yet flushed to the database
+        self.pending = {}
+
+    def get_cache_location(self, path, create_dirs=False):
+        return self.location
+
+    def flush(self):
+        """
+        Write all pending Resources to the database in a single transaction.
+        """
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO resources (path, data) VALUES (?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET data = excluded.data",
+                self.pending.items(),
+            )
+        self.pending = {}
+
+    def exists(self, path):
+        if path in self.pending:
+            return True
+        query = "SELECT 1 FROM resources WHERE path = ?"
+        return self.connection.execute(query, (path,)).fetchone() is not None
+
+    def dump(self, path, data):
+        self.pending[path] = json.dumps(data, check_circular=False)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def load(self, path):
+        record = self.pending.get(path)
+        if record is None:
+            query = "SELECT data FROM resources WHERE path = ?"
+            row = self.connection.execute(query, (path,)).fetchone()
+            if not row:
+                raise ResourceNotInCache(f"Failed to load Resource: {path} from {self.location!r}")
+            record = row[0]
+        return json.loads(record)
+
+    def load_many(self, paths):
+        """
+        Return a mapping of {path: Resource data} for the Resources of a
+        sequence of ``paths`` that exist in this cache, loaded in bulk.
+        """
+        pending = self.pending
+        loaded = {path: json.loads(pending[path]) for path in paths if path in pending}
+        to_query = [path for path in paths if path not in loaded]
+        step = self.max_variables
+        for i in range(0, len(to_query), step):
+            chunk = to_query[i : i + step]
+            query = "SELECT path, data FROM resources WHERE path IN ({})".format(
+                ",".join("?" * len(chunk))
+            )
+            for path, record in self.connection.execute(query, chunk):
+                loaded[path] = json.loads(record)
+        return loaded
+
+    def delete(self, path):
+        """
+        Delete the Resource with ``path`` from this cache.
+        """
+        self.pending.pop(path, None)
+        with self.connection:
+            self.connection.execute("DELETE FROM resources WHERE path = ?", (path,))
+
+    def count(self):
+        """
+        Return the number of Resources in this cache.
+        """
+        self.flush()
+        return self.connection.execute("SELECT count(*) FROM resources").fetchone()[0]
+
+    def iter_paths(self):
+        """
+        Yield the paths of the Resources in this cache, in insertion order.
+        """
+        self.flush()
+        # note: we page through paths such that writes can happen while iterating
+        query = "SELECT rowid, path FROM resources WHERE rowid > ? ORDER BY rowid LIMIT ?"
+        last_rowid = -1
+        while True:
+            rows = self.connection.execute(query, (last_rowid, self.batch_size)).fetchall()
+            if not rows:
+                return
+            for last_rowid, path in rows:
+                yield path
+
+    def set_metadata(self, key, value):
+        """
+        Save a JSON-serializable ``value`` in this cache metadata with ``key``.
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO metadata (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, json.dumps(value)),
+            )
+
+    def get_metadata(self, key):
+        """
+        Return a value saved in this cache metadata with ``key`` or None.
+        """
+        query = "SELECT value FROM metadata WHERE key = ?"
+        row = self.connection.execute(query, (key,)).fetchone()
+        if row:
+            return json.loads(row[0])
+
+    def backup(self, location):
+        """
+        Copy this cache database to a new database file at ``location``.
+        """
+        self.flush()
+        target = sqlite3.connect(location)
+        try:
+            self.connection.backup(target)
+        finally:
+            target.close()
+
+    def close(self):
+        if self.connection:
+            self.flush()
+            self.connection.close()
+            self.connection = None
+
+
+class ScanIndex(object):
+    """
+    A sidecar index of a JSON or JSON Lines scan file stored in an SQLite
+    database. It maps the path of each Resource to the byte offset and length
+    of its data in the scan file, such that the data of a Resource can be
+    loaded without parsing the whole scan file. The directories that are only
+    implied by the paths of the scanned files have an offset of -1.
+
+    The index also stores the standard Resource attributes of each Resource,
+    the scan top-level data, the Resource attributes schema and the root names
+    needed to build a VirtualCodebase.
+    """
+
+    # the version of the index format: an index of another version is rebuilt
+    version = 2
+
+    def __init__(self, location, scan_location):
+        self.location = location
+        self.scan_location = scan_location
+        self.connection = connection = sqlite3.connect(location)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS records "
+            "(path TEXT PRIMARY KEY, parent TEXT, offset INTEGER, length INTEGER, basics TEXT)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS records_parent ON records(parent)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        connection.commit()
+        self.scan_file = None
+
+    @staticmethod
+    def get_index_location(scan_location):
+        """
+        Return the location of an index stored next to the scan file at
+        ``scan_location``. Use this location explicitly to reuse an index
+        across runs.
+        """
+        return f"{scan_location}.index"
+
+    @staticmethod
+    def get_temp_index_location():
+        """
+        Return the location of an index in a new temporary directory.
+        """
+        from commoncode.fileutils import get_temp_dir
+
+        return join(get_temp_dir(prefix="scancode-scan-index-"), "scan.index")
+
+    @staticmethod
+    def get_scan_stat(scan_location):
+        """
+        Return a list of [size, mtime_ns] of the file at ``scan_location``.
+        """
+        stat = os.stat(scan_location)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @classmethod
+    def build(cls, scan_location, location=None, batch_size=10000):
+        """
+        Build, save and return a new ScanIndex for the scan file at
+        ``scan_location``, stored at ``location`` or in a new temporary
+        directory. An existing index at this location is replaced. Raise an
+        Exception if the scan has duplicated paths.
+        """
+        scan_location = abspath(normpath(expanduser(scan_location)))
+        location = location or cls.get_temp_index_location()
+        if exists(location):
+            delete(location)
+
+        index = cls(location, scan_location)
+        connection = index.connection
+
+        # only the implied directories are replaced by a scanned Resource
+        upsert = (
+            "INSERT INTO records (path, parent, offset, length, basics) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET "
+            "offset=excluded.offset, length=excluded.length, basics=excluded.basics "
+            "WHERE records.offset < 0"
+        )
+        insert_implied = "INSERT OR IGNORE INTO records VALUES (?, ?, -1, 0, NULL)"
+
+        def insert(records, implied):
+            changes = connection.total_changes
+            connection.executemany(upsert, records)
+            if connection.total_changes - changes != len(records):
+                duplicated_paths = get_duplicated_paths(records)
+                index.close()
+                delete(location)
+                raise Exception(
+                    "Illegal combination of VirtualCode multiple inputs: "
+                    f"duplicated paths: {duplicated_paths}",
+                )
+            connection.executemany(insert_implied, implied)
+
+        def get_duplicated_paths(records):
+            # the paths of records that were not inserted
+            query = "SELECT 1 FROM records WHERE path = ? AND offset = ?"
+            duplicated_paths = []
+            for path, _parent, offset, _length, _basics in records:
+                inserted = connection.execute(query, (path, offset)).fetchone()
+                if not inserted and path not in duplicated_paths:
+                    duplicated_paths.append(path)
+            return duplicated_paths
+
+        # the standard Resource attributes are stored in the index such that a
+        # Resource can be created without parsing its scan data
+        basic_keys = set(f.name for f in attr.fields(Resource))
+        basic_keys.update(KNOW_PROPS)
+        basic_keys.difference_update(["path", "path_segments"])
+
+        scan_data = {}
+        schema = {}
+        root_names = set()
+        # paths of all the parent directories seen so far
+        parents = set()
+        records = []
+        implied = []
+        files_count = 0
+        first_path = None
+
+        for key, value, offset, length in iter_scan_data_with_offsets(scan_location):
+            if key != "files":
+                scan_data[key] = value
+                continue
+
+            files_count += 1
+            path = clean_path(value["path"])
+            root_names.add(path.partition("/")[0])
+            if not first_path:
+                first_path = path
+            for name, attribute in value.items():
+                schema[name] = get_value_kind(attribute)
+
+            parent = posixpath_parent(path)
+            basics = json.dumps({k: v for k, v in value.items() if k in basic_keys})
+            records.append((path, parent, offset, length, basics))
+            while parent and parent not in parents:
+                parents.add(parent)
+                grand_parent = posixpath_parent(parent)
+                implied.append((parent, grand_parent))
+                parent = grand_parent
+
+            if len(records) >= batch_size:
+                insert(records, implied)
+                records = []
+                implied = []
+
+        insert(records, implied)
+        connection.commit()
+
+        index.set_metadata("scan_data", scan_data)
+        index.set_metadata("resource_schema", schema)
+        index.set_metadata("root_names", sorted(root_names))
+        index.set_metadata("files_count", files_count)
+        index.set_metadata("first_path", first_path)
+        index.set_metadata("scan_stat", cls.get_scan_stat(scan_location))
+        index.set_metadata("version", cls.version)
+        return index
+
+    @classmethod
+    def open(cls, scan_location, location=None):
+        """
+        Return a ScanIndex for the scan file at ``scan_location`` stored at
+        ``location`` or in a new temporary directory. Build a new index if it
+        does not exist, is not current with the scan file or has another
+        version.
+        """
+        scan_location = abspath(normpath(expanduser(scan_location)))
+        if not location:
+            return cls.build(scan_location)
+        if exists(location):
+            index = cls(location, scan_location)
+            if index.get_metadata("version") == cls.version and index.get_metadata(
+                "scan_stat"
+            ) == cls.get_scan_stat(scan_location):
+                return index
+            index.close()
+        return cls.build(scan_location, location)
+
+    def set_metadata(self, key, value):
+        """
+        Save a JSON-serializable metadata ``value`` with ``key``.
+        """
+        connection = self.connection
+        connection.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+        connection.commit()
+
+    def get_metadata(self, key):
+        """
+        Return the metadata value saved with ``key`` or None.
+        """
+        row = self.connection.execute(
+            "SELECT value FROM metadata WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row:
+            return json.loads(row[0])
+
+    def __contains__(self, path):
+        row = self.connection.execute(
+            "SELECT 1 FROM records WHERE path = ?",
+            (path,),
+        ).fetchone()
+        return bool(row)
+
+    def __len__(self):
+        return self.count()
+
+    def count(self, is_included=None):
+        """
+        Return the number of indexed Resources, counting only the Resources
+        with a path for which an optional ``is_included`` function returns
+        True.
+        """
+        if not is_included:
+            return self.connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        self.connection.create_function("is_included", 1, is_included)
+        query = "SELECT COUNT(*) FROM records WHERE is_included(path)"
+        return self.connection.execute(query).fetchone()[0]
+
+    def __iter__(self):
+        for (path,) in self.connection.execute("SELECT path FROM records"):
+            yield path
+
+    def get_children_names(self, path):
+        """
+        Return a list of the names of the children of the Resource with
+        ``path``.
+        """
+        rows = self.connection.execute(
+            "SELECT path FROM records WHERE parent = ?",
+            (path,),
+        )
+        return [file_name(child_path) for (child_path,) in rows]
+
+    def load(self, path):
+        """
+        Return the file data mapping of the Resource with ``path`` parsed from
+        the scan file or None if there is no such Resource. For an implied
+        directory, this is a minimal mapping with only a path and type.
+        """
+        row = self.connection.execute(
+            "SELECT offset, length FROM records WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if not row:
+            return
+
+        offset, length = row
+        if offset < 0:
+            return dict(path=path, type="directory")
+        return json.loads(self.read(offset, length))
+
+    def load_raw(self, path):
+        """
+        Return a tuple of (basics, raw data) for the Resource with ``path`` or
+        None if there is no such Resource. ``basics`` is a mapping of the
+        standard Resource attributes of its file data and ``raw data`` is the
+        JSON text of its file data, not parsed. For an implied directory, the
+        raw data is None.
+        """
+        row = self.connection.execute(
+            "SELECT offset, length, basics FROM records WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if not row:
+            return
+
+        offset, length, basics = row
+        if offset < 0:
+            return dict(type="directory"), None
+        return json.loads(basics), self.read(offset, length).decode("utf-8")
+
+    def read(self, offset, length):
+        """
+        Return the bytes of the scan file at ``offset`` with ``length``.
+        """
+        scan_file = self.scan_file
+        if not scan_file:
+            self.scan_file = scan_file = open(self.scan_location, "rb")
+        scan_file.seek(offset)
+        return scan_file.read(length)
+
+    def close(self):
+        if self.scan_file:
+            self.scan_file.close()
+            self.scan_file = None
+        self.connection.close()
+
+
+class ScanIndexResourceCache(ResourceDiskCache):
+    """
+    A read-through disk cache of the Resources of a scan file indexed in a
+    ScanIndex. Resources are parsed from the scan file only when loaded. Saved
+    and new Resources are stored in an SqliteResourceCache.
+
+    Resource paths are the index paths prefixed with an optional virtual root
+    ``prefix``. Loaded data are filtered with an optional ``project_fields``
+    function. Only the indexed Resources with a path for which an optional
+    ``include_path`` function returns True are available.
+
+    If ``lazy`` is True, the loaded data of an indexed Resource have only its
+    standard attributes and a "raw_data" JSON text of its file data, not
+    parsed, for a LazyResource.
+    """
+
+    stores_paths = True
+
+    def __init__(
+        self,
+        cache_dir,
+        index,
+        prefix=None,
+        project_fields=None,
+        include_path=None,
+        lazy=False,
+    ):
+        super().__init__(cache_dir)
+        self.index = index
+        self.prefix = prefix
+        self.project_fields = project_fields
+        self.include_path = include_path
+        self.lazy = lazy
+        self.saved = SqliteResourceCache(cache_dir)
+        # paths of the deleted indexed Resources
+        self.deleted = set()
+
+    def get_cache_location(self, path, create_dirs=False):
+        return self.saved.location
+
+    def get_index_path(self, path):
+        """
+        Return the index path for a Resource ``path`` or None.
+        """
+        prefix = self.prefix
+        if not prefix:
+            return path
+        root, _, index_path = path.partition("/")
+        if root == prefix and index_path:
+            return index_path
+
+    def exists(self, path):
+        if path in self.deleted:
+            return False
+        return self.saved.exists(path) or self.exists_in_index(path)
+
+    def dump(self, path, data):
+        self.deleted.discard(path)
+        self.saved.dump(path, data)
+
+    def load(self, path):
+        if path not in self.deleted:
+            if self.saved.exists(path):
+                return self.saved.load(path)
+
+            index_path = self.get_index_path(path)
+            data = index_path and self.is_included(path) and self.load_from_index(path, index_path)
+            if data:
+                return data
+
+        raise ResourceNotInCache(f"Failed to load Resource: {path} from {self.index.location!r}")
+
+    def load_from_index(self, path, index_path):
+        """
+        Return a Resource data mapping for a Resource with ``path`` loaded from
+        the index with ``index_path`` or None.
+        """
+        if not self.lazy:
+            fdata = self.index.load(index_path)
+            return fdata and self.build_data(path, index_path, fdata)
+
+        loaded = self.index.load_raw(index_path)
+        if not loaded:
+            return
+        basics, raw_data = loaded
+        data = self.build_data(path, index_path, basics)
+        if raw_data:
+            data["raw_data"] = raw_data
+        return data
+
+    def build_data(self, path, index_path, fdata):
+        """
+        Return a Resource data mapping for a Resource with ``path`` from an
+        ``fdata`` file data mapping of the scan file.
+        """
+        if self.project_fields:
+            self.project_fields(fdata)
+        data = remove_properties_and_basics(fdata)
+        data["name"] = fdata.get("name") or file_name(path)
+        data["path"] = path
+        data["location"] = None
+        data["is_file"] = fdata.get("type", "file") == "file"
+        data["children_names"] = self.get_children_names(path, index_path)
+        data["cache_location"] = self.saved.location
+        return data
+
+    def get_children_names(self, path, index_path):
+        """
+        Return a list of the names of the included children of the Resource
+        with ``path`` and ``index_path``.
+        """
+        names = self.index.get_children_names(index_path)
+        if self.include_path:
+            names = [name for name in names if self.include_path(posixpath_join(path, name))]
+        return names
+
+    def is_included(self, path):
+        """
+        Return True if the indexed Resource with ``path`` is included.
+        """
+        return not self.include_path or self.include_path(path)
+
+    def delete(self, path):
+        self.saved.delete(path)
+        self.deleted.add(path)
+
+    def iter_paths(self):
+        deleted = self.deleted
+        prefix = self.prefix
+        for path in self.index:
+            if prefix:
+                path = posixpath_join(prefix, path)
+            if path not in deleted and self.is_included(path):
+                yield path
+        for path in self.saved.iter_paths():
+            if path not in deleted and not self.exists_in_index(path):
+                yield path
+
+    def exists_in_index(self, path):
+        index_path = self.get_index_path(path)
+        return bool(index_path) and self.is_included(path) and index_path in self.index
+
+    def count(self):
+        """
+        Return the number of Resources in this cache. The indexed Resources
+        are counted with a single query and the saved Resources are counted
+        only if they are not indexed.
+        """
+        count = self.index.count(is_included=self.include_path and self.is_included_index_path)
+        count -= sum(1 for path in self.deleted if self.exists_in_index(path))
+        deleted = self.deleted
+        for path in self.saved.iter_paths():
+            if path not in deleted and not self.exists_in_index(path):
+                count += 1
+        return count
+
+    def is_included_index_path(self, index_path):
+        """
+        Return True if the indexed Resource with ``index_path`` is included.
+        """
+        prefix = self.prefix
+        if prefix:
+            return self.is_included(posixpath_join(prefix, index_path))
+        return self.is_included(index_path)
+
+    def close(self):
+        self.saved.close()
+        self.index.close()
+
+
+# mapping of {cache format: ResourceDiskCache sub-class}
+resource_disk_caches = {
+    "json": JsonResourceCache,
+    "packed": PackedResourceCache,
+    "sqlite": SqliteResourceCache,
+}
+
+
+class DiskCacheResourcesByPath(MutableMapping):
+    """
+    A Codebase.resources_by_path mapping of {path: Resource or
+    Codebase.CACHED_RESOURCE} where only the in-memory Resources are kept in
+    memory. The paths of the Resources cached on disk are only stored in a
+    ResourceDiskCache that stores paths such as the SqliteResourceCache.
+
+    Note that a lookup or a membership test of a path that is not in memory
+    runs a query on the disk cache, such that the memory used does not grow
+    with the number of paths. Also, unlike a dict, iteration yields the paths
+    of the in-memory Resources first and then the paths of the Resources
+    cached on disk in their insertion order.
+    """
+
+    def __init__(self, disk_cache):
+        self.disk_cache = disk_cache
+        # mapping of {path: Resource} for the in-memory Resources
+        self.in_memory = {}
+
+    def __getitem__(self, path):
+        resource = self.in_memory.get(path)
+        if resource is not None:
+            return resource
+        if self.disk_cache.exists(path):
+            return Codebase.CACHED_RESOURCE
+        raise KeyError(path)
+
+    def __setitem__(self, path, value):
+        if value is Codebase.CACHED_RESOURCE:
+            # the Resource data are already saved in the disk cache
+            self.in_memory.pop(path, None)
+        else:
+            self.in_memory[path] = value
+
+    def __delitem__(self, path):
+        if path in self.in_memory:
+            del self.in_memory[path]
+        elif self.disk_cache.exists(path):
+            self.disk_cache.delete(path)
+        else:
+            raise KeyError(path)
+
+    def __contains__(self, path):
+        return path in self.in_memory or self.disk_cache.exists(path)
+
+    def __iter__(self):
+        in_memory = self.in_memory
+        yield from list(in_memory)
+        for path in self.disk_cache.iter_paths():
+            if path not in in_memory:
+                yield path
+
+    def __len__(self):
+        return len(self.in_memory) + self.disk_cache.count()
 
 
 @attr.s(slots=True)
@@ -1604,15 +3504,185 @@ class _CodebaseAttributes(object):
     @classmethod
     def from_attributes(cls, attributes):
         """
-        Return a new sub class of _CodebaseAttributes built with the
+        Return a sub class of _CodebaseAttributes built with the
         ``attributes`` mapping of "attr" attributes.
         """
-        return attr.make_class(
+        return get_attrs_class(
             name="CodebaseAttributes",
-            attrs=attributes or {},
-            slots=True,
-            bases=(_CodebaseAttributes,),
+            attributes=attributes,
+            base_class=_CodebaseAttributes,
+        )
+
+
+# LRU mapping of {(class name, base class, attributes signature): class} of the
+# classes built with get_attrs_class()
+_attrs_classes = OrderedDict()
+
+# maximum number of classes kept in _attrs_classes
+ATTRS_CLASSES_CACHE_SIZE = 128
+
+
+def get_attribute_signature(attribute):
+    """
+    Return a hashable signature tuple of the definition of an attr
+    ``attribute`` such as its default, type and metadata. Attributes with the
+    same signature are equivalent.
+    """
+    signature = []
+    for name in type(attribute).__slots__:
+        if name == "counter":
+            # the definition order is not part of the definition
+            continue
+        value = getattr(attribute, name, None)
+        if isinstance(value, attr.Factory):
+            value = (attr.Factory, value.factory, value.takes_self)
+        elif isinstance(value, dict):
+            value = tuple(sorted(value.items()))
+        signature.append(value)
+    return tuple(signature)
+
+
+def get_attrs_class(name, attributes, base_class):
+    """
+    Return a slotted attr class named ``name`` that subclasses ``base_class``
+    with an ``attributes`` ordered mapping of {name: attr attribute}.
+
+    A class is built once for the whole process and reused for the same
+    attributes, compared by their name and signature such that fresh
+    equivalent attribute definitions reuse the same class. At most
+    ``ATTRS_CLASSES_CACHE_SIZE`` recently used classes are kept.
+    """
+    attributes = attributes or {}
+    try:
+        key = (
+            name,
+            base_class,
+            tuple((n, get_attribute_signature(a)) for n, a in attributes.items()),
         )
+        cls = _attrs_classes.get(key)
+    except TypeError:
+        # an unhashable definition such as a mutable default: not cached
+        key = cls = None
+
+    if cls is not None:
+        _attrs_classes.move_to_end(key)
+        return cls
+
+    cls = attr.make_class(
+        name=name,
+        attrs=dict(attributes),
+        slots=True,
+        bases=(base_class,),
+    )
+    if key is not None:
+        _attrs_classes[key] = cls
+        while len(_attrs_classes) > ATTRS_CLASSES_CACHE_SIZE:
+            _attrs_classes.popitem(last=False)
+    return cls
+
+
+def get_value_kind(value):
+    """
+    Return a kind string for a ``value`` used to build an attribute for this
+    value. One of "list", "dict", "bool", "int" or "any".
+    """
+    if isinstance(value, (list, tuple)):
+        return "list"
+    elif isinstance(value, dict):
+        return "dict"
+    elif isinstance(value, bool):
+        return "bool"
+    elif isinstance(value, int):
+        return "int"
+    else:
+        return "any"
+
+
+# mapping of {kind: attr attribute} of the attributes built with build_attribute()
+_attributes_by_kind = {}
+
+
+def build_attribute(kind):
+    """
+    Return an attr attribute for a ``kind`` string as returned by
+    ``get_value_kind``. The same attribute is returned for the same kind.
+    """
+    attribute = _attributes_by_kind.get(kind)
+    if attribute is not None:
+        return attribute
+
+    if kind == "list":
+        attribute = attr.ib(default=attr.Factory(list), repr=False)
+    elif kind == "dict":
+        attribute = attr.ib(default=attr.Factory(dict), repr=False)
+    elif kind == "bool":
+        attribute = attr.ib(default=False, type=bool, repr=False)
+    elif kind == "int":
+        attribute = attr.ib(default=0, type=bool, repr=False)
+    else:
+        attribute = attr.ib(default=None, repr=False)
+    return _attributes_by_kind.setdefault(kind, attribute)
+
+
+def get_kind_default(kind):
+    """
+    Return a new default value for a ``kind`` string as returned by
+    ``get_value_kind``.
+    """
+    if kind == "list":
+        return []
+    elif kind == "dict":
+        return {}
+    elif kind == "bool":
+        return False
+    elif kind == "int":
+        return 0
+
+
+# mapping of {kind: attr attribute} of the attributes built with build_lazy_attribute()
+_lazy_attributes_by_kind = {}
+
+
+def build_lazy_attribute(kind):
+    """
+    Return an attr attribute of a LazyResource for a ``kind`` string as
+    returned by ``get_value_kind``. This attribute is not set when a Resource
+    is created but when first accessed. The same attribute is returned for the
+    same kind.
+    """
+    attribute = _lazy_attributes_by_kind.get(kind)
+    if attribute is None:
+        attribute = attr.ib(init=False, repr=False, metadata=dict(lazy_kind=kind))
+        attribute = _lazy_attributes_by_kind.setdefault(kind, attribute)
+    return attribute
+
+
+# mapping of {LazyResource class: {name: (kind, slot)}}, weakly keyed such that
+# the classes evicted from _attrs_classes can be released
+_lazy_attributes_by_class = WeakKeyDictionary()
+
+
+def get_lazy_attributes(cls):
+    """
+    Return a mapping of {name: (kind, slot descriptor)} of the attributes
+    built with ``build_lazy_attribute()`` of a LazyResource ``cls`` class.
+    """
+    lazy_attributes = _lazy_attributes_by_class.get(cls)
+    if lazy_attributes is not None:
+        return lazy_attributes
+
+    lazy_attributes = {}
+    for field in attr.fields(cls):
+        kind = field.metadata.get("lazy_kind")
+        if not kind:
+            continue
+        # the slot is defined in the attr class or one of its bases
+        for klass in cls.__mro__:
+            slot = klass.__dict__.get(field.name)
+            if slot is not None:
+                lazy_attributes[field.name] = kind, slot
+                break
+    return _lazy_attributes_by_class.setdefault(cls, lazy_attributes)
 
 
 def build_attributes_defs(mapping, ignored_keys=()):
@@ -1627,25 +3697,53 @@ def build_attributes_defs(mapping, ignored_keys=()):
     for key, value in mapping.items():
         if key in ignored_keys or key in attributes:
             continue
-        if isinstance(value, (list, tuple)):
-            attributes[key] = attr.ib(default=attr.Factory(list), repr=False)
-        elif isinstance(value, dict):
-            attributes[key] = attr.ib(default=attr.Factory(dict), repr=False)
-        elif isinstance(value, bool):
-            attributes[key] = attr.ib(default=False, type=bool, repr=False)
-        elif isinstance(value, int):
-            attributes[key] = attr.ib(default=0, type=bool, repr=False)
-        else:
-            attributes[key] = attr.ib(default=None, repr=False)
+        attributes[key] = build_attribute(get_value_kind(value))
 
     return attributes
 
 
+def get_attributes_schema(cls, base_class):
+    """
+    Return an attributes schema as an ordered mapping of {name: kind} for the
+    attributes of an attr ``cls`` class that are not attributes of its
+    ``base_class``. See ``get_value_kind`` for the kinds.
+    """
+    base_fields = set(f.name for f in attr.fields(base_class))
+    schema = {}
+    for field in attr.fields(cls):
+        if field.name in base_fields:
+            continue
+        kind = field.metadata.get("lazy_kind")
+        if not kind:
+            default = field.default
+            if isinstance(default, attr.Factory):
+                default = default.factory()
+            kind = get_value_kind(default)
+        schema[field.name] = kind
+    return schema
+
+
+def build_attributes_from_schema(schema):
+    """
+    Return an ordered mapping of attributes built from an attributes ``schema``
+    mapping of {name: kind}.
+    """
+    return {name: build_attribute(kind) for name, kind in schema.items()}
+
+
 class VirtualCodebase(Codebase):
     __slots__ = (
         # TRUE iff the loaded virtual codebase has file information
         "with_info",
         "has_single_resource",
+        # function to remove unwanted keys from loaded file data or None
+        "project_fields",
+        # mapping of {name: kind} of the loaded file data attributes or None
+        "resource_schema",
+        # True if the scanned attributes of Resources are set when first used
+        "lazy_attributes",
+        # function to deduplicate the values of loaded file data or None
+        "dedup_values",
     )
 
     def __init__(
@@ -1656,6 +3754,19 @@ class VirtualCodebase(Codebase):
         temp_dir=temp_dir,
         max_in_memory=10000,
         paths=tuple(),
+        cache_format="json",
+        lru_cache_size=1000,
+        streaming=False,
+        fields=(),
+        exclude_fields=(),
+        processes=1,
+        lazy=False,
+        index_location=None,
+        resource_schema=None,
+        lazy_attributes=False,
+        dedup_values=False,
+        freeze_lists=False,
+        sort_run_size=0,
         *args,
         **kwargs,
     ):
@@ -1665,34 +3776,142 @@ class VirtualCodebase(Codebase):
 
         `max_depth`, if passed, will be ignored as VirtualCodebase will
         be using the depth of the original scan.
+
+        If `streaming` is True and `location` is a path (or a list of paths) to
+        JSON scan files, parse these files incrementally and create Resources
+        as they are parsed rather than loading the whole scan data in memory.
+        Memory use then depends on `max_in_memory` rather than the scan size.
+
+        `fields` is an optional list of the Resource attributes to load from
+        the scan data, ignoring all others. `exclude_fields` is an optional
+        list of Resource attributes to ignore. Ignored attributes are not
+        attributes of the Resource class of this codebase. The "path" and
+        "type" attributes are always loaded.
+
+        When `location` is a list of multiple scans, these are parsed in
+        parallel using up to `processes` processes if `processes` is more than
+        one (and not `streaming`).
+
+        If `lazy` is True, `location` must be the path to a single JSON or JSON
+        Lines scan file. A ScanIndex of this file is built if needed and stored
+        at `index_location` or in the cache directory of this codebase.
+        Resources are then parsed from the scan file only when used, such as
+        with `get_resource()`. To reuse an index across runs, use an explicit
+        `index_location` such as `ScanIndex.get_index_location(location)` to
+        store it next to the scan file.
+
+        `resource_schema` is an optional mapping of {name: kind} of all the
+        attributes of the file data of the scan, where a kind is one of "list",
+        "dict", "bool", "int" or "any". If not provided, the "resource_schema"
+        top-level mapping of a single scan is used if present. Otherwise, the
+        schema is inferred from the file data of the scan. See also
+        `Codebase.write_jsonl()`.
+
+        If `lazy_attributes` is True and `lazy` is True, Resources are
+        LazyResource that keep the JSON text of the file data of each file as
+        read from the scan file and decode it only when a scanned attribute is
+        first accessed. This option is ignored if `lazy` is False since the
+        scan file must then be parsed to get the path of each file.
+
+        If `dedup_values` is True, the equal strings of the loaded file data
+        such as license expressions or mime types are stored only once. If
+        `freeze_lists` is also True, equal small lists of the loaded file data
+        are replaced by a shared tuple: these must not be modified in place.
+        Only the data of the Resources kept in memory are deduplicated and the
+        mostly unique values such as paths and checksums are skipped. See
+        `get_values_deduplicator()`. These options are ignored if `lazy` is
+        True.
+
+        If `streaming` is True and `sort_run_size` is more than zero, the file
+        data are sorted by path before creating Resources, using sorted runs of
+        at most `sort_run_size` file data saved to temporary files under
+        `temp_dir` and merged. Each parent Resource is then saved only once
+        even if the scan files are not sorted.
         """
         logger_debug(f"VirtualCodebase: new from: {location!r}")
 
-        self._setup_essentials(temp_dir, max_in_memory)
+        self._setup_essentials(temp_dir, max_in_memory, cache_format, lru_cache_size=lru_cache_size)
 
         self.codebase_attributes = codebase_attributes or {}
         self.resource_attributes = resource_attributes or {}
         self.resource_class = None
         self.has_single_resource = False
         self.location = location
+        self.project_fields = get_fields_projector(fields, exclude_fields)
+        self.resource_schema = resource_schema
+        self.lazy_attributes = lazy_attributes and lazy
+        self.dedup_values = None
+        if dedup_values and not lazy:
+            self.dedup_values = get_values_deduplicator(freeze_lists=freeze_lists)
+
+        locations = (streaming or lazy) and self._get_scan_locations(location)
+        if lazy:
+            if not locations or len(locations) != 1:
+                raise TypeError(f"A lazy VirtualCodebase requires a scan file path: {location!r}")
+            self.paths = self._prepare_clean_paths(paths)
+            self._populate_from_index(locations[0], index_location)
+        elif locations:
+            self.paths = self._prepare_clean_paths(paths)
+            self._populate_from_stream(locations, sort_run_size=sort_run_size)
+        else:
+            scan_data = self._get_scan_data(
+                location,
+                processes=processes,
+                fields=fields,
+                exclude_fields=exclude_fields,
+            )
+            self.paths = self._prepare_clean_paths(paths)
+            self._populate(scan_data)
+        # release the deduplicated values
+        self.dedup_values = None
 
-        scan_data = self._get_scan_data(location)
-        self.paths = self._prepare_clean_paths(paths)
-        self._populate(scan_data)
+    @classmethod
+    def reopen(cls, location, temp_dir=temp_dir, max_in_memory=10000, lru_cache_size=1000):
+        """
+        Return a new VirtualCodebase reopened from a SQLite database file at
+        ``location`` created with ``persist()``. See Codebase.reopen().
+        """
+        codebase = super().reopen(
+            location,
+            temp_dir=temp_dir,
+            max_in_memory=max_in_memory,
+            lru_cache_size=lru_cache_size,
+        )
+        # the scan loading options do not apply to a reopened codebase
+        codebase.project_fields = None
+        codebase.resource_schema = None
+        codebase.lazy_attributes = False
+        codebase.dedup_values = None
+        return codebase
+
+    def _get_scan_locations(self, location):
+        """
+        Return a list of scan file locations given a ``location`` path string or
+        a list or tuple of path strings. Return None if ``location`` is not a
+        path to an existing file or a list of these.
+        """
+        if isinstance(location, str):
+            location = [location]
+        if not isinstance(location, (list, tuple)):
+            return
+
+        locations = []
+        for loc in location:
+            if not isinstance(loc, str):
+                return
+            loc = abspath(normpath(expanduser(loc)))
+            if not isfile(loc):
+                return
+            locations.append(loc)
+        return locations
 
     def _get_scan_data_helper(self, location):
         """
         Return scan data loaded from `location`, which is a path string
         """
-        try:
-            return json.loads(location)
-        except:
-            location = abspath(normpath(expanduser(location)))
-            with open(location) as f:
-                scan_data = json.load(f)
-            return scan_data
+        return load_scan_data(location)
 
-    def _get_scan_data(self, location):
+    def _get_scan_data(self, location, processes=1, fields=(), exclude_fields=()):
         """
         Return scan data loaded from `location` that is either:
         - a path string
@@ -1702,6 +3921,10 @@ class VirtualCodebase(Codebase):
           case all paths are prefixed with codebase-1/, codebase-2., etc.
           incremented for each location.
         Loading also cleans the paths as POSIX.
+
+        Multiple scans are loaded in parallel using up to `processes` processes
+        if `processes` is more than one. Only the `fields` and not the
+        `exclude_fields` file attributes of these are kept.
         """
         if isinstance(location, dict):
             return location
@@ -1713,21 +3936,24 @@ class VirtualCodebase(Codebase):
                 tuple,
             ),
         ):
+            loader = partial(
+                load_input_scan_data,
+                fields=fields,
+                exclude_fields=exclude_fields,
+            )
+            indexes = range(1, len(location) + 1)
+            if processes > 1 and len(location) > 1:
+                # parse each scan in its own process and merge these in order
+                workers = min(processes, len(location))
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    loaded = list(executor.map(loader, location, indexes))
+            else:
+                loaded = map(loader, location, indexes)
+
             combined_scan_data = dict(headers=[], files=[])
-            for idx, loc in enumerate(location, 1):
-                scan_data = self._get_scan_data_helper(loc)
-                headers = scan_data.get("headers")
-                if headers:
-                    combined_scan_data["headers"].extend(headers)
-                files = scan_data.get("files")
-                if files:
-                    for f in files:
-                        f["path"] = posixpath_join(f"codebase-{idx}", clean_path(f["path"]))
-                    combined_scan_data["files"].extend(files)
-                else:
-                    raise Exception(
-                        f'Input file is missing a "files" (aka. resources) section to load: {loc}'
-                    )
+            for headers, files in loaded:
+                combined_scan_data["headers"].extend(headers)
+                combined_scan_data["files"].extend(files)
 
             combined_scan_data["headers"] = sorted(
                 combined_scan_data["headers"],
@@ -1750,8 +3976,9 @@ class VirtualCodebase(Codebase):
         # A dict of {field: field_default_value} for the dynamically created fields
         resource_data = {}
         for field in resource_fields:
-            if field in base_fields:
-                # We only want the fields that are not part of the base set of fields
+            if field in base_fields or field.metadata.get("lazy_kind"):
+                # We only want the fields that are not part of the base set of
+                # fields and that are set when created
                 continue
             value = field.default
             if isinstance(value, attr.Factory):
@@ -1769,7 +3996,7 @@ class VirtualCodebase(Codebase):
         all_attributes = (
             build_attributes_defs(
                 mapping=scan_data,
-                ignored_keys=("headers", "files"),
+                ignored_keys=("headers", "files", "resource_schema"),
             )
             or {}
         )
@@ -1782,47 +4009,344 @@ class VirtualCodebase(Codebase):
 
         return all_attributes
 
-    def _build_resource_class(self, sample_resource_data, *args, **kwargs):
+    def _build_resource_class(self, sample_resource_data, schema=None, *args, **kwargs):
+        """
+        Return a Resource class to use with this Codebase. Use an attributes
+        ``schema`` mapping of {name: kind} if provided rather than the
+        ``sample_resource_data``.
+        """
+        # Collect the existing attributes of the standard Resource class
+        standard_res_attributes = set(f.name for f in attr.fields(Resource))
+
+        # add these properties since they are fields but are serialized
+        properties = set(["type", "base_name", "extension"])
+        standard_res_attributes.update(properties)
+
+        # We collect attributes that are not in standard_res_attributes already
+        # FIXME: we should not have to infer the schema may be?
+        if schema is None:
+            schema = {k: get_value_kind(v) for k, v in sample_resource_data.items()}
+        schema = {k: v for k, v in schema.items() if k not in standard_res_attributes}
+
+        base_class = Resource
+        if self.lazy_attributes:
+            base_class = LazyResource
+            all_res_attributes = {k: build_lazy_attribute(v) for k, v in schema.items()}
+        else:
+            all_res_attributes = build_attributes_from_schema(schema)
+
+        # We add the attributes that we collected from the plugins. They come
+        # last for now.
+        for name, plugin_attribute in self.resource_attributes.items():
+            if name not in all_res_attributes:
+                all_res_attributes[name] = plugin_attribute
+
+        # Create or reuse the Resource class with the desired attributes
+        return get_attrs_class(
+            name="ScannedResource",
+            attributes=all_res_attributes,
+            base_class=base_class,
+        )
+
+    def _populate(self, scan_data):
+        """
+        Populate this codebase with Resource objects.
+
+        The actual subclass of Resource objects used in this codebase will be
+        created as a side effect.
+
+        Population is done by loading JSON scan results and creating new
+        Resources for each files mappings.
+        """
+        self._populate_codebase_data(scan_data)
+
+        ##########################################################
+        files_data = scan_data.get("files")
+        if not files_data:
+            raise Exception('Input has no "files" top-level scan results.')
+
+        if len(files_data) == 1:
+            # we will shortcut to populate the codebase with a single root resource
+            self.has_single_resource = True
+            root_is_file = files_data[0].get("type") == "file"
+        else:
+            root_is_file = False
+
+        # Iterate through all Resources to collect any attribute in any resource
+        # as sample data. The paths were cleaned on loading
+        # NOTE: We also populate a set of unique root names to to check if all
+        # scanned Resources share a common root or need a new virtual root
+
+        root_names = set()
+        root_names_add = root_names.add
+
+        schema = self._get_resource_schema(scan_data)
+        sample_resource_data = {}
+        sample_resource_data_update = sample_resource_data.update
+
+        project_fields = self.project_fields
+        for fdata in files_data:
+            if project_fields:
+                project_fields(fdata)
+            if schema is None:
+                sample_resource_data_update(fdata)
+            root_names_add(fdata["path"].partition("/")[0])
+
+        if schema is None:
+            self._setup_resource_class(sample_resource_data)
+        else:
+            self._setup_resource_class(schema, schema=schema)
+
+        # walk and create resources proper
+        # Create root resource first
+        ##########################################################
+        root_path, needs_new_virtual_root = self._get_root_path(root_names)
+
+        if needs_new_virtual_root:
+            for fdata in files_data:
+                fdata["path"] = posixpath_join(root_path, fdata["path"])
+
+        root_data = None
+        if self.has_single_resource:
+            root_data = files_data[0]
+
+        self._create_virtual_root(root_path, root_is_file, root_data)
+
+        if self.has_single_resource:
+            if TRACE:
+                logger_debug("VirtualCodebase.populate: with single resource.")
+            return
+
+        # Create other Resources from scan info
+
+        # Keep only the files data of the requested paths, if any, and add a
+        # new "path_segments" attribute with the path split in segments
+        include_path = get_paths_matcher(self.paths)
+        selected_files_data = []
+        for fdata in files_data:
+            path = fdata["path"]
+            if include_path and not include_path(path):
+                continue
+            fdata["path_segments"] = path.split("/")
+            selected_files_data.append(fdata)
+        files_data = selected_files_data
+
+        # Note that we do not know the ordering there.
+        # Therefore we sort in place by path segments
+        files_data.sort(key=itemgetter("path_segments"))
+
+        # We create directories that exist in the scan or create these that
+        # exist only in paths. Each parent is saved once after all its
+        # children are created: with the sort above, these are contiguous.
+        self._create_resources_from_data(files_data)
+
+    def _populate_from_stream(self, locations, sort_run_size=0):
+        """
+        Populate this codebase with Resource objects from the JSON scan files
+        at ``locations``, parsing these files incrementally.
+
+        A first pass over the "files" collects the attributes used to build the
+        Resource class and the root name(s). A second pass creates Resources as
+        each file mapping is parsed. The scan data is not kept in memory, and
+        Resources are cached on disk as configured with ``max_in_memory``.
+
+        Two passes are needed since no Resource can be created before the root
+        path and the Resource class are known: the root path depends on the
+        first path segment of every file, and a new virtual root is needed if
+        these differ. The attributes of the first files are not enough to
+        build the Resource class since other files may have more attributes.
+        With a "resource_schema" such as written by ``write_jsonl()``, the
+        first pass only collects the root names.
+
+        If ``sort_run_size`` is more than zero, the file mappings are sorted by
+        path with ``iter_sorted_files_data()`` in runs of up to this size before
+        creating Resources.
+        """
+        multiple_inputs = len(locations) > 1
+        scan_data = dict(headers=[])
+        root_names = set()
+        root_names_add = root_names.add
+        sample_resource_data = {}
+        sample_resource_data_update = sample_resource_data.update
+        files_count = 0
+        first_fdata = None
+        schema = self._get_resource_schema()
+
+        for key, value, location in self._iter_scan_data(locations):
+            if key == "files":
+                files_count += 1
+                if not first_fdata:
+                    first_fdata = value
+                if schema is None:
+                    sample_resource_data_update(value)
+                root_names_add(value["path"].partition("/")[0])
+            elif key == "headers":
+                scan_data["headers"].extend(value or [])
+            elif not multiple_inputs:
+                scan_data[key] = value
+                if key == "resource_schema" and schema is None:
+                    # no need to collect samples once we know the schema
+                    schema = self._get_resource_schema(scan_data)
+                    sample_resource_data = None
+
+        if multiple_inputs:
+            scan_data["headers"].sort(key=lambda x: x["start_timestamp"])
+
+        self._populate_codebase_data(scan_data)
+
+        if not files_count:
+            raise Exception('Input has no "files" top-level scan results.')
+
+        if files_count == 1:
+            # we will shortcut to populate the codebase with a single root resource
+            self.has_single_resource = True
+            root_is_file = first_fdata.get("type") == "file"
+        else:
+            root_is_file = False
+
+        if schema is None:
+            self._setup_resource_class(sample_resource_data)
+        else:
+            self._setup_resource_class(schema, schema=schema)
+        sample_resource_data = None
+
+        root_path, needs_new_virtual_root = self._get_root_path(root_names)
+
+        root_data = None
+        if self.has_single_resource:
+            root_data = first_fdata
+            if needs_new_virtual_root:
+                root_data["path"] = posixpath_join(root_path, root_data["path"])
+        first_fdata = None
+
+        self._create_virtual_root(root_path, root_is_file, root_data)
+
+        if self.has_single_resource:
+            return
+
+        include_path = get_paths_matcher(self.paths)
+
+        def iter_files_data():
+            for key, fdata, _location in self._iter_scan_data(locations):
+                if key == "files":
+                    if needs_new_virtual_root:
+                        fdata["path"] = posixpath_join(root_path, fdata["path"])
+                    if include_path and not include_path(fdata["path"]):
+                        continue
+                    yield fdata
+
+        files_data = iter_files_data()
+        if sort_run_size:
+            files_data = iter_sorted_files_data(
+                files_data,
+                run_size=sort_run_size,
+                temp_dir=self.temp_dir,
+            )
+
+        self._create_resources_from_data(files_data)
+
+    def _populate_from_index(self, location, index_location=None):
         """
-        Return a Resource class to use with this Codebase
+        Populate this codebase from the ScanIndex of the scan file at
+        ``location``. Only the root Resource is created: other Resources are
+        loaded from the scan file when used.
         """
-        # Collect the existing attributes of the standard Resource class
-        standard_res_attributes = set(f.name for f in attr.fields(Resource))
-
-        # add these properties since they are fields but are serialized
-        properties = set(["type", "base_name", "extension"])
-        standard_res_attributes.update(properties)
+        if not self.cache_dir:
+            self.cache_dir = get_codebase_cache_dir(temp_dir=self.temp_dir)
+        index = ScanIndex.open(location, index_location or join(self.cache_dir, "scan.index"))
+        self._populate_codebase_data(index.get_metadata("scan_data"))
+
+        schema = self._get_resource_schema(index.get_metadata("scan_data"))
+        if schema is None:
+            schema = index.get_metadata("resource_schema")
+            if self.project_fields:
+                self.project_fields(schema)
+        self._setup_resource_class(schema, schema=schema)
+
+        files_count = index.get_metadata("files_count")
+        if not files_count:
+            raise Exception('Input has no "files" top-level scan results.')
 
-        # We collect attributes that are not in standard_res_attributes already
-        # FIXME: we should not have to infer the schema may be?
-        all_res_attributes = build_attributes_defs(
-            mapping=sample_resource_data,
-            ignored_keys=standard_res_attributes,
+        root_names = set(index.get_metadata("root_names"))
+        root_path, needs_new_virtual_root = self._get_root_path(root_names)
+        prefix = needs_new_virtual_root and root_path or None
+
+        if self.disk_cache:
+            self.disk_cache.close()
+        self.disk_cache = disk_cache = ScanIndexResourceCache(
+            cache_dir=self.cache_dir,
+            index=index,
+            prefix=prefix,
+            project_fields=self.project_fields,
+            include_path=get_paths_matcher(self.paths),
+            lazy=self.lazy_attributes,
         )
+        self.resources_by_path = DiskCacheResourcesByPath(disk_cache)
 
-        # We add the attributes that we collected from the plugins. They come
-        # last for now.
-        for name, plugin_attribute in self.resource_attributes.items():
-            if name not in all_res_attributes:
-                all_res_attributes[name] = plugin_attribute
+        if files_count == 1:
+            # a single root resource
+            self.has_single_resource = True
+            root_path = index.get_metadata("first_path")
 
-        # Create the Resource class with the desired attributes
-        return attr.make_class(
-            name="ScannedResource",
-            attrs=all_res_attributes or dict(),
-            slots=True,
-            bases=(Resource,),
-        )
+        if needs_new_virtual_root:
+            root_data = dict(children_names=disk_cache.get_children_names(root_path, ""))
+            root_is_file = False
+        elif root_path not in index:
+            root_data = dict(children_names=disk_cache.get_children_names(root_path, root_path))
+            root_is_file = False
+        else:
+            root_data = disk_cache.build_data(root_path, root_path, index.load(root_path))
+            # like for a VirtualCodebase, the root is a file only if this is
+            # the only Resource
+            root_is_file = root_data.pop("is_file") and self.has_single_resource
 
-    def _populate(self, scan_data):
-        """
-        Populate this codebase with Resource objects.
+        root = self._create_root_resource(
+            name=file_name(root_path),
+            path=root_path,
+            is_file=root_is_file,
+        )
+        for name, value in root_data.items():
+            if name not in ("name", "path", "location", "cache_location"):
+                setattr(root, name, value)
+        # the root is kept in memory
+        self.resources_by_path[root.path] = root
 
-        The actual subclass of Resource objects used in this codebase will be
-        created as a side effect.
+        if self.has_single_resource:
+            self.resources_count = 1
+        elif self.paths:
+            self.resources_count = disk_cache.count() + (root_path not in index)
+        else:
+            self.resources_count = len(index) + (root_path not in index)
+
+    def _iter_scan_data(self, locations):
+        """
+        Yield (key, value, location) tuples from the JSON scan files at
+        ``locations`` parsed incrementally with ``iter_scan_data``. With
+        multiple locations, the file paths are prefixed with codebase-1/,
+        codebase-2/, etc. incremented for each location.
+        """
+        multiple_inputs = len(locations) > 1
+        project_fields = self.project_fields
+        for idx, location in enumerate(locations, 1):
+            has_files = False
+            for key, value in iter_scan_data(location):
+                if key == "files":
+                    has_files = True
+                    if project_fields:
+                        project_fields(value)
+                    if multiple_inputs:
+                        value["path"] = posixpath_join(f"codebase-{idx}", clean_path(value["path"]))
+                yield key, value, location
+
+            if multiple_inputs and not has_files:
+                raise Exception(
+                    f'Input file is missing a "files" (aka. resources) section to load: {location}'
+                )
 
-        Population is done by loading JSON scan results and creating new
-        Resources for each files mappings.
+    def _populate_codebase_data(self, scan_data):
+        """
+        Populate the headers and codebase-level attributes of this codebase
+        from a ``scan_data`` mapping.
         """
         # Collect headers
         ##########################################################
@@ -1846,54 +4370,33 @@ class VirtualCodebase(Codebase):
                 continue
             setattr(self.attributes, attr_name, value)
 
-        ##########################################################
-        files_data = scan_data.get("files")
-        if not files_data:
-            raise Exception('Input has no "files" top-level scan results.')
-
-        if len(files_data) == 1:
-            # we will shortcut to populate the codebase with a single root resource
-            self.has_single_resource = True
-            root_is_file = files_data[0].get("type") == "file"
-        else:
-            root_is_file = False
-
-        # Create a virtual root if we are merging multiple input scans together
-        location = self.location
-        multiple_inputs = (
-            isinstance(
-                location,
-                (
-                    list,
-                    tuple,
-                ),
-            )
-            and len(location) > 1
-        )
-
-        # Iterate through all Resources to collect any attribute in any resource
-        # as sample data. The paths were cleaned on loading
-        # NOTE: We also:
-        # - add a new "segments" attributes with path split in segments
-        # - populate a set of unique root names to to check if all scanned
-        #   Resources share a common root or need a new virtual root
-
-        root_names = set()
-        root_names_add = root_names.add
-
-        sample_resource_data = {}
-        sample_resource_data_update = sample_resource_data.update
+    def _get_resource_schema(self, scan_data=None):
+        """
+        Return the resource schema mapping of {name: kind} of this codebase
+        either provided or from a ``scan_data`` mapping, filtered with the
+        codebase fields. Return None if there is no such schema.
+        """
+        schema = self.resource_schema
+        if schema is None and scan_data:
+            schema = scan_data.get("resource_schema")
+        if schema is None:
+            return
 
-        for fdata in files_data:
-            sample_resource_data_update(fdata)
-            segments = fdata["path"].split("/")
-            root_names_add(segments[0])
-            fdata["path_segments"] = segments
+        schema = dict(schema)
+        if self.project_fields:
+            self.project_fields(schema)
+        return schema
 
+    def _setup_resource_class(self, sample_resource_data, schema=None):
+        """
+        Build the Resource class of this codebase from a
+        ``sample_resource_data`` mapping of all the Resource attributes found
+        in the scan data, or from an attributes ``schema`` if provided.
+        """
         # Resource sub-class to use. Configured with all known scanned file
         # attributes and plugin attributes if present
         ##########################################################
-        self.resource_class = self._build_resource_class(sample_resource_data)
+        self.resource_class = self._build_resource_class(sample_resource_data, schema=schema)
 
         # do we have file information attributes in this codebase data?
         self.with_info = any(
@@ -1909,34 +4412,49 @@ class VirtualCodebase(Codebase):
             )
         )
 
-        # walk and create resources proper
-        # Create root resource first
-        ##########################################################
+    def _get_root_path(self, root_names):
+        """
+        Return a tuple of (root path, needs new virtual root) given a set of
+        ``root_names`` first path segments of all the scanned Resources.
+        """
         if not root_names:
             raise Exception("Unable to find root for codebase.")
 
+        # Create a virtual root if we are merging multiple input scans together
+        location = self.location
+        multiple_inputs = (
+            isinstance(
+                location,
+                (
+                    list,
+                    tuple,
+                ),
+            )
+            and len(location) > 1
+        )
+
         len_root_names = len(root_names)
         if len_root_names == 1:
-            root_path = root_names.pop()
+            root_path = next(iter(root_names))
             needs_new_virtual_root = False
         elif len_root_names > 1 or multiple_inputs:
             root_path = "virtual_root"
             needs_new_virtual_root = True
 
-        if needs_new_virtual_root:
-            for fdata in files_data:
-                rpath = fdata["path"]
-                fdata["path"] = posixpath_join(root_path, rpath)
-                fdata["path_segments"].insert(0, root_path)
+        return root_path, needs_new_virtual_root
 
-        root_data = self._create_empty_resource_data()
+    def _create_virtual_root(self, root_path, root_is_file, root_data=None):
+        """
+        Create, save and return the root Resource of this codebase with
+        ``root_path``. Use the ``root_data`` file data mapping for a codebase
+        with a single resource.
+        """
+        data = self._create_empty_resource_data()
 
-        if self.has_single_resource:
+        if root_data:
             # single resource with one or more segments
-            rdata = files_data[0]
-            root_path = rdata["path"]
-            rdata = remove_properties_and_basics(rdata)
-            root_data.update(rdata)
+            root_path = root_data["path"]
+            data.update(remove_properties_and_basics(root_data))
 
         # Create root resource
         root = self._create_root_resource(
@@ -1945,7 +4463,7 @@ class VirtualCodebase(Codebase):
             is_file=root_is_file,
         )
 
-        for name, value in root_data.items():
+        for name, value in data.items():
             # skip known properties
             if name not in KNOW_PROPS:
                 setattr(root, name, value)
@@ -1955,45 +4473,47 @@ class VirtualCodebase(Codebase):
 
         # TODO: report error if filtering the root with a paths?
         self.save_resource(root)
+        return root
 
-        if self.has_single_resource:
-            if TRACE:
-                logger_debug("VirtualCodebase.populate: with single resource.")
-            return
-
-        all_paths = None
-        if self.paths:
-            # build a set of all all paths and all their ancestors
-            all_paths = set()
-            for path in self.paths:
-                all_paths.update(get_ancestor_paths(path, include_self=True))
-
-        # Create other Resources from scan info
+    def _create_resources_from_data(self, files_data):
+        """
+        Create Resources from a ``files_data`` iterable of Resource data
+        mappings, already filtered for the codebase ``paths`` if any.
 
-        # Note that we do not know the ordering there.
-        # Therefore we sort in place by path segments
-        files_data.sort(key=itemgetter("path_segments"))
+        Each parent is saved once it has no more children to create, which is
+        when the data of its subtree is contiguous, such as when sorted by path
+        segments.
+        """
+        self.dirty_parents = {}
+        try:
+            self._create_resources_from_files_data(files_data)
+        finally:
+            self._flush_dirty_parents()
+            self.dirty_parents = None
 
-        # We create directories that exist in the scan or create these that
-        # exist only in paths
+    def _create_resources_from_files_data(self, files_data):
+        """
+        Create Resources from a ``files_data`` iterable of Resource data
+        mappings.
+        """
+        resources_by_path = self.resources_by_path
         duplicated_paths = set()
-        last_path = None
+        # paths of the Resources created as parent directories and not yet
+        # found in files_data
+        implicit_paths = {self.root.path}
+        last_parent_path = None
+        dedup_values = self.dedup_values
         for fdata in files_data:
             path = fdata.get("path")
 
-            # skip the ones we did not request
-            if all_paths and path not in all_paths:
-                continue
-
             # these are no longer needed
-            path_segments = fdata.pop("path_segments")
+            fdata.pop("path_segments", None)
+            path_segments = path.split("/")
 
-            if not last_path:
-                last_path = path
-            elif last_path == path:
+            if path in implicit_paths:
+                implicit_paths.discard(path)
+            elif path in resources_by_path:
                 duplicated_paths.add(path)
-            else:
-                last_path = path
 
             name = fdata.get("name", None) or None
             if not name:
@@ -2001,13 +4521,26 @@ class VirtualCodebase(Codebase):
 
             is_file = fdata.get("type", "file") == "file"
 
-            parent = self._get_parent_directory(path_segments=path_segments)
+            parent = self._get_parent_directory(
+                path_segments=path_segments,
+                created_paths=implicit_paths,
+            )
+            if parent.path != last_parent_path:
+                # save the parents that have no more children to create
+                self._flush_dirty_parents(ancestors_of=parent.path)
+                last_parent_path = parent.path
+
             resource = self._get_or_create_resource(
                 name=name,
                 path=path,
                 parent=parent,
                 is_file=is_file,
             )
+            if dedup_values and not resource.cache_location:
+                # the data of the Resources saved to the disk cache are not
+                # kept in memory and are not worth sharing
+                dedup_values(fdata)
+
             # set data
             for name, value in fdata.items():
                 # skip known properties
@@ -2022,10 +4555,11 @@ class VirtualCodebase(Codebase):
                 f"duplicated paths: {list(duplicated_paths)}",
             )
 
-    def _get_parent_directory(self, path_segments):
+    def _get_parent_directory(self, path_segments, created_paths=None):
         """
         Ensure that all directories in a sequence of path_segments exist
-        and return the last one.
+        and return the last one. Add the paths of new directories to the
+        ``created_paths`` set if provided.
         """
         # TODO: handle single resource codebases
         resources_by_path = self.resources_by_path
@@ -2039,6 +4573,8 @@ class VirtualCodebase(Codebase):
             path = posixpath_join(current.path, segment)
             existing = resources_by_path.get(path)
             if not existing or existing == Codebase.CACHED_RESOURCE:
+                if created_paths is not None and path not in resources_by_path:
+                    created_paths.add(path)
                 existing = self._get_or_create_resource(
                     name=segment,
                     # build the path based on parent
@@ -2081,6 +4617,568 @@ class VirtualCodebase(Codebase):
 KNOW_PROPS = set(["type", "base_name", "extension", "path", "name", "path_segments"])
 
 
+def iter_scan_data(location, chunk_size=1024 * 1024):
+    """
+    Yield (key, value) tuples for each item of the top-level JSON object of a
+    scan file at ``location``, parsing this file incrementally. For the "files"
+    key, yield a ("files", file data mapping) tuple for each file of the "files"
+    array such that this whole array is never loaded in memory at once.
+
+    ``location`` can also be a JSON Lines scan file.
+    """
+    if is_jsonl_scan(location):
+        yield from iter_jsonl_scan_data(location)
+        return
+
+    with open(location) as f:
+        reader = JsonStreamReader(f, chunk_size=chunk_size)
+        for key, value, _start, _end in iter_json_scan_items(reader):
+            yield key, value
+
+
+def iter_json_scan_items(reader):
+    """
+    Yield (key, value, start, end) tuples for each item of the top-level JSON
+    object read with a JsonStreamReader ``reader``, where ``start`` and
+    ``end`` are the reader offsets of the value. For the "files" key, yield a
+    tuple for each file data mapping of the "files" array.
+    """
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        key = reader.decode()
+        reader.expect(":")
+        reader.peek()
+        start = reader.tell()
+        if key != "files":
+            value = reader.decode()
+            yield key, value, start, reader.tell()
+
+        elif reader.peek() != "[":
+            for fdata in reader.decode() or []:
+                yield key, fdata, None, None
+
+        else:
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    start = reader.tell()
+                    value = reader.decode()
+                    yield key, value, start, reader.tell()
+                    if reader.expect(",]") == "]":
+                        break
+                    reader.peek()
+
+        if reader.expect(",}") == "}":
+            return
+
+
+def iter_scan_data_with_offsets(location, chunk_size=1024 * 1024):
+    """
+    Yield (key, value, offset, length) tuples from a JSON or JSON Lines scan
+    file at ``location`` as with ``iter_scan_data``, where ``offset`` and
+    ``length`` are the position and size in bytes of the value in this file,
+    or None if unknown.
+    """
+    if is_jsonl_scan(location):
+        with open(location, "rb") as f:
+            header = json.loads(f.readline())
+            for key, value in header.items():
+                yield key, value, None, None
+            offset = f.tell()
+            for line in f:
+                length = len(line)
+                if line.strip():
+                    yield "files", json.loads(line), offset, length
+                offset += length
+        return
+
+    # decoding UTF-8 as latin-1 has one character per byte, such that the
+    # offsets of the reader are the offsets in bytes. The values with non-ASCII
+    # text are decoded again from their UTF-8 bytes.
+    with open(location, encoding="latin-1") as f:
+        reader = JsonStreamReader(f, chunk_size=chunk_size)
+        for key, value, start, end in iter_json_scan_items(reader):
+            if start is None:
+                yield key, value, None, None
+                continue
+            text = reader.get_text(start, end)
+            if not text.isascii():
+                value = json.loads(text.encode("latin-1"))
+            yield key, value, start, end - start
+
+
+def is_jsonl_scan(location, max_header_size=16 * 1024 * 1024):
+    """
+    Return True if the file at ``location`` is a JSON Lines scan file: its first
+    line is a JSON object without "files" (and shorter than
+    ``max_header_size``).
+    """
+    with open(location, "rb") as f:
+        line = f.readline(max_header_size)
+    if not line.endswith(b"\n"):
+        return False
+    try:
+        header = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(header, dict) and "files" not in header
+
+
+def iter_jsonl_scan_data(location):
+    """
+    Yield (key, value) tuples from a JSON Lines scan file at ``location``: first
+    for each item of the header mapping on the first line, then a
+    ("files", file data mapping) tuple for each other line.
+    """
+    with open(location, "rb") as f:
+        header = json.loads(f.readline())
+        start = f.tell()
+
+    yield from header.items()
+    for fdata in iter_jsonl_files(location, start=start):
+        yield "files", fdata
+
+
+def iter_jsonl_files(location, start=0, end=None):
+    """
+    Yield file data mappings from a JSON Lines scan file at ``location`` for
+    each line that starts at or after the ``start`` byte offset and before the
+    ``end`` byte offset (or the end of the file). The header line is always
+    skipped.
+
+    Since a line belongs to the range where it starts, a scan file can be split
+    in consecutive byte ranges, such as with ``get_jsonl_ranges()``, and each
+    range parsed on its own.
+    """
+    with open(location, "rb") as f:
+        if start:
+            # skip to the first line that starts at or after start
+            f.seek(start - 1)
+        f.readline()
+        pos = f.tell()
+        for line in f:
+            if end is not None and pos >= end:
+                break
+            pos += len(line)
+            if line.strip():
+                yield json.loads(line)
+
+
+def get_jsonl_ranges(location, count):
+    """
+    Return a list of up to ``count`` consecutive (start, end) byte ranges that
+    split the file at ``location`` in parts of about the same size.
+    """
+    size = os.path.getsize(location)
+    step = max(size // max(count, 1), 1)
+    starts = list(range(0, size, step))[:count]
+    return [(start, end) for start, end in zip(starts, starts[1:] + [size])]
+
+
+class JsonStreamReader(object):
+    """
+    Read JSON values one at a time from a text file-like object, reading at
+    most a few chunks of ``chunk_size`` characters in memory. A single value
+    can have at most ``max_value_size`` characters.
+    """
+
+    whitespace = re.compile(r"[ \t\n\r]*").match
+
+    def __init__(self, fileobj, chunk_size=1024 * 1024, max_value_size=256 * 1024 * 1024):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.buffer = ""
+        self.pos = 0
+        # number of characters discarded before the start of the buffer
+        self.offset = 0
+        self.eof = False
+        self.raw_decode = json.JSONDecoder().raw_decode
+
+    def tell(self):
+        """
+        Return the offset in characters of the current position.
+        """
+        return self.offset + self.pos
+
+    def get_text(self, start, end):
+        """
+        Return the text between the ``start`` and ``end`` offsets that must still
+        be in the buffer, such as for the last decoded value.
+        """
+        offset = self.offset
+        return self.buffer[start - offset : end - offset]
+
+    def read(self, size):
+        """
+        Read up to ``size`` more characters in the buffer, discarding the
+        characters already consumed. Return False at the end of the file.
+        """
+        if self.eof:
+            return False
+        data = self.fileobj.read(size)
+        if not data:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos :] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Return the next non-whitespace character without consuming it or an
+        empty string at the end of the file.
+        """
+        while True:
+            buffer = self.buffer
+            self.pos = pos = self.whitespace(buffer, self.pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if not self.read(self.chunk_size):
+                return ""
+
+    def expect(self, chars):
+        """
+        Consume and return the next non-whitespace character. Raise a
+        ValueError if this is not one of ``chars``.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(
+                f"Invalid JSON: expected one of {chars!r} but got {char!r} "
+                f"at: {self.buffer[self.pos:self.pos + 40]!r}"
+            )
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """
+        Consume and return the next JSON value. Raise a JSONDecodeError for an
+        invalid value and a ValueError for a value that is too large.
+        """
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # this value may continue in the next chunk(s) only if it is
+                # valid up to the end of the buffer: read larger chunks each
+                # time to avoid decoding a large value too often
+                if not self.is_incomplete(e):
+                    raise
+                if len(self.buffer) - self.pos > self.max_value_size:
+                    raise ValueError(
+                        f"Invalid JSON: value at offset {self.tell()} is larger than "
+                        f"{self.max_value_size} characters"
+                    ) from e
+                if self.read(size):
+                    size = min(size * 2, self.max_value_size)
+                    continue
+                raise
+
+            # a number may also continue in the next chunk
+            if end == len(self.buffer) and self.read(size):
+                continue
+
+            self.pos = end
+            return value
+
+    def is_incomplete(self, error):
+        """
+        Return True if a JSONDecodeError ``error`` is for a value that is
+        valid up to the end of the buffer, such that it may continue in the
+        next chunk.
+        """
+        buffer_end = len(self.buffer)
+        if error.msg.startswith("Unterminated string"):
+            # the position is at the start of the string, which has no end
+            # quote in the buffer
+            return True
+        # the longest incomplete token is a \uXXXX escape
+        return error.pos >= buffer_end - 6
+
+
+def load_scan_data(location):
+    """
+    Return scan data loaded from `location`, which is either a JSON string or
+    a path string to a JSON or JSON Lines scan file.
+    """
+    try:
+        return json.loads(location)
+    except:
+        location = abspath(normpath(expanduser(location)))
+        if is_jsonl_scan(location):
+            scan_data = dict(files=[])
+            files = scan_data["files"]
+            for key, value in iter_jsonl_scan_data(location):
+                if key == "files":
+                    files.append(value)
+                else:
+                    scan_data[key] = value
+            return scan_data
+
+        with open(location) as f:
+            scan_data = json.load(f)
+        return scan_data
+
+
+def load_input_scan_data(location, index, fields=(), exclude_fields=()):
+    """
+    Return a tuple of (headers list, files list) loaded from the scan at
+    `location`, one of multiple input scans combined in a VirtualCodebase. The
+    file paths are prefixed with codebase-`index`/. Only the `fields` and not
+    the `exclude_fields` file attributes are kept if provided.
+
+    Raise an Exception if this scan has no files.
+    """
+    scan_data = load_scan_data(location)
+    headers = scan_data.get("headers") or []
+    files = scan_data.get("files")
+    if not files:
+        raise Exception(
+            f'Input file is missing a "files" (aka. resources) section to load: {location}'
+        )
+
+    project_fields = get_fields_projector(fields, exclude_fields)
+    prefix = f"codebase-{index}"
+    for fdata in files:
+        if project_fields:
+            project_fields(fdata)
+        fdata["path"] = posixpath_join(prefix, clean_path(fdata["path"]))
+    return headers, files
+
+
+def get_fields_projector(fields=(), exclude_fields=()):
+    """
+    Return a function that removes in place the keys of a file data mapping
+    that are not in the ``fields`` list (if provided) or that are in the
+    ``exclude_fields`` list. Return None if there are no keys to remove. The
+    "path" and "type" keys are never removed.
+
+    For example::
+    >>> project = get_fields_projector(fields=['size'], exclude_fields=['size'])
+    >>> data = dict(path='a/b', type='file', size=2, sha1='0', copyrights=[])
+    >>> project(data)
+    >>> data
+    {'path': 'a/b', 'type': 'file'}
+    >>> get_fields_projector() is None
+    True
+    """
+    if not fields and not exclude_fields:
+        return
+
+    required = set(["path", "type"])
+    fields = fields and set(fields) | required
+    exclude_fields = set(exclude_fields or ()) - required
+
+    def project_fields(fdata):
+        for key in list(fdata):
+            if (fields and key not in fields) or key in exclude_fields:
+                del fdata[key]
+
+    return project_fields
+
+
+def get_path_segments(fdata):
+    """
+    Return a list of the path segments of an ``fdata`` file data mapping.
+    """
+    return fdata["path"].split("/")
+
+
+def iter_sorted_files_data(files_data, run_size=10000, temp_dir=temp_dir):
+    """
+    Yield file data mappings from a ``files_data`` iterable sorted by path
+    segments.
+
+    At most ``run_size`` mappings are sorted in memory at once: if there are
+    more, each sorted run is saved in a JSON Lines file under the ``temp_dir``
+    base temporary directory and the runs are merged when iterated. These
+    files are deleted once iterated.
+    """
+    from commoncode.fileutils import get_temp_dir
+
+    run = []
+    run_locations = []
+    runs_dir = None
+    try:
+        for fdata in files_data:
+            run.append(fdata)
+            if len(run) < run_size:
+                continue
+
+            if not runs_dir:
+                runs_dir = get_temp_dir(base_dir=temp_dir, prefix="scancode-sort-")
+            run.sort(key=get_path_segments)
+            run_location = join(runs_dir, f"run-{len(run_locations)}.jsonl")
+            with open(run_location, "w") as output:
+                for fdata in run:
+                    output.write(json.dumps(fdata))
+                    output.write("\n")
+            run_locations.append(run_location)
+            run = []
+
+        run.sort(key=get_path_segments)
+        if not run_locations:
+            yield from run
+            return
+
+        runs = [iter_jsonl_run(location) for location in run_locations]
+        runs.append(run)
+        yield from heapq.merge(*runs, key=get_path_segments)
+
+    finally:
+        if runs_dir:
+            delete(runs_dir)
+
+
+def iter_jsonl_run(location):
+    """
+    Yield mappings from the JSON Lines file at ``location``.
+    """
+    with open(location) as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def get_paths_matcher(paths=()):
+    """
+    Return a function that accepts a POSIX path and returns True if this path
+    is one of the ``paths``, a parent directory of any of the ``paths`` or a
+    path in the subtree of any of the ``paths``. Return None if there are no
+    ``paths``.
+
+    For example::
+    >>> include_path = get_paths_matcher(['root/dir', 'root/other/file.c'])
+    >>> include_path('root') and include_path('root/other')
+    True
+    >>> include_path('root/dir') and include_path('root/dir/sub/file.c')
+    True
+    >>> include_path('root/dirs') or include_path('root/other/file.h')
+    False
+    >>> get_paths_matcher() is None
+    True
+    """
+    if not paths:
+        return
+
+    paths = set(paths)
+    ancestors = set()
+    for path in paths:
+        ancestors.update(get_ancestor_paths(path, include_self=False))
+
+    def include_path(path):
+        if path in ancestors:
+            return True
+        while path:
+            if path in paths:
+                return True
+            path, _, _ = path.rpartition("/")
+        return False
+
+    return include_path
+
+
+# keys of file data mappings with mostly unique values, not worth deduplicating
+UNIQUE_VALUE_KEYS = frozenset(
+    [
+        "path",
+        "name",
+        "base_name",
+        "location",
+        "from_file",
+        "md5",
+        "sha1",
+        "sha256",
+        "sha512",
+        "sha1_git",
+    ]
+)
+
+
+def get_values_deduplicator(
+    freeze_lists=False,
+    max_list_length=8,
+    max_values=100000,
+    unique_value_keys=UNIQUE_VALUE_KEYS,
+):
+    """
+    Return a function that replaces in place the keys and values of a file
+    data mapping with equal keys and values seen before by this function, such
+    that equal strings are stored only once. Nested lists and mappings are
+    deduplicated recursively. The values of the ``unique_value_keys`` keys such
+    as paths and checksums are kept as-is.
+
+    If ``freeze_lists`` is True, lists of up to ``max_list_length`` strings
+    are also replaced by a shared tuple. Other lists are kept as lists since
+    equal values of other types such as 1, 1.0 and True cannot share a tuple.
+
+    At most ``max_values`` strings and ``max_values`` tuples are kept to be
+    shared such that the memory used is bounded: other values are kept as-is.
+
+    For example::
+    >>> dedup = get_values_deduplicator(freeze_lists=True)
+    >>> data1 = dict(path='a', licenses=['mit'], holders=[], language='C')
+    >>> data2 = dict(path='b', licenses=['mit'], holders=[], language='C')
+    >>> dedup(data1)
+    >>> dedup(data2)
+    >>> data2
+    {'path': 'b', 'licenses': ('mit',), 'holders': (), 'language': 'C'}
+    >>> data1['licenses'] is data2['licenses']
+    True
+    """
+    # mappings of {value: shared value}
+    strings = {}
+    tuples = {}
+
+    def get_shared(shared_values, value):
+        shared = shared_values.get(value)
+        if shared is not None:
+            return shared
+        if len(shared_values) < max_values:
+            shared_values[value] = value
+        return value
+
+    def dedup_value(value):
+        if isinstance(value, str):
+            return get_shared(strings, value)
+
+        if isinstance(value, dict):
+            return {
+                get_shared(strings, k): v if k in unique_value_keys else dedup_value(v)
+                for k, v in value.items()
+            }
+
+        if isinstance(value, list):
+            items = [dedup_value(v) for v in value]
+            if (
+                freeze_lists
+                and len(items) <= max_list_length
+                and all(type(item) is str for item in items)
+            ):
+                return get_shared(tuples, tuple(items))
+            return items
+
+        return value
+
+    def dedup_values(fdata):
+        items = list(fdata.items())
+        fdata.clear()
+        for key, value in items:
+            if key not in unique_value_keys:
+                value = dedup_value(value)
+            fdata[get_shared(strings, key)] = value
+
+    return dedup_values
+
+
 def remove_properties_and_basics(resource_data):
     """
     Given a mapping of resource_data attributes to use as "kwargs", return a new
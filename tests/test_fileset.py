@@ -94,3 +94,42 @@ class FilesetTest(commoncode.testcase.FileBasedTesting):
 
         patterns = ("*/.svn/*",)
         assert fileset.get_matches("home/common/tools/elf/.svn/", patterns)
+
+    def test_PathMatcher_get_matches_is_the_same_as_get_matches(self):
+        from commoncode.ignore import default_ignores
+
+        test_paths = [
+            "/home/common/tools/elf/.svn/",
+            "home/common/.git/this",
+            "src/dist/build/mylib.so",
+            "/some/src/this/that",
+            "foo/Thumbs.db",
+            "foo/thumbs/bar.png",
+            "/foo/.~lock.some.odt#",
+            "foo/bar/hs_err_pid1234.log",
+            "foo/bar/baz.c",
+            "/",
+            "",
+        ]
+        test_patterns = [
+            default_ignores,
+            {"*/.svn/*": ".scanignore", "src/*.so": "", "*.SO": "so"},
+            ["src", "*/.git/*", "elf"],
+        ]
+        for patterns in test_patterns:
+            matcher = fileset.PathMatcher(patterns)
+            for path in test_paths:
+                for all_matches in (True, False):
+                    expected = fileset.get_matches(path, patterns, all_matches=all_matches)
+                    result = matcher.get_matches(path, all_matches=all_matches)
+                    assert result == expected, (path, all_matches)
+                    result = fileset.get_matches(path, matcher, all_matches=all_matches)
+                    assert result == expected, (path, all_matches)
+
+    def test_is_included_with_PathMatcher(self):
+        incs = fileset.PathMatcher({"src": ".scanignore"})
+        excs = fileset.PathMatcher({"src/*.so": ".scanignore"})
+        assert fileset.is_included("/some/src/this/that", incs, excs)
+        assert not fileset.is_included("/src/dist/build/mylib.so", incs, excs)
+        assert not fileset.is_included("/some/other/that", incs, None)
+        assert fileset.is_included("/some/other/that", fileset.PathMatcher([]), excs)
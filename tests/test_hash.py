@@ -6,17 +6,27 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+import hashlib
 import os
 
+from commoncode.hash import ChecksumCache
+from commoncode.hash import ContentLengthError
+from commoncode.hash import MultiHasher
 from commoncode.hash import b64sha1
 from commoncode.hash import checksum
+from commoncode.hash import checksums_many
+from commoncode.hash import get_file_hasher
 from commoncode.hash import get_hasher
+from commoncode.hash import get_thread_pool
+from commoncode.hash import iter_chunks
 from commoncode.hash import md5
 from commoncode.hash import multi_checksums
 from commoncode.hash import sha1
 from commoncode.hash import sha1_git
+from commoncode.hash import sha1_git_hasher
 from commoncode.hash import sha256
 from commoncode.hash import sha512
+from commoncode.hash import shutdown_thread_pools
 from commoncode.testcase import FileBasedTesting
 
 
@@ -174,3 +184,221 @@ class TestHash(FileBasedTesting):
             test_file = self.get_test_loc(test_file)
             # test that we match the git hash-object
             assert sha1_git(test_file) == expected_sha1_git
+
+    def test_hashers_update_is_incremental(self):
+        for bitsize in (32, 64, 128, 160, 256, 384, 512):
+            hasher = get_hasher(bitsize)
+            hashed = hasher()
+            hashed.update(b"a")
+            hashed.update(b"")
+            hashed.update(b"aa")
+            assert hashed.hexdigest() == hasher(b"aaa").hexdigest()
+            assert hasher().hexdigest() is None
+
+        hashed = sha1_git_hasher(length=3)
+        hashed.update(b"a")
+        hashed.update(b"aa")
+        assert hashed.hexdigest() == sha1_git_hasher(b"aaa").hexdigest()
+        hashed = sha1_git_hasher()
+        hashed.update(b"a")
+        hashed.update(b"aa")
+        assert hashed.hexdigest() == sha1_git_hasher(b"aaa").hexdigest()
+        assert sha1_git_hasher().hexdigest() is None
+
+        hashed = sha1_git_hasher(length=4)
+        hashed.update(b"aaa")
+        try:
+            hashed.hexdigest()
+            raise Exception("Exception not raised")
+        except ValueError:
+            pass
+
+    def test_checksums_are_computed_in_chunks(self):
+        test_file = self.get_test_loc("hash/sha1-collision/shattered-1.pdf")
+        with open(test_file, "rb") as inp:
+            content = inp.read()
+        expected = dict(
+            md5=hashlib.md5(content).hexdigest(),
+            sha1=hashlib.sha1(content).hexdigest(),
+            sha256=hashlib.sha256(content).hexdigest(),
+            sha512=hashlib.sha512(content).hexdigest(),
+            sha1_git="ba9aaa145ccd24ef760cf31c74d8f7ca1a2e47b0",
+        )
+        chunks = list(iter_chunks(test_file, chunk_size=1000))
+        assert len(chunks) > 100
+        assert b"".join(chunks) == content
+        assert multi_checksums(test_file) == expected
+        for name, value in expected.items():
+            assert checksum(test_file, name) == value
+
+    def test_checksums_of_empty_file_are_none(self):
+        test_file = self.get_temp_file()
+        with open(test_file, "wb"):
+            pass
+        assert sha1(test_file) is None
+        assert sha1_git(test_file) is None
+        assert set(multi_checksums(test_file).values()) == {None}
+
+    def test_multi_checksums_with_threads(self):
+        test_file = self.get_test_loc("hash/sha1-collision/shattered-2.pdf")
+        expected = multi_checksums(test_file)
+        assert multi_checksums(test_file, threads=3) == expected
+        assert multi_checksums(test_file, ("sha1",), threads=3) == dict(sha1=expected["sha1"])
+
+    def test_MultiHasher_updates_all_hashers(self):
+        names = ("md5", "sha1", "sha1_git")
+        for threads in (0, 2):
+            hasher = MultiHasher(names, length=3, threads=threads)
+            hasher.update(b"a")
+            hasher.update(b"aa")
+            expected = {name: get_file_hasher(name, length=3) for name in names}
+            for hashed in expected.values():
+                hashed.update(b"aaa")
+            expected = {name: hashed.hexdigest() for name, hashed in expected.items()}
+            assert hasher.hexdigests() == expected
+
+    def test_checksums_many(self):
+        test_dir = self.get_test_loc("hash")
+        locations = []
+        for top, _dirs, files in sorted(os.walk(test_dir)):
+            locations.extend(os.path.join(top, f) for f in sorted(files))
+        locations.append(test_dir)
+        names = ("md5", "sha1_git")
+        expected = [(loc, multi_checksums(loc, names)) for loc in locations]
+        assert expected[-1] == (test_dir, dict(md5=None, sha1_git=None))
+        for workers in (1, 3):
+            for buffer_size in (1, 64 * 1024 * 1024):
+                results = checksums_many(
+                    iter(locations),
+                    names=names,
+                    workers=workers,
+                    buffer_size=buffer_size,
+                )
+                assert list(results) == expected
+
+    def test_checksums_many_reports_errors_and_continues(self):
+        test_file = self.get_test_loc("hash/dir1/a.txt")
+        for workers in (1, 2):
+            results = checksums_many([test_file, test_file], names=("sha1", "foo"), workers=workers)
+            results = list(results)
+            assert [loc for loc, _ in results] == [test_file, test_file]
+            assert all(isinstance(error, KeyError) for _, error in results)
+
+    def test_shutdown_thread_pools(self):
+        pool = get_thread_pool(3)
+        assert get_thread_pool(3) is pool
+        shutdown_thread_pools()
+        try:
+            pool.submit(len, "")
+            raise Exception("Exception not raised")
+        except RuntimeError:
+            pass
+        new_pool = get_thread_pool(3)
+        assert new_pool is not pool
+        assert new_pool.submit(len, "a").result() == 1
+
+    def test_checksums_many_closed_early(self):
+        test_file = self.get_test_loc("hash/dir1/a.png")
+        results = checksums_many([test_file] * 20, names=("sha1",), workers=2)
+        location, checksums = next(results)
+        assert location == test_file
+        assert checksums == {"sha1": sha1(test_file)}
+        results.close()
+
+    def test_iter_chunks_with_mmap(self):
+        test_file = self.get_test_loc("hash/dir1/a.png")
+        with open(test_file, "rb") as f:
+            expected = f.read()
+        chunks = [bytes(c) for c in iter_chunks(test_file, chunk_size=1000, mmap_threshold=1)]
+        assert b"".join(chunks) == expected
+        assert max(len(c) for c in chunks) == 1000
+
+        chunks = list(iter_chunks(test_file, chunk_size=1000, mmap_threshold=1))
+        assert all(isinstance(c, memoryview) for c in chunks)
+        try:
+            bytes(chunks[0])
+            raise Exception("Exception not raised")
+        except ValueError:
+            # released
+            pass
+
+    def test_iter_chunks_does_not_use_mmap_by_default(self):
+        test_file = self.get_test_loc("hash/dir1/a.png")
+        chunks = list(iter_chunks(test_file, chunk_size=1000))
+        assert all(type(c) is bytes for c in chunks)
+
+    def test_checksums_are_the_same_with_mmap(self):
+        test_file = self.get_test_loc("hash/dir1/a.png")
+        names = ("md5", "sha1", "sha256", "sha512", "sha1_git")
+        expected = multi_checksums(test_file, names, mmap_threshold=0)
+        for threads in (0, 2):
+            results = multi_checksums(test_file, names, threads=threads, mmap_threshold=1)
+            assert results == expected
+        assert checksum(test_file, "sha1_git", mmap_threshold=1) == expected["sha1_git"]
+        assert list(checksums_many([test_file], names, workers=2, mmap_threshold=1)) == [
+            (test_file, expected)
+        ]
+
+    def test_sha1_git_hasher_without_length_with_mmap(self):
+        test_file = self.get_test_loc("hash/dir1/a.png")
+        hashed = sha1_git_hasher()
+        for chunk in iter_chunks(test_file, chunk_size=100, mmap_threshold=1):
+            hashed.update(chunk)
+        assert hashed.hexdigest() == sha1_git(test_file)
+
+    def test_checksums_use_cache_and_do_not_read_cached_files(self):
+        test_file = self.get_temp_file()
+        with open(test_file, "wb") as f:
+            f.write(b"some content")
+        cache_location = self.get_temp_file("sqlite")
+        with ChecksumCache(cache_location) as cache:
+            names = ("md5", "sha1")
+            expected = multi_checksums(test_file, names)
+            assert multi_checksums(test_file, names, cache=cache) == expected
+            key = cache.get_key(test_file)
+            assert cache.get(key, names + ("sha256",)) == expected
+
+            # a cached value is returned without reading the file
+            cache.put(test_file, key, dict(md5="cached"))
+            assert multi_checksums(test_file, names, cache=cache)["md5"] == "cached"
+            assert checksum(test_file, "md5", cache=cache) == "cached"
+            assert list(checksums_many([test_file], ("sha1",), workers=2, cache=cache)) == [
+                (test_file, dict(sha1=expected["sha1"]))
+            ]
+
+        # the pending writes are saved on exit and the cache is persisted
+        assert cache.connection is None
+        with ChecksumCache(cache_location) as cache:
+            assert cache.get(key, ("md5", "sha1")) == dict(md5="cached", sha1=expected["sha1"])
+            assert checksum(test_file, "sha1", base64=True, cache=cache) == b64sha1(test_file)
+
+    def test_checksum_cache_is_invalidated_when_file_changes(self):
+        test_file = self.get_temp_file()
+        with open(test_file, "wb") as f:
+            f.write(b"some content")
+        with ChecksumCache(self.get_temp_file("sqlite")) as cache:
+            before = multi_checksums(test_file, ("sha1",), cache=cache)
+            key = cache.get_key(test_file)
+            with open(test_file, "wb") as f:
+                f.write(b"other content")
+            stat = os.stat(test_file)
+            os.utime(test_file, ns=(stat.st_atime_ns, key[2] + 1000))
+            assert cache.get(cache.get_key(test_file), ("sha1",)) == {}
+
+            after = multi_checksums(test_file, ("sha1",), cache=cache)
+            assert after != before
+            assert after == multi_checksums(test_file, ("sha1",))
+
+            # a key obtained before a change is not cached
+            cache.put(test_file, key, dict(sha1="stale"))
+            assert multi_checksums(test_file, ("sha1",), cache=cache) == after
+
+    def test_sha1_git_hasher_raises_a_clear_error_on_length_mismatch(self):
+        hashed = sha1_git_hasher(length=4)
+        hashed.update(b"abc")
+        try:
+            hashed.hexdigest()
+            raise Exception("Exception not raised")
+        except ContentLengthError as e:
+            assert isinstance(e, ValueError)
+            assert "3 bytes rather than the expected 4 bytes" in str(e)
@@ -6,6 +6,7 @@
 # See https://aboutcode.org for more information about nexB OSS projects.
 #
 
+import io
 import json
 import os
 from os.path import dirname
@@ -14,11 +15,24 @@ from os.path import join
 
 import attr
 
+from commoncode.fileutils import create_dir
 from commoncode.fileutils import parent_directory
 from commoncode.resource import Codebase
+from commoncode.resource import JsonResourceCache
+from commoncode.resource import JsonStreamReader
+from commoncode.resource import LazyResource
+from commoncode.resource import ReadOnlyResource
 from commoncode.resource import Resource
+from commoncode.resource import ScanIndex
 from commoncode.resource import VirtualCodebase
 from commoncode.resource import depth_walk
+from commoncode.resource import get_attrs_class
+from commoncode.resource import get_jsonl_ranges
+from commoncode.resource import get_values_deduplicator
+from commoncode.resource import iter_jsonl_files
+from commoncode.resource import iter_scan_data
+from commoncode.resource import iter_sorted_files_data
+from commoncode.resource import scandir_walk
 from commoncode.testcase import FileBasedTesting
 from commoncode.testcase import check_against_expected_json_file
 
@@ -86,6 +100,87 @@ class TestCodebase(FileBasedTesting):
         ]
         assert [(r.name, r.is_file) for r in results] == expected
 
+    def test_walk_calls_ignored_once_per_resource_and_prunes_subtrees(self):
+        test_codebase = self.get_temp_dir()
+        deep = join(test_codebase, *[f"d{i}" for i in range(50)])
+        create_dir(deep)
+        with open(join(deep, "file"), "w") as o:
+            o.write("f")
+        create_dir(join(test_codebase, "ignored", "sub"))
+        codebase = Codebase(test_codebase)
+
+        seen = []
+
+        def ignored(resource, codebase):
+            seen.append(resource.path)
+            return resource.name == "ignored"
+
+        for topdown in (True, False):
+            seen[:] = []
+            results = [r.name for r in codebase.walk(topdown=topdown, ignored=ignored)]
+            assert len(seen) == len(set(seen))
+            assert "ignored" not in results
+            assert "sub" not in results
+            assert len(results) == 52
+            if topdown:
+                assert results[1:3] == ["d0", "d1"]
+            else:
+                assert results[:2] == ["file", "d49"]
+
+    def test_walk_readonly_yields_shared_resources(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase)
+        results = [(r.name, r.is_file) for r in codebase.walk(topdown=False, readonly=True)]
+        expected = [(r.name, r.is_file) for r in codebase.walk(topdown=False)]
+        assert results == expected
+
+        for resource in codebase.walk(readonly=True):
+            assert isinstance(resource, ReadOnlyResource)
+            assert resource._resource is codebase.resources_by_path[resource.path]
+            assert resource == codebase.get_resource(resource.path, copy=False)
+            assert isinstance(resource, codebase.resource_class)
+            try:
+                resource.is_filtered = True
+                raise Exception("Exception not raised")
+            except attr.exceptions.FrozenInstanceError:
+                pass
+            # a copy is modifiable
+            copied = codebase.get_resource(resource.path)
+            copied.is_filtered = True
+
+        # a kept Resource stays read-only after the walk
+        try:
+            resource.is_filtered = True
+            raise Exception("Exception not raised")
+        except attr.exceptions.FrozenInstanceError:
+            pass
+        assert not codebase.get_resource(resource.path).is_filtered
+
+    def test_get_resource_without_copy(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase)
+        shared = codebase.get_resource("codebase/abc", copy=False)
+        assert shared._resource is codebase.resources_by_path["codebase/abc"]
+        assert shared is not codebase.get_resource("codebase/abc")
+        assert shared == codebase.get_resource("codebase/abc")
+        assert codebase.get_resource("codebase/abc") == shared
+
+        for shared in (
+            shared,
+            codebase.get_resources(["codebase/abc"], copy=False)[0],
+            codebase.root.children(codebase, copy=False)[0],
+        ):
+            try:
+                shared.size = 1
+                raise Exception("Exception not raised")
+            except attr.exceptions.FrozenInstanceError:
+                pass
+            # an attr copy is modifiable
+            copied = attr.evolve(shared)
+            copied.size = 1
+            assert type(copied) is codebase.resource_class
+        assert codebase.get_resource("codebase/abc").size != 1
+
     def test_walk_skip_root_basic(self):
         test_codebase = self.get_test_loc("resource/codebase")
         codebase = Codebase(test_codebase)
@@ -197,6 +292,39 @@ class TestCodebase(FileBasedTesting):
         expected = (5, 0, 0)
         assert results == expected
 
+    def test_update_counts_is_the_same_as_computing_children_counts(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        for skip_filtered in (False, True):
+            codebase = Codebase(test_codebase, with_size=True)
+            expected_codebase = Codebase(test_codebase, with_size=True)
+            for cb in (codebase, expected_codebase):
+                res = cb.get_resource("codebase/dir/that")
+                res.is_filtered = True
+                cb.save_resource(res)
+
+            codebase.update_counts(skip_filtered=skip_filtered)
+            for resource in expected_codebase.walk(topdown=False):
+                resource._compute_children_counts(expected_codebase, skip_filtered)
+
+            results = [(r.path, r.files_count, r.dirs_count, r.size_count) for r in codebase]
+            expected = [
+                (r.path, r.files_count, r.dirs_count, r.size_count) for r in expected_codebase
+            ]
+            assert results == expected
+
+    def test_get_resource_table(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase)
+        table = codebase.get_resource_table()
+        assert len(table) == 8
+        assert table.paths == [r.path for r in codebase.walk()]
+        assert table.parents.tolist() == [-1, 0, 0, 0, 3, 3, 0, 6]
+        assert table.is_files.tolist() == [0, 1, 1, 0, 1, 1, 0, 1]
+        changed = table.compute_counts()
+        assert changed == [0, 3, 6]
+        assert table.files_counts.tolist() == [5, 0, 0, 2, 0, 0, 1, 0]
+        assert table.get_resource(codebase, 3).path == "codebase/dir"
+
     def test_walk_filtered_dirs(self):
         test_codebase = self.get_test_loc("resource/codebase")
         codebase = Codebase(test_codebase)
@@ -339,6 +467,63 @@ class TestCodebase(FileBasedTesting):
         expected = [("resource", False), ("some child", False)]
         assert [(r.name, r.is_file) for r in results] == expected
 
+    def test_children_order_is_cached_and_updated_on_changes(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase)
+        root = codebase.root
+        expected = ["abc", "et131x.h", "dir", "other dir"]
+        assert [r.name for r in root.children(codebase)] == expected
+        assert codebase.children_orders.get("codebase") == expected
+        assert [r.name for r in root.children(codebase)] == expected
+
+        # a file with a child is sorted after the files without children
+        abc = codebase.get_resource("codebase/abc")
+        codebase._get_or_create_resource("child", parent=abc, is_file=True)
+        expected = ["et131x.h", "abc", "dir", "other dir"]
+        assert [r.name for r in root.children(codebase)] == expected
+
+        codebase.remove_resource(codebase.get_resource("codebase/abc/child"))
+        expected = ["abc", "et131x.h", "dir", "other dir"]
+        assert [r.name for r in root.children(codebase)] == expected
+
+        codebase.remove_resource(codebase.get_resource("codebase/dir"))
+        expected = ["abc", "et131x.h", "other dir"]
+        assert [r.name for r in root.children(codebase)] == expected
+        assert [r.name for r in root.children(codebase, names=["other dir", "abc"])] == [
+            "abc",
+            "other dir",
+        ]
+
+        # the order is updated when a Resource with edited children is saved
+        root.children_names.remove("abc")
+        codebase.save_resource(root)
+        assert [r.name for r in root.children(codebase)] == ["et131x.h", "other dir"]
+
+    def test_children_order_is_kept_when_saving_unchanged_resources(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase)
+        root = codebase.root
+        expected = [r.name for r in root.children(codebase)]
+        order = codebase.children_orders.get("codebase")
+        for resource in codebase.walk():
+            resource.size = 10
+            codebase.save_resource(resource)
+        codebase.save_resource(root)
+        assert codebase.children_orders.get("codebase") is order
+        assert [r.name for r in root.children(codebase)] == expected
+
+    def test_children_order_cache_is_bounded_with_disk_cache(self):
+        test_codebase = self.get_test_loc("resource/samples")
+        codebase = Codebase(test_codebase, max_in_memory=-1, lru_cache_size=2)
+        assert codebase.children_orders.max_size == 2
+        walked = [r.path for r in codebase.walk()]
+        assert len(codebase.children_orders) == 2
+        assert [r.path for r in codebase.walk()] == walked
+
+        codebase = Codebase(test_codebase, max_in_memory=-1, lru_cache_size=0)
+        list(codebase.walk())
+        assert not len(codebase.children_orders)
+
     def test_get_resource_for_single_resource_codebase(self):
         test_codebase = self.get_temp_dir("resource")
         codebase = Codebase(test_codebase)
@@ -634,6 +819,48 @@ class TestCodebase(FileBasedTesting):
         ]
         assert [(r.name, r.is_file) for r in results] == expected
 
+    def test_scandir_walk_is_the_same_as_depth_walk(self):
+        test_codebase = self.get_test_loc("resource/deeply_nested")
+        for max_depth in (0, 1, 2, 3):
+            expected = []
+            for top, dirs, files in depth_walk(test_codebase, max_depth):
+                dirs.sort(key=lambda p: (p.lower(), p))
+                files.sort(key=lambda p: (p.lower(), p))
+                expected.append((top, list(dirs), list(files)))
+
+            results = [
+                (top, [d.name for d in dirs], [f.name for f in files])
+                for top, dirs, files in scandir_walk(test_codebase, max_depth)
+            ]
+            assert results == expected
+
+    def test_scandir_walk_skips_special_files_and_ignored_dirs(self):
+        test_dir = self.get_temp_dir()
+        create_dir(join(test_dir, "dir", ".git"))
+        with open(join(test_dir, "dir", "file"), "w") as f:
+            f.write("some")
+        os.symlink(join(test_dir, "dir", "file"), join(test_dir, "dir", "link"))
+
+        results = [
+            (top, [d.name for d in dirs], [f.name for f in files])
+            for top, dirs, files in scandir_walk(test_dir)
+        ]
+        expected = [
+            (test_dir, ["dir"], []),
+            (join(test_dir, "dir"), [], ["file"]),
+        ]
+        assert results == expected
+
+    def test_Codebase_with_size_collects_file_sizes_when_walking(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase, with_size=True)
+        results = [(r.name, r.size) for r in codebase.walk() if r.is_file]
+        expected = [("abc", 0), ("et131x.h", 2228), ("that", 0), ("this", 0), ("file", 0)]
+        assert results == expected
+
+        codebase = Codebase(test_codebase)
+        assert all(r.size == 0 for r in codebase.walk())
+
 
 class TestCodebaseWithPath(FileBasedTesting):
     test_data_dir = join(dirname(__file__), "data")
@@ -663,6 +890,39 @@ class TestCodebaseWithPath(FileBasedTesting):
         )
         check_against_expected_json_file(results, expected_file, regen=False)
 
+    def test_VirtualCodebase_with_paths_loads_subtrees(self):
+        test_codebase = self.get_temp_file("json")
+        copy_test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        with open(copy_test_file) as inp, open(test_codebase, "w") as out:
+            out.write(inp.read())
+
+        paths = [
+            "home/foobar/scancode-toolkit/samples/zlib/dotzlib",
+            "home/foobar/scancode-toolkit/samples/zlib/ada/zlib.ads",
+        ]
+        expected = [
+            "home",
+            "home/foobar",
+            "home/foobar/scancode-toolkit",
+            "home/foobar/scancode-toolkit/samples",
+            "home/foobar/scancode-toolkit/samples/zlib",
+            "home/foobar/scancode-toolkit/samples/zlib/ada",
+            "home/foobar/scancode-toolkit/samples/zlib/ada/zlib.ads",
+            "home/foobar/scancode-toolkit/samples/zlib/dotzlib",
+            "home/foobar/scancode-toolkit/samples/zlib/dotzlib/AssemblyInfo.cs",
+            "home/foobar/scancode-toolkit/samples/zlib/dotzlib/ChecksumImpl.cs",
+            "home/foobar/scancode-toolkit/samples/zlib/dotzlib/LICENSE_1_0.txt",
+            "home/foobar/scancode-toolkit/samples/zlib/dotzlib/readme.txt",
+        ]
+        for options in (dict(), dict(streaming=True), dict(lazy=True)):
+            codebase = VirtualCodebase(location=test_codebase, paths=paths, **options)
+            assert [r.path for r in codebase.walk()] == expected
+            assert codebase.resources_count == len(expected)
+            assert not codebase.get_resource("home/foobar/scancode-toolkit/samples/zlib/zlib.h")
+            if options.get("lazy"):
+                disk_cache = codebase.disk_cache
+                assert disk_cache.count() == len(list(disk_cache.iter_paths()))
+
     def test_VirtualCodebase_codebase_attributes_assignment(self):
         test_codebase = self.get_test_loc("resource/with_path/virtual-codebase.json")
         vc = VirtualCodebase(
@@ -673,6 +933,20 @@ class TestCodebaseWithPath(FileBasedTesting):
         self.assertEqual(vc.attributes.packages, [])
 
 
+class CountingResourceCache(JsonResourceCache):
+    """
+    A JSON disk cache that counts how many times each Resource is dumped.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dumps = {}
+
+    def dump(self, path, data):
+        self.dumps[path] = self.dumps.get(path, 0) + 1
+        return super().dump(path, data)
+
+
 class TestCodebaseCache(FileBasedTesting):
     test_data_dir = join(dirname(__file__), "data")
 
@@ -762,6 +1036,220 @@ class TestCodebaseCache(FileBasedTesting):
             == codebase.resources_count
         )
 
+    def test_codebase_cache_packed_all_on_disk(self):
+        test_codebase = self.get_test_loc("resource/cache2")
+        codebase = Codebase(test_codebase, max_in_memory=-1, cache_format="packed")
+        expected = [r.to_dict() for r in Codebase(test_codebase, max_in_memory=0).walk()]
+        assert [r.to_dict() for r in codebase.walk()] == expected
+
+        for path, res in codebase.resources_by_path.items():
+            if res is Codebase.CACHED_RESOURCE:
+                assert not codebase._exists_in_memory(path)
+                assert codebase._exists_on_disk(path)
+            else:
+                assert res.is_root
+
+        # a few segment files and no file per resource
+        assert sorted(os.listdir(codebase.cache_dir)) == ["segment-000000.pack"]
+
+    def test_codebase_cache_packed_appends_and_compacts_updated_resources(self):
+        test_codebase = self.get_test_loc("resource/cache2")
+        codebase = Codebase(test_codebase, max_in_memory=-1, cache_format="packed")
+        disk_cache = codebase.disk_cache
+        disk_cache.max_segment_size = 100
+        disk_cache.min_compact_size = 0
+        expected = [r.to_dict() for r in codebase.walk()]
+        live_size = disk_cache.live_size
+
+        for i in range(4):
+            for res in codebase.walk(skip_root=True):
+                res.scan_errors = [f"error {i}"]
+                res.save(codebase)
+
+        assert disk_cache.stale_size < disk_cache.live_size
+        assert disk_cache.live_size > live_size
+        # old segments were compacted and deleted
+        assert len(os.listdir(codebase.cache_dir)) < disk_cache.segment_id + 1
+        for exp in expected[1:]:
+            exp["scan_errors"] = ["error 3"]
+        assert [r.to_dict() for r in codebase.walk()] == expected
+
+        codebase.clear()
+        assert not exists(codebase.cache_dir)
+
+    def test_codebase_cache_sqlite_mixed_two_in_memory(self):
+        test_codebase = self.get_test_loc("resource/cache2")
+        codebase = Codebase(test_codebase, max_in_memory=2, cache_format="sqlite")
+        expected = [r.to_dict() for r in Codebase(test_codebase, max_in_memory=0).walk()]
+        assert [r.to_dict() for r in codebase.walk()] == expected
+
+        # only the in-memory paths are kept in memory
+        assert len(codebase.resources_by_path.in_memory) == 2
+        assert (
+            len(list(codebase.walk()))
+            == len(codebase.resources_by_path)
+            == len(list(codebase.resources_by_path))
+            == codebase.resources_count
+        )
+        for path, res in codebase.resources_by_path.items():
+            if res is Codebase.CACHED_RESOURCE:
+                assert codebase._exists_on_disk(path)
+            else:
+                assert codebase._exists_in_memory(path)
+
+        resources_by_path = codebase.resources_by_path
+        assert all(r.path in resources_by_path for r in codebase.walk())
+        assert "cache2/does/not/exist" not in resources_by_path
+
+    def test_codebase_get_resources_loads_in_bulk(self):
+        test_codebase = self.get_test_loc("resource/cache2")
+        for cache_format in ("json", "packed", "sqlite"):
+            codebase = Codebase(test_codebase, max_in_memory=2, cache_format=cache_format)
+            paths = list(codebase.resources_by_path) + ["cache2/does/not/exist"]
+            expected = [codebase.get_resource(path) for path in paths]
+            assert codebase.get_resources(paths) == expected
+            assert expected[-1] is None
+
+    def test_codebase_lru_cache_counts_hits_and_misses(self):
+        test_codebase = self.get_test_loc("resource/cache2")
+        codebase = Codebase(test_codebase, max_in_memory=-1, lru_cache_size=2)
+        lru_cache = codebase.lru_cache
+        path = "cache2/abc"
+        hits = lru_cache.hits
+        first = codebase.get_resource(path)
+        second = codebase.get_resource(path)
+        assert first == second
+        assert first is not second
+        assert lru_cache.hits == hits + 1
+        for res in codebase.walk():
+            pass
+        assert len(lru_cache) == 2
+
+    def test_codebase_lru_cache_is_written_through_on_save(self):
+        test_codebase = self.get_test_loc("resource/cache2")
+        codebase = Codebase(test_codebase, max_in_memory=-1, lru_cache_size=10)
+        resource = codebase.get_resource("cache2/abc")
+        resource.size = 42
+        codebase.save_resource(resource)
+        misses = codebase.lru_cache.misses
+        assert codebase.get_resource("cache2/abc").size == 42
+        assert codebase.lru_cache.misses == misses
+
+    def test_codebase_lru_cache_can_be_disabled(self):
+        test_codebase = self.get_test_loc("resource/cache2")
+        codebase = Codebase(test_codebase, max_in_memory=-1, lru_cache_size=0)
+        assert codebase.lru_cache is None
+        assert codebase.get_resource("cache2/abc").path == "cache2/abc"
+
+    def test_codebase_cache_sqlite_remove_resource(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase, max_in_memory=-1, cache_format="sqlite")
+        resource = codebase.get_resource("codebase/dir")
+        removed = codebase.remove_resource(resource)
+        assert len(removed) == 3
+        assert not codebase.get_resource("codebase/dir/that")
+        assert not codebase._exists_on_disk("codebase/dir/that")
+        results = [r.path for r in codebase.walk()]
+        expected = [
+            "codebase",
+            "codebase/abc",
+            "codebase/et131x.h",
+            "codebase/other dir",
+            "codebase/other dir/file",
+        ]
+        assert results == expected
+
+    def test_codebase_cache_sqlite_persist_and_reopen(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase, max_in_memory=3, cache_format="sqlite")
+        for res in codebase.walk():
+            if res.is_file:
+                res.size = 10
+                res.save(codebase)
+        codebase.compute_counts()
+        expected = codebase.to_list(with_info=True)
+
+        persisted = self.get_temp_file("sqlite")
+        codebase.persist(persisted)
+        codebase.clear()
+
+        reopened = Codebase.reopen(persisted)
+        assert reopened.to_list(with_info=True) == expected
+        assert reopened.location == codebase.location
+        assert reopened.resources_count == codebase.resources_count
+        assert len(reopened.resources_by_path.in_memory) == 1
+
+    def test_codebase_cache_in_memory_persist_and_reopen(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase, max_in_memory=0, cache_format="sqlite")
+        expected = codebase.to_list(with_info=True)
+        persisted = self.get_temp_file("sqlite")
+        codebase.persist(persisted)
+        reopened = Codebase.reopen(persisted)
+        assert reopened.to_list(with_info=True) == expected
+        assert reopened.resources_count == codebase.resources_count
+
+    def test_virtual_codebase_persist_and_reopen(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        for max_in_memory in (0, 3):
+            codebase = VirtualCodebase(
+                test_file,
+                max_in_memory=max_in_memory,
+                cache_format="sqlite",
+            )
+            expected = codebase.to_list(with_info=True)
+            persisted = self.get_temp_file("sqlite")
+            codebase.persist(persisted)
+
+            reopened = VirtualCodebase.reopen(persisted)
+            assert reopened.to_list(with_info=True) == expected
+            assert reopened.with_info
+            assert reopened.resources_count == codebase.resources_count
+            resource = reopened.get_resource("home/foobar/scancode-toolkit/samples/zlib/adler32.c")
+            resource.size = 10
+            reopened.save_resource(resource)
+            reopened.compute_counts()
+
+            reopened = Codebase.reopen(persisted)
+            assert reopened.to_list(with_info=True) == expected
+
+    def test_codebase_cache_json_cannot_persist(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase)
+        try:
+            codebase.persist(self.get_temp_file("sqlite"))
+            raise Exception("Exception not raised")
+        except TypeError:
+            pass
+
+    def test_codebase_populate_saves_each_parent_once(self):
+        test_codebase = self.get_test_loc("resource/codebase")
+        codebase = Codebase(test_codebase, max_in_memory=-1, cache_format=CountingResourceCache)
+        dumps = codebase.disk_cache.dumps
+        assert dumps["codebase/dir"] == 2
+        assert dumps["codebase/other dir"] == 2
+        assert set(dumps.values()) == {1, 2}
+        results = [r.path for r in codebase.walk()]
+        expected = [
+            "codebase",
+            "codebase/abc",
+            "codebase/et131x.h",
+            "codebase/dir",
+            "codebase/dir/that",
+            "codebase/dir/this",
+            "codebase/other dir",
+            "codebase/other dir/file",
+        ]
+        assert results == expected
+
+    def test_codebase_cache_with_unknown_format_fails(self):
+        test_codebase = self.get_test_loc("resource/cache2")
+        try:
+            Codebase(test_codebase, cache_format="foo")
+            raise Exception("Exception not raised")
+        except ValueError:
+            pass
+
 
 class TestVirtualCodebase(FileBasedTesting):
     test_data_dir = join(dirname(__file__), "data")
@@ -1218,6 +1706,19 @@ class TestVirtualCodebaseCache(FileBasedTesting):
         child_2 = virtual_codebase.get_resource(child.path)
         assert child_2 == child
 
+    def test_virtual_codebase_populate_saves_each_parent_once(self):
+        scan_data = self.get_test_loc("resource/virtual_codebase/codebase-for-cache-tests.json")
+        expected = [r.to_dict() for r in VirtualCodebase(location=scan_data).walk()]
+        virtual_codebase = VirtualCodebase(
+            location=scan_data,
+            max_in_memory=-1,
+            cache_format=CountingResourceCache,
+        )
+        dumps = virtual_codebase.disk_cache.dumps
+        # created, updated with data and updated with children
+        assert max(dumps.values()) <= 3
+        assert [r.to_dict() for r in virtual_codebase.walk()] == expected
+
     def test_virtual_codebase_cache_all_in_memory(self):
         scan_data = self.get_test_loc("resource/virtual_codebase/codebase-for-cache-tests.json")
         virtual_codebase = VirtualCodebase(location=scan_data, max_in_memory=0)
@@ -1294,6 +1795,37 @@ class TestVirtualCodebaseCache(FileBasedTesting):
             == virtual_codebase.resources_count
         )
 
+    def test_virtual_codebase_cache_packed_all_on_disk(self):
+        scan_data = self.get_test_loc("resource/virtual_codebase/codebase-for-cache-tests.json")
+        virtual_codebase = VirtualCodebase(
+            location=scan_data,
+            max_in_memory=-1,
+            cache_format="packed",
+        )
+        expected = VirtualCodebase(location=scan_data, max_in_memory=0).to_list(with_info=True)
+        assert virtual_codebase.to_list(with_info=True) == expected
+        assert not any(
+            virtual_codebase._exists_in_memory(path)
+            for path in virtual_codebase.resources_by_path
+            if path != virtual_codebase.root.path
+        )
+
+    def test_virtual_codebase_cache_sqlite_persist_and_reopen(self):
+        scan_data = self.get_test_loc("resource/virtual_codebase/codebase-for-cache-tests.json")
+        virtual_codebase = VirtualCodebase(
+            location=scan_data,
+            max_in_memory=2,
+            cache_format="sqlite",
+        )
+        expected = VirtualCodebase(location=scan_data, max_in_memory=0).to_list(with_info=True)
+        assert virtual_codebase.to_list(with_info=True) == expected
+
+        persisted = self.get_temp_file("sqlite")
+        virtual_codebase.persist(persisted)
+        reopened = VirtualCodebase.reopen(persisted)
+        assert reopened.to_list(with_info=True) == expected
+        assert reopened.with_info
+
 
 class TestVirtualCodebaseCreation(FileBasedTesting):
     test_data_dir = join(dirname(__file__), "data")
@@ -1386,6 +1918,22 @@ class TestVirtualCodebaseCreation(FileBasedTesting):
         )
         check_against_expected_json_file(results, expected_file, regen=False)
 
+    def test_VirtualCodebase_create_from_multiple_scans_in_parallel(self):
+        test_file_1 = self.get_test_loc("resource/virtual_codebase/combine-1.json")
+        test_file_2 = self.get_test_loc("resource/virtual_codebase/combine-2.json")
+        test_file_3 = self.get_test_loc(
+            "resource/virtual_codebase/combine-shared-directory-name-1.json"
+        )
+        vinput = (test_file_1, test_file_2, test_file_3)
+        codebase = VirtualCodebase(vinput, processes=2)
+        expected_codebase = VirtualCodebase(vinput)
+        results = [r.to_dict(with_info=True) for r in codebase.walk()]
+        expected = [r.to_dict(with_info=True) for r in expected_codebase.walk()]
+        assert results == expected
+        results = [h.to_dict() for h in codebase.headers]
+        expected = [h.to_dict() for h in expected_codebase.headers]
+        assert results == expected
+
     def test_VirtualCodebase_create_from_multiple_scans_shared_directory_names(self):
         test_file_1 = self.get_test_loc(
             "resource/virtual_codebase/combine-shared-directory-name-1.json"
@@ -1403,6 +1951,510 @@ class TestVirtualCodebaseCreation(FileBasedTesting):
         )
         check_against_expected_json_file(results, expected_file, regen=False)
 
+    def test_VirtualCodebase_create_from_multiple_scans_streaming(self):
+        test_file_1 = self.get_test_loc("resource/virtual_codebase/combine-1.json")
+        test_file_2 = self.get_test_loc("resource/virtual_codebase/combine-2.json")
+        vinput = (test_file_1, test_file_2)
+        codebase = VirtualCodebase(vinput, streaming=True, max_in_memory=2)
+        results = [r.to_dict(with_info=False) for r in codebase.walk()]
+        expected_file = self.get_test_loc(
+            "resource/virtual_codebase/combine-expected.json",
+            must_exist=False,
+        )
+        check_against_expected_json_file(results, expected_file, regen=False)
+        assert [h.to_dict() for h in codebase.headers] == [
+            h.to_dict() for h in VirtualCodebase(vinput).headers
+        ]
+
+    def test_VirtualCodebase_streaming_is_the_same_as_loading(self):
+        for name in (
+            "full-root-info-one.json",
+            "full-root-info-many.json",
+            "codebase-for-cache-tests.json",
+            "virtual_codebase.json",
+        ):
+            test_file = self.get_test_loc(f"resource/virtual_codebase/{name}")
+            codebase = VirtualCodebase(test_file, streaming=True, max_in_memory=-1)
+            results = [r.to_dict(with_info=True) for r in codebase.walk()]
+            expected = [r.to_dict(with_info=True) for r in VirtualCodebase(test_file).walk()]
+            assert results == expected
+            expected = attr.asdict(VirtualCodebase(test_file).attributes)
+            assert attr.asdict(codebase.attributes) == expected
+
+    def test_VirtualCodebase_write_and_load_jsonl(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        codebase = VirtualCodebase(test_file)
+        expected = [r.to_dict(with_info=True) for r in codebase.walk()]
+        output = self.get_temp_file("jsonl")
+        codebase.write_jsonl(output, with_info=True)
+
+        with open(output) as inp:
+            lines = inp.read().splitlines()
+        assert len(lines) == len(expected) + 1
+        assert "files" not in json.loads(lines[0])
+
+        for streaming in (False, True):
+            loaded = VirtualCodebase(output, streaming=streaming)
+            assert [r.to_dict(with_info=True) for r in loaded.walk()] == expected
+            assert [h.to_dict() for h in loaded.headers] == [h.to_dict() for h in codebase.headers]
+
+    def test_iter_jsonl_files_with_byte_ranges(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        codebase = VirtualCodebase(test_file)
+        output = self.get_temp_file("jsonl")
+        codebase.write_jsonl(output)
+        expected = list(iter_jsonl_files(output))
+        assert len(expected) == len(list(codebase.walk()))
+
+        for count in (1, 2, 3, 7, 100000):
+            ranges = get_jsonl_ranges(output, count)
+            assert len(ranges) <= count
+            results = []
+            for start, end in ranges:
+                results.extend(iter_jsonl_files(output, start=start, end=end))
+            assert results == expected
+
+    def test_VirtualCodebase_with_fields_and_exclude_fields(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        for streaming in (False, True):
+            codebase = VirtualCodebase(test_file, fields=["size", "sha1"], streaming=streaming)
+            attributes = set(attr.fields_dict(codebase.resource_class))
+            assert "sha1" in attributes
+            assert "md5" not in attributes
+            assert "mime_type" not in attributes
+            resource = codebase.get_resource("home/foobar/scancode-toolkit/samples/zlib/adler32.c")
+            assert resource.sha1
+            assert resource.size == 4968
+            assert resource.is_file
+
+            codebase = VirtualCodebase(
+                test_file,
+                exclude_fields=["md5", "mime_type", "size"],
+                streaming=streaming,
+            )
+            attributes = set(attr.fields_dict(codebase.resource_class))
+            assert "sha1" in attributes
+            assert "md5" not in attributes
+            assert "mime_type" not in attributes
+            resource = codebase.get_resource("home/foobar/scancode-toolkit/samples/zlib/adler32.c")
+            assert resource.sha1
+            assert resource.size == 0
+
+    def test_VirtualCodebase_lazy_loads_same_resources(self):
+        test_dir = self.get_temp_dir()
+        for name in (
+            "full-root-info-many.json",
+            "only-path.json",
+            "root-is-not-first-resource.json",
+            "node-16-slim.json",
+            "docker-hello-world.json",
+        ):
+            test_file = join(test_dir, name)
+            copy_test_file = self.get_test_loc(f"resource/virtual_codebase/{name}")
+            with open(copy_test_file) as inp, open(test_file, "w") as out:
+                out.write(inp.read())
+
+            expected_codebase = VirtualCodebase(test_file)
+            expected = [r.to_dict(with_info=True) for r in expected_codebase.walk()]
+            expected_count = expected_codebase.resources_count
+            if expected[0]["path"] == "":
+                # the indexed paths are cleaned: there is no empty root for
+                # the absolute paths of node-16-slim.json
+                expected = expected[1:]
+                expected_count -= 1
+            codebase = VirtualCodebase(test_file, lazy=True)
+            # nothing is written next to the scan file by default
+            assert not exists(ScanIndex.get_index_location(test_file))
+            assert [r.to_dict(with_info=True) for r in codebase.walk()] == expected
+            assert codebase.resources_count == expected_count
+            assert codebase.disk_cache.count() == len(list(codebase.disk_cache.iter_paths()))
+
+        output = join(test_dir, "scan.jsonl")
+        expected_codebase.write_jsonl(output, with_info=True)
+        codebase = VirtualCodebase(output, lazy=True)
+        assert [r.to_dict(with_info=True) for r in codebase.walk()] == expected
+
+    def test_VirtualCodebase_lazy_reuses_an_index_at_index_location(self):
+        test_file = self.get_temp_file("json")
+        copy_test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        with open(copy_test_file) as inp, open(test_file, "w") as out:
+            out.write(inp.read())
+
+        index_location = ScanIndex.get_index_location(test_file)
+        codebase = VirtualCodebase(test_file, lazy=True, index_location=index_location)
+        expected = [r.path for r in codebase.walk()]
+        assert exists(index_location)
+        mtime = os.stat(index_location).st_mtime_ns
+        codebase = VirtualCodebase(test_file, lazy=True, index_location=index_location)
+        assert [r.path for r in codebase.walk()] == expected
+        assert os.stat(index_location).st_mtime_ns == mtime
+
+    def test_ScanIndex_loads_only_requested_resources(self):
+        test_file = self.get_temp_file("json")
+        copy_test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        with open(copy_test_file) as inp, open(test_file, "w") as out:
+            out.write(inp.read())
+
+        index = ScanIndex.build(test_file)
+        path = "home/foobar/scancode-toolkit/samples/zlib/adler32.c"
+        assert path in index
+        assert index.load(path)["size"] == 4968
+        assert index.load("home/foobar") == {"path": "home/foobar", "type": "directory"}
+        assert index.load("does/not/exist") is None
+        zlib = VirtualCodebase(test_file).get_resource("home/foobar/scancode-toolkit/samples/zlib")
+        expected = sorted(zlib.children_names)
+        assert sorted(index.get_children_names(zlib.path)) == expected
+        index.close()
+
+        codebase = VirtualCodebase(test_file, lazy=True)
+        resource = codebase.get_resource(path)
+        assert resource.size == 4968
+        assert resource.is_file
+
+    def test_ScanIndex_open_rebuilds_stale_index(self):
+        test_file = self.get_temp_file("json")
+        scan = {"files": [{"path": "root/a.txt", "type": "file", "size": 1}]}
+        with open(test_file, "w") as out:
+            json.dump(scan, out)
+        index_location = ScanIndex.get_index_location(test_file)
+        index = ScanIndex.open(test_file, index_location)
+        assert sorted(index) == ["root", "root/a.txt"]
+        index.close()
+
+        scan["files"].append({"path": "root/b.txt", "type": "file", "size": 2})
+        with open(test_file, "w") as out:
+            json.dump(scan, out, indent=2)
+        index = ScanIndex.open(test_file, index_location)
+        assert sorted(index) == ["root", "root/a.txt", "root/b.txt"]
+        assert index.load("root/b.txt")["size"] == 2
+        index.close()
+
+    def test_VirtualCodebase_reuses_resource_and_attributes_classes(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        codebase1 = VirtualCodebase(test_file)
+        codebase2 = VirtualCodebase(test_file, streaming=True)
+        assert codebase1.resource_class is codebase2.resource_class
+        assert type(codebase1.attributes) is type(codebase2.attributes)
+
+        codebase3 = VirtualCodebase(test_file, fields=["sha1"])
+        assert codebase1.resource_class is not codebase3.resource_class
+
+    def test_get_attrs_class_reuses_classes_of_fresh_equivalent_attributes(self):
+        def get_class(default=0):
+            attributes = dict(
+                licenses=attr.ib(default=attr.Factory(list)),
+                count=attr.ib(default=default, type=int, metadata=dict(kind="int")),
+            )
+            return get_attrs_class("TestResource", attributes, Resource)
+
+        assert get_class() is get_class()
+        assert get_class() is not get_class(default=1)
+
+        from commoncode import resource
+
+        for default in range(resource.ATTRS_CLASSES_CACHE_SIZE + 10):
+            get_class(default=default)
+        assert len(resource._attrs_classes) == resource.ATTRS_CLASSES_CACHE_SIZE
+
+    def test_VirtualCodebase_with_resource_schema(self):
+        scan_data = {
+            "files": [
+                {"path": "root", "type": "directory"},
+                {"path": "root/a.txt", "type": "file", "sha1": "0"},
+            ]
+        }
+        schema = dict(path="any", type="any", sha1="any", copyrights="list")
+        codebase = VirtualCodebase(location=scan_data, resource_schema=schema)
+        resource = codebase.get_resource("root/a.txt")
+        assert resource.sha1 == "0"
+        assert resource.copyrights == []
+
+        scan_data["resource_schema"] = schema
+        assert VirtualCodebase(location=scan_data).resource_class is codebase.resource_class
+
+    def test_VirtualCodebase_write_jsonl_with_resource_schema(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        codebase = VirtualCodebase(test_file)
+        output = self.get_temp_file("jsonl")
+        codebase.write_jsonl(output, with_info=True)
+        with open(output) as inp:
+            schema = json.loads(inp.readline())["resource_schema"]
+        assert schema["path"] == "any"
+        assert schema["is_binary"] == "bool"
+        assert "resource_schema" not in attr.fields_dict(type(codebase.attributes))
+
+        for streaming in (False, True):
+            loaded = VirtualCodebase(output, streaming=streaming)
+            assert "resource_schema" not in attr.fields_dict(type(loaded.attributes))
+            expected = [r.to_dict(with_info=True) for r in codebase.walk()]
+            assert [r.to_dict(with_info=True) for r in loaded.walk()] == expected
+
+    def test_VirtualCodebase_with_lazy_attributes(self):
+        test_file = self.get_temp_file("json")
+        copy_test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        with open(copy_test_file) as inp, open(test_file, "w") as out:
+            out.write(inp.read())
+
+        expected = [r.to_dict(with_info=True) for r in VirtualCodebase(test_file).walk()]
+        codebase = VirtualCodebase(test_file, lazy=True, lazy_attributes=True)
+        assert issubclass(codebase.resource_class, LazyResource)
+        assert [r.to_dict(with_info=True) for r in codebase.walk()] == expected
+        assert [r.to_dict(with_info=True) for r in codebase.walk(readonly=True)] == expected
+
+        # ignored if not lazy
+        codebase = VirtualCodebase(test_file, lazy_attributes=True)
+        assert not issubclass(codebase.resource_class, LazyResource)
+        assert [r.to_dict(with_info=True) for r in codebase.walk()] == expected
+
+    def test_VirtualCodebase_lazy_attributes_are_decoded_when_used(self):
+        scan_data = {
+            "files": [
+                {"path": "root", "type": "directory"},
+                {"path": "root/a.txt", "type": "file", "size": 3, "sha1": "0", "copyrights": []},
+                {"path": "root/b.txt", "type": "file", "copyrights": [{"copyright": "c"}]},
+            ]
+        }
+        test_file = self.get_temp_file("json")
+        with open(test_file, "w") as out:
+            json.dump(scan_data, out)
+
+        codebase = VirtualCodebase(test_file, lazy=True, lazy_attributes=True)
+        resource = codebase.get_resource("root/a.txt", copy=False)
+        assert resource.size == 3
+        raw_data = resource.get_raw_data()
+        assert json.loads(raw_data) == scan_data["files"][1]
+        assert resource.get_set_attributes() == {}
+
+        # a copy shares the raw data not yet decoded
+        copied = codebase.get_resource("root/a.txt")
+        assert copied.get_raw_data() is raw_data
+        assert copied.sha1 == "0"
+        assert copied.get_raw_data() is None
+        assert copied.get_set_attributes()["copyrights"] == []
+        assert resource.get_raw_data() is raw_data
+
+        resource = codebase.get_resource("root/b.txt")
+        assert resource.sha1 is None
+        resource.sha1 = "2"
+        codebase.save_resource(resource)
+        resource = codebase.get_resource("root/b.txt")
+        assert resource.sha1 == "2"
+        assert resource.copyrights == [{"copyright": "c"}]
+
+    def test_ScanIndex_load_raw_returns_basics_and_raw_data(self):
+        scan_data = {
+            "files": [
+                {"path": "root/a.txt", "type": "file", "size": 3, "sha1": "0"},
+            ]
+        }
+        test_file = self.get_temp_file("json")
+        with open(test_file, "w") as out:
+            json.dump(scan_data, out)
+
+        index = ScanIndex.build(test_file)
+        try:
+            basics, raw_data = index.load_raw("root/a.txt")
+            assert basics == {"type": "file", "size": 3}
+            assert json.loads(raw_data) == scan_data["files"][0]
+            assert index.load_raw("root") == ({"type": "directory"}, None)
+            assert index.load_raw("root/b.txt") is None
+        finally:
+            index.close()
+
+    def test_VirtualCodebase_lazy_fails_on_duplicated_paths(self):
+        scan_data = {
+            "files": [
+                {"path": "root", "type": "directory"},
+                {"path": "root/a.txt", "type": "file"},
+                {"path": "root/b.txt", "type": "file"},
+                {"path": "root/a.txt", "type": "file"},
+            ]
+        }
+        test_file = self.get_temp_file("json")
+        with open(test_file, "w") as out:
+            json.dump(scan_data, out)
+
+        for batch_size in (1, 10000):
+            index_location = self.get_temp_file("index")
+            try:
+                ScanIndex.build(test_file, location=index_location, batch_size=batch_size)
+                raise Exception("Exception not raised")
+            except Exception as e:
+                assert "duplicated paths: ['root/a.txt']" in str(e)
+            assert not exists(index_location)
+
+        try:
+            VirtualCodebase(test_file, lazy=True)
+            raise Exception("Exception not raised")
+        except Exception as e:
+            assert "duplicated paths: ['root/a.txt']" in str(e)
+
+    def test_ScanIndex_root_names_are_cleaned(self):
+        scan_data = {
+            "files": [
+                {"path": "/root/a.txt/", "type": "file"},
+                {"path": "root", "type": "directory"},
+            ]
+        }
+        test_file = self.get_temp_file("json")
+        with open(test_file, "w") as out:
+            json.dump(scan_data, out)
+
+        index = ScanIndex.build(test_file)
+        try:
+            assert index.get_metadata("root_names") == ["root"]
+            assert sorted(index) == ["root", "root/a.txt"]
+        finally:
+            index.close()
+
+    def test_VirtualCodebase_with_dedup_values(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        expected = [r.to_dict(with_info=True) for r in VirtualCodebase(test_file).walk()]
+        expected = json.dumps(expected)
+        for streaming in (False, True):
+            for freeze_lists in (False, True):
+                codebase = VirtualCodebase(
+                    test_file,
+                    streaming=streaming,
+                    dedup_values=True,
+                    freeze_lists=freeze_lists,
+                )
+                results = [r.to_dict(with_info=True) for r in codebase.walk()]
+                assert json.dumps(results) == expected
+
+                resources = [r for r in codebase.walk() if r.mime_type == "text/x-c"]
+                assert len(resources) > 1
+                assert resources[0].mime_type is resources[1].mime_type
+                if freeze_lists:
+                    assert resources[0].scan_errors == ()
+                    assert resources[0].scan_errors is resources[1].scan_errors
+
+    def test_get_values_deduplicator_skips_unique_values_and_is_bounded(self):
+        def get_data():
+            # build new equal strings that are not interned
+            return dict(
+                path="".join(["root/", "a.c"]),
+                sha1="".join(["0" * 20, "1" * 20]),
+                mime_type="".join(["text/", "x-c"]),
+                holders=["".join(["Some ", "Holder"])],
+            )
+
+        dedup = get_values_deduplicator()
+        data1 = get_data()
+        data2 = get_data()
+        dedup(data1)
+        dedup(data2)
+        assert data1 == data2
+        assert data1["mime_type"] is data2["mime_type"]
+        assert data1["holders"][0] is data2["holders"][0]
+        assert data1["path"] is not data2["path"]
+        assert data1["sha1"] is not data2["sha1"]
+
+        dedup = get_values_deduplicator(max_values=3)
+        data1 = get_data()
+        data2 = get_data()
+        dedup(data1)
+        dedup(data2)
+        assert data1 == data2
+        # only the first 3 strings are shared: two keys and the mime type
+        assert data1["mime_type"] is data2["mime_type"]
+        assert data1["holders"][0] is not data2["holders"][0]
+
+    def test_get_values_deduplicator_does_not_share_tuples_of_equal_values_of_other_types(self):
+        dedup = get_values_deduplicator(freeze_lists=True)
+        data1 = dict(flags=[1, 0], sizes=[1], names=["a"])
+        data2 = dict(flags=[True, False], sizes=[1.0], names=["a"])
+        dedup(data1)
+        dedup(data2)
+        assert data2["flags"] == [True, False]
+        assert [type(v) for v in data2["flags"]] == [bool, bool]
+        assert data2["sizes"] == [1.0]
+        assert type(data2["sizes"][0]) is float
+        assert data1["names"] == ("a",)
+        assert data1["names"] is data2["names"]
+
+    def test_VirtualCodebase_with_dedup_values_skips_disk_cached_resources(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        codebase = VirtualCodebase(test_file, dedup_values=True, max_in_memory=-1)
+        resources = [r for r in codebase.walk() if r.mime_type == "text/x-c"]
+        assert len(resources) > 1
+        assert resources[0].mime_type is not resources[1].mime_type
+
+    def test_iter_sorted_files_data_merges_sorted_runs(self):
+        paths = ["a/b/c", "a", "a/b", "a/c", "a/b/a", "a/b-c", "a/a", "a/b/c/d"]
+        base_dir = self.get_temp_dir()
+        for run_size in (1, 2, 3, 100):
+            files_data = [dict(path=path, size=len(path)) for path in paths]
+            results = list(iter_sorted_files_data(files_data, run_size=run_size, temp_dir=base_dir))
+            assert [f["path"] for f in results] == sorted(paths, key=lambda p: p.split("/"))
+            assert all(f["size"] == len(f["path"]) for f in results)
+            assert not os.listdir(base_dir)
+
+    def test_VirtualCodebase_streaming_with_sort_run_size(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        with open(test_file) as inp:
+            scan_data = json.load(inp)
+        # reverse the files such that the parents come last
+        scan_data["files"].reverse()
+        reversed_file = self.get_temp_file("json")
+        with open(reversed_file, "w") as out:
+            json.dump(scan_data, out)
+
+        expected = [r.to_dict(with_info=True) for r in VirtualCodebase(test_file).walk()]
+        codebase = VirtualCodebase(
+            reversed_file,
+            streaming=True,
+            sort_run_size=5,
+            max_in_memory=-1,
+            temp_dir=self.get_temp_dir(),
+        )
+        assert [r.to_dict(with_info=True) for r in codebase.walk()] == expected
+
+    def test_iter_scan_data_with_small_chunks(self):
+        test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-many.json")
+        with open(test_file) as inp:
+            scan_data = json.load(inp)
+
+        results = {}
+        files = []
+        for key, value in iter_scan_data(test_file, chunk_size=7):
+            if key == "files":
+                files.append(value)
+            else:
+                results[key] = value
+        results["files"] = files
+        assert results == scan_data
+
+    def test_JsonStreamReader_decodes_values_split_across_chunks(self):
+        values = [
+            {"path": "a", "text": 'some \u00e9 " quoted \\ text', "size": 123456789},
+            [True, False, None, -1.5e10],
+        ]
+        text = " ".join(json.dumps(v) for v in values)
+        for chunk_size in (1, 2, 3, 7):
+            reader = JsonStreamReader(io.StringIO(text), chunk_size=chunk_size)
+            assert [reader.decode(), reader.decode()] == values
+
+    def test_JsonStreamReader_fails_early_on_an_invalid_value(self):
+        text = '{"path": "a" "size": 1} ' + json.dumps({"path": "b"}) * 10000
+        fileobj = io.StringIO(text)
+        reader = JsonStreamReader(fileobj, chunk_size=16)
+        try:
+            reader.decode()
+            raise Exception("Exception not raised")
+        except json.JSONDecodeError:
+            pass
+        assert fileobj.tell() < 100
+
+    def test_JsonStreamReader_fails_on_a_value_too_large(self):
+        text = json.dumps(["a" * 10] * 100)
+        reader = JsonStreamReader(io.StringIO(text), chunk_size=16, max_value_size=100)
+        try:
+            reader.decode()
+            raise Exception("Exception not raised")
+        except ValueError as e:
+            assert "larger than 100 characters" in str(e)
+
     def test_VirtualCodebase_compute_counts_with_full_root_info_one(self):
         test_file = self.get_test_loc("resource/virtual_codebase/full-root-info-one.json")
         codebase = VirtualCodebase(test_file)